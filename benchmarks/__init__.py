@@ -0,0 +1,8 @@
+"""
+性能压测包 - 使用假 LLM 与假嵌入模型的可重复压测，输出 JSON 报告
+
+各压测以模块方式运行，例如 python -m benchmarks.session_bench
+"""
+from .fakes import FakeLLMClient, FakeEmbeddingModel
+
+__all__ = ['FakeLLMClient', 'FakeEmbeddingModel']
\ No newline at end of file
@@ -0,0 +1,110 @@
+"""
+压测公共工具 - 隔离的配置、分位数汇总、内存占用与 JSON 报告输出
+"""
+import os
+import sys
+import json
+import types
+import platform
+import contextlib
+import config
+from observability.metrics import Histogram
+
+
+def bench_config(data_dir, **overrides):
+    """
+    复制全局配置用于压测，数据文件放到 data_dir，不读写正式数据
+
+    Args:
+        data_dir (str): 压测数据目录
+        **overrides: 覆盖的配置项
+
+    Returns:
+        types.SimpleNamespace: 配置对象
+    """
+    values = {name: getattr(config, name) for name in dir(config) if name.isupper()}
+    values.update(
+        DATA_DIR=data_dir,
+        VECTORS_FILE=os.path.join(data_dir, "vectors.npy"),
+        TEXTS_FILE=os.path.join(data_dir, "texts.pkl"),
+        INDEX_FILE=os.path.join(data_dir, "index.faiss"),
+        HISTORY_JOURNAL_ENABLED=False,
+        HISTORY_JOURNAL_FILE=os.path.join(data_dir, "history.jsonl"),
+        EMBEDDING_SERVICE_ADDRESSES=None,
+        LLM_METRICS_JSONL_FILE=None,
+    )
+    values.update(overrides)
+    return types.SimpleNamespace(**values)
+
+
+def latency_summary(samples):
+    """
+    汇总一组耗时样本（秒）
+
+    Returns:
+        dict: count、avg、p50、p95、p99、max，没有样本时数值为 None
+    """
+    histogram = Histogram(window=max(1, len(samples)))
+    for value in samples:
+        histogram.observe(value)
+    return histogram.summary()
+
+
+def memory_usage():
+    """
+    当前进程的内存占用
+
+    Returns:
+        dict: rss_mb（当前常驻内存）与 max_rss_mb（峰值），平台不支持时为 None
+    """
+    usage = {"rss_mb": None, "max_rss_mb": None}
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        usage["rss_mb"] = pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 以 KB 为单位，macOS 以字节为单位
+        usage["max_rss_mb"] = max_rss / 1024 / 1024 if sys.platform == "darwin" else max_rss / 1024
+    except ImportError:
+        pass
+    return usage
+
+
+def environment():
+    """运行环境信息，便于判断两份报告是否可比"""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+@contextlib.contextmanager
+def quiet(enabled=True):
+    """压测过程中屏蔽会话的进度输出"""
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def write_report(report, output=None):
+    """
+    输出 JSON 报告
+
+    Args:
+        report (dict): 报告内容
+        output (str, optional): 输出文件路径，None 表示打印到标准输出
+    """
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"📊 报告已写入 {output}", file=sys.stderr)
+    else:
+        print(text)
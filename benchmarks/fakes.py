@@ -0,0 +1,116 @@
+"""
+压测用的替身 - 延迟可配置的假 LLM 客户端与确定性的假嵌入模型
+
+两者都不访问网络也不加载模型，结果只由输入文本与随机种子决定，同样的参数
+多次运行得到同样的调用序列，便于比较改动前后的性能。
+"""
+import time
+import random
+import hashlib
+import threading
+import numpy as np
+
+
+def _stable_hash(text, seed=0):
+    """与进程无关的稳定哈希（内置 hash() 对字符串加了随机盐）"""
+    digest = hashlib.blake2b(f"{seed}:{text}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class FakeLLMClient:
+    """
+    GrokClient 的替身，实现会话与记忆线程用到的 ask / ask_json
+
+    每次调用按 latency ± jitter 休眠后返回：记忆判断按消息哈希以 remember_ratio
+    的比例回答“是”，记忆提取返回一条由原文构成的记忆，其余调用返回固定格式的回复。
+    调用次数按 call_site 统计。
+    """
+
+    def __init__(self, latency=0.05, jitter=0.0, remember_ratio=0.5, seed=0):
+        """
+        Args:
+            latency (float): 每次调用的平均延迟（秒）
+            jitter (float): 延迟的均匀抖动幅度（秒）
+            remember_ratio (float): 记忆判断回答“是”的比例
+            seed (int): 随机数种子
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.remember_ratio = remember_ratio
+        self.seed = seed
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = {}
+
+    def _wait(self, call_site):
+        with self._lock:
+            self.calls[call_site] = self.calls.get(call_site, 0) + 1
+            delay = self.latency + (self._rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def total_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+    def ask(self, prompt, model=None, system_message=None, history_messages=None, stream=False,
+            use_cache=False, call_site="chat", **kwargs):
+        """按配置的延迟返回回复，stream=True 时返回逐字的迭代器"""
+        self._wait(call_site)
+        if call_site == "judge":
+            remember = _stable_hash(prompt, self.seed) % 1000 < self.remember_ratio * 1000
+            return "是" if remember else "否"
+        reply = f"收到：{prompt[-30:]}"
+        return iter(reply) if stream else reply
+
+    def ask_json(self, prompt, system_message=None, response_model=None, use_cache=False,
+                 call_site="extract", **kwargs):
+        """记忆提取：把原文作为一条记忆返回"""
+        self._wait(call_site)
+        return response_model.model_validate({
+            "memories": [{
+                "content": prompt,
+                "category": "个人信息",
+                "confidence": 0.9,
+                "source": "",
+                "timestamp": "",
+            }]
+        })
+
+
+class FakeEmbeddingModel:
+    """
+    SentenceTransformer 的替身：每个文本由其哈希确定一个随机向量
+
+    相同文本得到相同向量，不同文本的向量近似正交。
+    """
+
+    def __init__(self, dimension=384, seed=0):
+        """
+        Args:
+            dimension (int): 向量维度
+            seed (int): 随机数种子
+        """
+        self.dimension = dimension
+        self.seed = seed
+        self.calls = 0
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, texts, normalize_embeddings=False, **kwargs):
+        """
+        编码文本
+
+        Returns:
+            numpy.ndarray: float32 向量矩阵，单个字符串输入时为一维向量
+        """
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        self.calls += 1
+        vectors = np.empty((len(texts), self.dimension), dtype="float32")
+        for i, text in enumerate(texts):
+            vectors[i] = np.random.default_rng(_stable_hash(text, self.seed)).standard_normal(self.dimension)
+        if normalize_embeddings and len(texts):
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors[0] if single else vectors
@@ -0,0 +1,203 @@
+"""
+导入耗时压测 - 在全新的解释器中导入各入口模块，测量耗时并检查是否提前加载了重量级依赖
+
+对每个模块:
+    - 多次在子进程中导入，取墙钟耗时的中位数与最大值
+    - 用 python -X importtime 统计一次，按顶层包汇总自身耗时，列出最慢的依赖
+    - 检查 faiss、sentence_transformers、torch、openai、requests 是否在导入时被加载
+
+超出预算（毫秒）或导入时加载了重量级依赖的模块记为不通过，命令以退出码 1 结束，
+可放在 CI 中防止启动变慢。
+
+用法:
+    python -m benchmarks.import_bench
+    python -m benchmarks.import_bench --module core.session --budget core.session=500 --output imports.json
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from .common import environment, write_report
+
+# 这些依赖只应在首次使用时导入（建索引、加载模型、创建 LLM 客户端）
+HEAVY_MODULES = ("faiss", "sentence_transformers", "torch", "openai", "requests")
+
+DEFAULT_MODULES = ["core.session", "core.async_session", "server.app", "functions.weather", "vector.embedder",
+                   "model.llm_client", "main"]
+
+# 墙钟耗时预算（毫秒，包含子模块但不含解释器启动），留有余量以适应较慢的机器
+DEFAULT_BUDGETS = {
+    "core.session": 800,
+    "core.async_session": 800,
+    "server.app": 300,
+    "functions.weather": 500,
+    "main": 1000,
+}
+
+_PROBE = """
+import sys, json, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "heavy": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _run_probe(module, importtime=False):
+    """在子进程中导入模块，返回 (探针输出, importtime 报告)"""
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)]
+    result = subprocess.run(command, cwd=_ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "导入失败")
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def parse_importtime(report):
+    """
+    解析 -X importtime 的输出
+
+    Args:
+        report (str): 标准错误输出
+
+    Returns:
+        list: 每项为 (模块名, 自身耗时微秒, 累计耗时微秒, 嵌套深度)
+    """
+    rows = []
+    for line in report.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(parts[0]), int(parts[1]), depth))
+    return rows
+
+
+def slowest_packages(rows, module, top=10):
+    """
+    按顶层包汇总导入 module 期间的自身耗时
+
+    Returns:
+        list: [{"package", "ms"}]，按耗时降序
+    """
+    # importtime 按导入完成的顺序输出，目标模块的最后一行之前（自上一个顶层模块之后）才属于它
+    end = max((i for i, row in enumerate(rows) if row[0] == module and row[3] == 0), default=len(rows) - 1)
+    start = end
+    while start > 0 and rows[start - 1][3] > 0:
+        start -= 1
+    totals = {}
+    for name, self_us, _, _ in rows[start:end + 1]:
+        package = name.split(".", 1)[0]
+        totals[package] = totals.get(package, 0) + self_us
+    ranked = sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [{"package": package, "ms": us / 1000} for package, us in ranked]
+
+
+def bench_module(module, repeat=5, top=10, budget_ms=None):
+    """
+    测量一个模块的导入耗时
+
+    Args:
+        module (str): 模块名
+        repeat (int): 测量墙钟耗时的次数
+        top (int): 列出的最慢顶层包数
+        budget_ms (float, optional): 耗时预算（毫秒）
+
+    Returns:
+        dict: 测量结果，passed 表示是否在预算内且未提前加载重量级依赖
+    """
+    samples = []
+    heavy = []
+    for _ in range(repeat):
+        probe, _ = _run_probe(module)
+        samples.append(probe["seconds"] * 1000)
+        heavy = probe["heavy"]
+    _, report = _run_probe(module, importtime=True)
+    rows = parse_importtime(report)
+
+    median = statistics.median(samples)
+    over_budget = budget_ms is not None and median > budget_ms
+    return {
+        "module": module,
+        "median_ms": median,
+        "max_ms": max(samples),
+        "budget_ms": budget_ms,
+        "heavy_loaded": heavy,
+        "passed": not over_budget and not heavy,
+        "modules_imported": len(rows),
+        "slowest_packages": slowest_packages(rows, module, top),
+    }
+
+
+def run_benchmark(modules=DEFAULT_MODULES, budgets=None, repeat=5, top=10):
+    """
+    运行导入耗时压测
+
+    Args:
+        modules (list): 模块名列表
+        budgets (dict, optional): {模块名: 预算毫秒}，默认使用 DEFAULT_BUDGETS
+        repeat (int): 每个模块测量墙钟耗时的次数
+        top (int): 每个模块列出的最慢顶层包数
+
+    Returns:
+        dict: 压测报告
+    """
+    budgets = DEFAULT_BUDGETS if budgets is None else budgets
+    results = []
+    for module in modules:
+        print(f"📦 {module}", file=sys.stderr)
+        try:
+            results.append(bench_module(module, repeat, top, budgets.get(module)))
+        except Exception as e:
+            print(f"❗ 导入 {module} 失败: {e}", file=sys.stderr)
+            results.append({"module": module, "error": str(e), "passed": False})
+    return {
+        "benchmark": "imports",
+        "params": {"modules": list(modules), "budgets": budgets, "repeat": repeat, "heavy_modules": HEAVY_MODULES},
+        "environment": environment(),
+        "results": results,
+        "passed": all(item["passed"] for item in results),
+    }
+
+
+def _budget(text):
+    module, _, value = text.partition("=")
+    return module.strip(), float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导入耗时压测（每次导入在全新的解释器中进行）")
+    parser.add_argument("--module", action="append", dest="modules", help="要测量的模块，可重复指定，默认为各入口模块")
+    parser.add_argument("--budget", action="append", type=_budget, default=[],
+                        help="耗时预算 \"模块=毫秒\"，可重复指定，覆盖默认预算")
+    parser.add_argument("--repeat", type=int, default=5, help="每个模块测量墙钟耗时的次数")
+    parser.add_argument("--top", type=int, default=10, help="每个模块列出的最慢顶层包数")
+    parser.add_argument("--output", help="报告输出文件，默认打印到标准输出")
+    args = parser.parse_args()
+
+    budgets = dict(DEFAULT_BUDGETS, **dict(args.budget))
+    report = run_benchmark(args.modules or DEFAULT_MODULES, budgets, args.repeat, args.top)
+    write_report(report, args.output)
+    for item in report["results"]:
+        if item.get("error"):
+            continue
+        if item["heavy_loaded"]:
+            print(f"❌ {item['module']} 导入时加载了 {', '.join(item['heavy_loaded'])}", file=sys.stderr)
+        elif not item["passed"]:
+            print(f"❌ {item['module']} 导入耗时 {item['median_ms']:.0f}ms，超出预算 {item['budget_ms']:.0f}ms",
+                  file=sys.stderr)
+    if not report["passed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
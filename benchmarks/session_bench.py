@@ -0,0 +1,218 @@
+"""
+会话端到端压测 - 驱动 Session.process_message 与后台记忆线程
+
+使用延迟可配置的假 LLM 与确定性的假嵌入模型，不访问网络也不加载模型，测量:
+    - 每轮对话延迟的 p50/p95/p99 及各准备阶段耗时
+    - 对话结束后后台记忆队列的积压与清空耗时
+    - 每轮的 LLM 调用次数（按调用点）
+    - 进程内存占用
+
+用法:
+    python -m benchmarks.session_bench --turns 200 --llm-latency 0.05 --output baseline.json
+"""
+import time
+import random
+import argparse
+import tempfile
+from core.session import Session
+from vector.embedder import MemoryEmbedder
+from vector.retriever import MemoryRetriever
+from observability.metrics import get_registry
+from .common import bench_config, latency_summary, memory_usage, environment, quiet, write_report
+from .fakes import FakeLLMClient, FakeEmbeddingModel
+
+_NAMES = ["小王", "李雷", "韩梅梅", "张三", "Alice", "Bob"]
+_CITIES = ["北京", "上海", "广州", "深圳", "杭州", "成都"]
+_THINGS = ["火锅", "咖啡", "爬山", "围棋", "科幻小说", "摄影"]
+_TEMPLATES = [
+    "我叫{name}，住在{city}",
+    "我最近迷上了{thing}",
+    "下周我要去{city}出差",
+    "{city}有什么好吃的？",
+    "帮我回忆一下我喜欢什么",
+    "给我推荐一些和{thing}有关的活动",
+    "我的朋友{name}也喜欢{thing}",
+    "今天心情不错，随便聊聊吧",
+]
+
+STAGES = ("history", "retrieval", "tools", "llm", "total")
+
+
+def make_messages(turns, seed=0):
+    """
+    生成确定性的用户消息序列
+
+    Args:
+        turns (int): 消息数
+        seed (int): 随机数种子
+
+    Returns:
+        list: 用户消息列表
+    """
+    rng = random.Random(seed)
+    return [
+        rng.choice(_TEMPLATES).format(name=rng.choice(_NAMES), city=rng.choice(_CITIES), thing=rng.choice(_THINGS))
+        + f"（第{i + 1}轮）"
+        for i in range(turns)
+    ]
+
+
+def build_session(cfg, llm_client, model, preload=0, seed=0):
+    """
+    创建使用假嵌入模型的会话
+
+    Args:
+        cfg: 压测配置，见 bench_config
+        llm_client: LLM 客户端（通常为 FakeLLMClient）
+        model: 嵌入模型（通常为 FakeEmbeddingModel）
+        preload (int): 预先写入向量库的记忆条数
+        seed (int): 生成预置记忆的随机数种子
+
+    Returns:
+        Session: 未启动的会话
+    """
+    # 先关闭向量检索创建会话，避免加载真实的嵌入模型，再接入假模型
+    cfg.VECTOR_SEARCH_ENABLED = False
+    session = Session(llm_client, cfg)
+
+    embedder = MemoryEmbedder(cfg)
+    embedder.model = model
+    embedder.load_or_create_index()
+    if preload:
+        embedder.add_memories([{"content": text} for text in make_messages(preload, seed + 1)])
+
+    session.embedder = embedder
+    session.memory_manager.embedder = embedder
+    session.retriever = MemoryRetriever(embedder)
+    cfg.VECTOR_SEARCH_ENABLED = True
+    return session
+
+
+def wait_drained(task_queue, timeout):
+    """
+    等待后台任务队列清空
+
+    记忆线程出错时任务不会被标记完成，因此轮询而不是调用 join()，超时后返回
+
+    Returns:
+        float: 清空（或超时）时的 perf_counter 时间
+    """
+    deadline = time.perf_counter() + timeout
+    while task_queue.unfinished_tasks and time.perf_counter() < deadline:
+        time.sleep(0.005)
+    return time.perf_counter()
+
+
+def run_benchmark(turns=100, llm_latency=0.05, jitter=0.0, remember_ratio=0.5, dimension=384, preload=0,
+                  auto_memory=True, seed=0, verbose=False, drain_timeout=300):
+    """
+    运行一次会话压测
+
+    Args:
+        turns (int): 对话轮数
+        llm_latency (float): 每次 LLM 调用的平均延迟（秒）
+        jitter (float): LLM 延迟的均匀抖动幅度（秒）
+        remember_ratio (float): 记忆判断回答“是”的比例
+        dimension (int): 假嵌入模型的向量维度
+        preload (int): 预先写入向量库的记忆条数
+        auto_memory (bool): 是否开启自动记忆（后台记忆线程）
+        seed (int): 随机数种子
+        verbose (bool): 是否保留会话的进度输出
+        drain_timeout (float): 等待后台记忆队列清空的最长秒数
+
+    Returns:
+        dict: 压测报告
+    """
+    messages = make_messages(turns, seed)
+    llm_client = FakeLLMClient(llm_latency, jitter, remember_ratio, seed)
+    model = FakeEmbeddingModel(dimension, seed)
+    registry = get_registry()
+    registry.reset()
+
+    with tempfile.TemporaryDirectory(prefix="mem4-bench-") as data_dir, quiet(not verbose):
+        cfg = bench_config(data_dir, STREAM_RESPONSES=False)
+        session = build_session(cfg, llm_client, model, preload, seed)
+        session.auto_memory = auto_memory
+        session.start()
+
+        latencies = []
+        start = time.perf_counter()
+        for message in messages:
+            turn_start = time.perf_counter()
+            session.process_message(message)
+            latencies.append(time.perf_counter() - turn_start)
+        chat_end = time.perf_counter()
+
+        backlog = session.memory_queue.unfinished_tasks
+        drained = wait_drained(session.memory_queue, drain_timeout)
+        session.stop()
+        stored = session.embedder.index.ntotal - preload
+
+    calls = dict(llm_client.calls)
+    total_calls = sum(calls.values())
+    tasks = turns if auto_memory else 0
+    return {
+        "benchmark": "session",
+        "params": {
+            "turns": turns,
+            "llm_latency": llm_latency,
+            "jitter": jitter,
+            "remember_ratio": remember_ratio,
+            "dimension": dimension,
+            "preload": preload,
+            "auto_memory": auto_memory,
+            "seed": seed,
+        },
+        "environment": environment(),
+        "turn_latency": latency_summary(latencies),
+        "stages": {stage: registry.summary("turn_stage_seconds", stage=stage) for stage in STAGES},
+        "memory_pipeline": {
+            "tasks": tasks,
+            "backlog_after_chat": backlog,
+            "unfinished": session.memory_queue.unfinished_tasks,
+            "drain_seconds": drained - chat_end,
+            "total_seconds": drained - start,
+            "tasks_per_second": tasks / (drained - start) if tasks else None,
+            "memories_stored": stored,
+        },
+        "llm_calls": {
+            "total": total_calls,
+            "per_turn": total_calls / turns if turns else None,
+            "foreground_per_turn": calls.get("chat", 0) / turns if turns else None,
+            "by_call_site": calls,
+        },
+        "embedding_calls": model.calls,
+        "memory_usage": memory_usage(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会话端到端压测（假 LLM + 假嵌入模型）")
+    parser.add_argument("--turns", type=int, default=100, help="对话轮数")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="每次 LLM 调用的平均延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="LLM 延迟的均匀抖动幅度（秒）")
+    parser.add_argument("--remember-ratio", type=float, default=0.5, help="记忆判断回答“是”的比例")
+    parser.add_argument("--dimension", type=int, default=384, help="假嵌入模型的向量维度")
+    parser.add_argument("--preload", type=int, default=0, help="预先写入向量库的记忆条数")
+    parser.add_argument("--no-auto-memory", action="store_true", help="关闭自动记忆（不运行后台记忆任务）")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--output", help="报告输出文件，默认打印到标准输出")
+    parser.add_argument("--verbose", action="store_true", help="保留会话的进度输出")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        turns=args.turns,
+        llm_latency=args.llm_latency,
+        jitter=args.jitter,
+        remember_ratio=args.remember_ratio,
+        dimension=args.dimension,
+        preload=args.preload,
+        auto_memory=not args.no_auto_memory,
+        seed=args.seed,
+        verbose=args.verbose,
+    )
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""
+向量库规模压测 - MemoryEmbedder 的写入、保存、加载与 MemoryRetriever 的检索随记忆条数的变化
+
+不加载嵌入模型：按簇生成归一化的合成向量与对应文本，由查表模型“编码”。对每个
+规模与索引类型测量：
+    - 批量构建（训练、添加、_save_index）与单条 add_memories 的耗时
+    - load_or_create_index 的加载耗时、磁盘占用与加载后的内存增量
+    - 不同 k 下 MemoryRetriever.search 的延迟
+    - 相对精确检索（Flat）的 recall@k，用于调整 nprobe、efSearch 等参数
+
+用法:
+    python -m benchmarks.vector_bench --sizes 1000,10000,100000 \\
+        --index Flat --index "HNSW32|efSearch=64" --index "IVF{nlist},Flat|nprobe=16"
+
+索引规格为 "index_factory 字符串|检索参数"，{nlist} 按规模替换为 4*sqrt(N)。
+"""
+import os
+import sys
+import math
+import time
+import argparse
+import tempfile
+import numpy as np
+import faiss
+from vector.embedder import MemoryEmbedder
+from vector.retriever import MemoryRetriever
+from .common import bench_config, latency_summary, memory_usage, environment, quiet, write_report
+
+DEFAULT_INDEXES = ["Flat", "HNSW32|efSearch=64", "IVF{nlist},Flat|nprobe=16"]
+
+
+class TableModel:
+    """按文本查表返回预先生成的向量，替代嵌入模型"""
+
+    def __init__(self, texts, vectors):
+        self.rows = {text: i for i, text in enumerate(texts)}
+        self.vectors = vectors
+
+    def get_sentence_embedding_dimension(self):
+        return self.vectors.shape[1]
+
+    def encode(self, texts, normalize_embeddings=False, **kwargs):
+        single = isinstance(texts, str)
+        rows = [self.rows[texts]] if single else [self.rows[text] for text in texts]
+        vectors = self.vectors[rows]
+        return vectors[0] if single else vectors
+
+
+def synthetic_vectors(count, dimension, centers, rng, noise=1.0, chunk=100000):
+    """
+    生成围绕若干簇中心的归一化向量（真实记忆的向量同样成簇分布，比均匀随机向量更接近实际召回率）
+
+    Args:
+        count (int): 向量数
+        dimension (int): 维度
+        centers (numpy.ndarray): 簇中心
+        rng (numpy.random.Generator): 随机数生成器
+        noise (float): 簇内噪声幅度
+        chunk (int): 分块生成的行数，控制临时内存
+
+    Returns:
+        numpy.ndarray: float32 向量矩阵
+    """
+    vectors = np.empty((count, dimension), dtype="float32")
+    for start in range(0, count, chunk):
+        stop = min(count, start + chunk)
+        labels = rng.integers(len(centers), size=stop - start)
+        block = centers[labels] + noise * rng.standard_normal((stop - start, dimension)).astype("float32")
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        vectors[start:stop] = block
+    return vectors
+
+
+def parse_index_spec(spec, size):
+    """
+    解析索引规格
+
+    Returns:
+        tuple: (index_factory 字符串, 检索参数或None)
+    """
+    factory, _, params = spec.partition("|")
+    nlist = max(1, int(4 * math.sqrt(size)))
+    return factory.strip().format(nlist=nlist), params.strip() or None
+
+
+def recall_at_k(found, truth, k):
+    """found 与 truth 为 (查询数, >=k) 的编号矩阵，返回前 k 个结果的平均召回率"""
+    hits = sum(len(set(row[:k]) & set(expected[:k])) for row, expected in zip(found.tolist(), truth.tolist()))
+    return hits / (k * len(truth))
+
+
+def _file_size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def bench_index(size, spec, data, ks, inserts, latency_queries, truth):
+    """
+    测量一个规模下的一种索引
+
+    Args:
+        size (int): 记忆条数
+        spec (str): 索引规格
+        data (dict): 文本、向量、查询与查表模型，见 run_benchmark
+        ks (list): 检索的 k 值
+        inserts (int): 单条 add_memories 的测量次数
+        latency_queries (int): 每个 k 测量延迟的查询数
+        truth (numpy.ndarray): 精确检索的结果编号
+
+    Returns:
+        dict: 该索引的测量结果
+    """
+    factory, params = parse_index_spec(spec, size)
+    result = {"size": size, "index": factory, "search_params": params}
+    with tempfile.TemporaryDirectory(prefix="mem4-vector-bench-") as data_dir, quiet():
+        cfg = bench_config(data_dir, VECTOR_INDEX_FACTORY=factory, VECTOR_INDEX_SEARCH_PARAMS=params)
+
+        embedder = MemoryEmbedder(cfg)
+        embedder.model = data["model"]
+        embedder.create_index(data["vectors"].shape[1])
+        vectors = data["vectors"][:size]
+
+        start = time.perf_counter()
+        embedder._ensure_trained(vectors)
+        result["train_seconds"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        embedder.index.add(vectors)
+        embedder.texts = data["texts"][:size]
+        result["add_seconds"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        embedder._save_index()
+        result["save_seconds"] = time.perf_counter() - start
+
+        # 单条写入走完整的 add_memories（编码、添加、保存全部索引与文本）
+        insert_times = []
+        for text in data["extra_texts"][:inserts]:
+            start = time.perf_counter()
+            embedder.add_memories([{"content": text}])
+            insert_times.append(time.perf_counter() - start)
+        result["insert"] = latency_summary(insert_times)
+        del embedder
+
+        result["disk_bytes"] = {"index": _file_size(cfg.INDEX_FILE), "texts": _file_size(cfg.TEXTS_FILE)}
+
+        rss_before = memory_usage()["rss_mb"]
+        loaded = MemoryEmbedder(cfg)
+        loaded.model = data["model"]
+        start = time.perf_counter()
+        loaded.load_or_create_index()
+        result["load_seconds"] = time.perf_counter() - start
+        rss_after = memory_usage()["rss_mb"]
+        result["load_rss_delta_mb"] = rss_after - rss_before if rss_before is not None else None
+
+        retriever = MemoryRetriever(loaded)
+        result["search"] = {}
+        for k in ks:
+            times = []
+            for query in data["query_texts"][:latency_queries]:
+                start = time.perf_counter()
+                retriever.search(query, k)
+                times.append(time.perf_counter() - start)
+            result["search"][str(k)] = latency_summary(times)
+
+        _, found = loaded.index.search(data["query_vectors"], max(ks))
+        result["recall"] = {str(k): recall_at_k(found, truth, k) for k in ks}
+    return result
+
+
+def run_benchmark(sizes=(1000, 10000, 100000), indexes=DEFAULT_INDEXES, dimension=256, ks=(1, 5, 10),
+                  queries=200, latency_queries=100, inserts=20, seed=0):
+    """
+    运行向量库规模压测
+
+    Args:
+        sizes (list): 记忆条数列表
+        indexes (list): 索引规格列表，见 parse_index_spec
+        dimension (int): 向量维度
+        ks (list): 检索的 k 值
+        queries (int): 计算召回率的查询数
+        latency_queries (int): 每个 k 测量延迟的查询数
+        inserts (int): 单条写入的测量次数
+        seed (int): 随机数种子
+
+    Returns:
+        dict: 压测报告
+    """
+    sizes = sorted(sizes)
+    ks = sorted(ks)
+    largest = sizes[-1]
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(8, int(math.sqrt(largest))), dimension)).astype("float32")
+
+    # 所有规模共用同一批数据的前缀；单条写入与查询使用额外生成的向量
+    vectors = synthetic_vectors(largest + inserts, dimension, centers, rng)
+    query_vectors = synthetic_vectors(queries, dimension, centers, rng)
+    texts = [f"合成记忆 {i}" for i in range(largest)]
+    extra_texts = [f"新增记忆 {i}" for i in range(inserts)]
+    query_texts = [f"查询 {i}" for i in range(queries)]
+    data = {
+        "vectors": vectors[:largest],
+        "texts": texts,
+        "extra_texts": extra_texts,
+        "query_texts": query_texts,
+        "query_vectors": query_vectors,
+        "model": TableModel(texts + extra_texts + query_texts, np.vstack([vectors, query_vectors])),
+    }
+
+    results = []
+    for size in sizes:
+        # 精确检索的结果包含单条写入的记忆，编号与 add_memories 追加的顺序一致
+        exact = faiss.IndexFlatIP(dimension)
+        exact.add(np.vstack([vectors[:size], vectors[largest:largest + inserts]]))
+        _, truth = exact.search(query_vectors, max(ks))
+        del exact
+
+        for spec in indexes:
+            print(f"📏 {size} 条记忆 / {spec}", file=sys.stderr)
+            try:
+                results.append(bench_index(size, spec, data, ks, inserts, latency_queries, truth))
+            except Exception as e:
+                print(f"❗ {spec} 在 {size} 条记忆下失败: {e}", file=sys.stderr)
+                results.append({"size": size, "index": spec, "error": str(e)})
+
+    return {
+        "benchmark": "vector_store",
+        "params": {
+            "sizes": sizes,
+            "indexes": list(indexes),
+            "dimension": dimension,
+            "ks": ks,
+            "queries": queries,
+            "latency_queries": latency_queries,
+            "inserts": inserts,
+            "seed": seed,
+        },
+        "environment": environment(),
+        "results": results,
+        "memory_usage": memory_usage(),
+    }
+
+
+def _int_list(text):
+    return [int(value) for value in text.split(",") if value.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量库规模压测（合成向量，不加载嵌入模型）")
+    parser.add_argument("--sizes", type=_int_list, default=[1000, 10000, 100000],
+                        help="记忆条数列表，逗号分隔（如 1000,10000,100000,1000000）")
+    parser.add_argument("--index", action="append", dest="indexes",
+                        help="索引规格 \"factory|检索参数\"，可重复指定，默认 Flat、HNSW32、IVF{nlist},Flat")
+    parser.add_argument("--dimension", type=int, default=256, help="向量维度")
+    parser.add_argument("--k", type=_int_list, default=[1, 5, 10], help="检索的 k 值，逗号分隔")
+    parser.add_argument("--queries", type=int, default=200, help="计算召回率的查询数")
+    parser.add_argument("--latency-queries", type=int, default=100, help="每个 k 测量延迟的查询数")
+    parser.add_argument("--inserts", type=int, default=20, help="单条写入的测量次数")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--output", help="报告输出文件，默认打印到标准输出")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        sizes=args.sizes,
+        indexes=args.indexes or DEFAULT_INDEXES,
+        dimension=args.dimension,
+        ks=args.k,
+        queries=args.queries,
+        latency_queries=args.latency_queries,
+        inserts=args.inserts,
+        seed=args.seed,
+    )
+    write_report(report, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,24 +11,133 @@ BASE_URL = "https://api.x.ai/v1"
 DEFAULT_MODEL = "grok-2-latest"
 AVAILABLE_MODELS = [
     "grok-2-latest",
+    "grok-3-mini",
     "grok-1",
 ]
 
+# 按任务路由模型：任务名即调用点（chat / judge / extract / tool-followup / summarize）
+# model 为 None 时使用会话当前模型；max_concurrency 为该任务同时在途的请求上限，None 表示不限制
+# priority 为调度优先级，foreground 请求总是先于 background 请求获得限流配额
+MODEL_ROUTES = {
+    "chat": {"model": None, "max_concurrency": None, "priority": "foreground"},
+    "tool-followup": {"model": None, "max_concurrency": None, "priority": "foreground"},
+    "judge": {"model": "grok-3-mini", "max_concurrency": 2, "priority": "background"},
+    "extract": {"model": "grok-3-mini", "max_concurrency": 2, "priority": "background"},
+    "summarize": {"model": "grok-3-mini", "max_concurrency": 1, "priority": "background"},
+}
+
+# 请求调度配置（令牌桶限流，前台请求优先）
+LLM_RATE_LIMIT_RPM = None  # 每分钟请求数上限（如 60），None 表示不限
+LLM_RATE_LIMIT_TPM = None  # 每分钟token数上限（如 200000），None 表示不限
+LLM_BACKGROUND_MAX_WAIT = 60  # 后台请求（记忆判断、提取）排队超过该秒数即取消
+LLM_EXPECTED_COMPLETION_TOKENS = 256  # 请求前预占限流配额时估计的输出token数
+
+# 请求弹性配置
+LLM_TIMEOUT = 60  # 单次请求超时（秒）
+LLM_MAX_ATTEMPTS = 3  # 可重试错误（超时、限流、5xx、连接失败）的最多尝试次数
+LLM_RETRY_BASE_DELAY = 0.5  # 指数退避的基础等待时间（秒）
+LLM_RETRY_MAX_DELAY = 8  # 单次退避等待上限（秒）
+LLM_HEDGE_ENABLED = False  # 是否在请求耗时超过 p95 后发出对冲请求
+LLM_HEDGE_PERCENTILE = 0.95  # 对冲请求的耗时分位
+LLM_CIRCUIT_FAILURE_THRESHOLD = 5  # 连续失败多少次后熔断，0 表示不熔断
+LLM_CIRCUIT_RECOVERY_TIMEOUT = 30  # 熔断持续时间（秒）
+
+# HTTP连接池配置（LLM客户端与工具函数共享）
+HTTP_MAX_CONNECTIONS = 100  # 最大连接数
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 20  # 最大空闲保持连接数
+HTTP_KEEPALIVE_EXPIRY = 30  # 空闲连接保留时间（秒）
+HTTP_HTTP2 = True  # 安装了 h2 时启用 HTTP/2
+
+# 响应缓存配置（仅缓存记忆判断、记忆提取等确定性调用）
+LLM_CACHE_ENABLED = True  # 是否启用响应缓存
+LLM_CACHE_TTL = 24 * 3600  # 缓存有效期（秒）
+LLM_CACHE_MAX_ENTRIES = 2048  # 内存缓存最大条目数
+LLM_CACHE_SQLITE_FILE = None  # SQLite持久化缓存文件路径，None 表示只使用内存缓存
+
+# 调用埋点与日志配置
+LLM_METRICS_JSONL_FILE = None  # 每次LLM调用的记录（调用点、token、耗时、重试）输出文件，None 表示不输出
+LOG_LEVEL = "WARNING"  # 日志级别，设为 "DEBUG" 时输出完整的请求消息
+TRACE_SAMPLE_RATE = 0.0  # 按轮次抽样记录追踪（检索、LLM调用、工具、记忆判断与提取、写入索引等阶段），0 表示关闭
+TRACE_MAX_SPANS = 100000  # 内存中保留的最近追踪区间数
+TRACE_OUTPUT_FILE = None  # 退出时导出的 Chrome trace 文件路径，None 表示不导出（也可用 'trace:文件名' 命令随时导出）
+METRICS_PORT = None  # 以 Prometheus 文本格式提供 /metrics 的本地端口（如 9464），None 表示不启动
+METRICS_HOST = "127.0.0.1"  # /metrics 的监听地址
+
 # 对话配置
 MAX_CONVERSATION_TURNS = 10  # 最大对话轮数
 ENABLE_MEMORY = True         # 是否启用记忆功能
+STREAM_RESPONSES = True      # 是否流式输出回复
+# 每轮的历史组装、记忆检索与工具选择并发执行，各阶段的截止时间（秒，从本轮开始计算）
+# 超时的阶段使用兜底值：检索超时按没有记忆上下文作答，工具选择超时携带全部工具
+TURN_STAGE_DEADLINES = {"history": 0.5, "retrieval": 1.5, "tools": 1.0}
+TURN_STAGE_DEFAULT_DEADLINE = 2.0  # 未单独配置的阶段的截止时间（秒）
+TURN_PIPELINE_WORKERS = 8  # 并发执行各阶段的线程数，被超时阶段占满时新阶段改用临时线程并计入 turn_pipeline_saturated_total
+
+# 工具调用配置
+TOOL_TIMEOUT = 30  # 单个工具函数的执行超时（秒）
+TOOL_MAX_WORKERS = 8  # 并发执行工具调用的线程数
+TOOL_PROCESS_WORKERS = 2  # 执行 isolation="process" 工具函数的进程数（超时后可终止）
+TOOL_LOOP_MAX_STEPS = 4  # 每轮对话最多的工具调用轮数（模型 → 工具 → 模型）
+TOOL_LOOP_BUDGET = 90  # 整个工具调用循环的总耗时预算（秒）
+TOOL_LOOP_STEP_TIMEOUT = 60  # 循环中单次模型请求的超时上限（秒）
+TOOL_LOOP_ANSWER_RESERVE = 15  # 为最终回答预留的时间（秒），剩余预算不足时不再调用工具
+TOOL_SELECTION_TOP_N = 8  # 注册的工具超过该数量时，按与用户消息的相关度只携带前N个（None 表示总是携带全部）
+TOOL_SELECTION_ALWAYS_INCLUDE = []  # 始终携带的工具名
 
 # 向量化配置
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 EMBEDDING_MODEL = "BAAI/bge-large-zh-v1.5"  # 嵌入模型名称
 VECTORS_FILE = os.path.join(DATA_DIR, "vectors.npy")  # 向量文件路径
 TEXTS_FILE = os.path.join(DATA_DIR, "texts.pkl")  # 文本文件路径
+NAMESPACES_FILE = os.path.join(DATA_DIR, "namespaces.pkl")  # 每条记忆所属的命名空间（多会话服务按会话隔离）
 INDEX_FILE = os.path.join(DATA_DIR, "index.faiss")  # 索引文件路径
+# 新建索引的类型（faiss index_factory 字符串，内积度量）："Flat" 为精确检索；
+# "HNSW32" 近似检索无需训练；"IVF1024,Flat" 需要首批至少 nlist 条记忆训练，适合批量导入后的大库
+# 已有的索引文件按文件中的类型加载；各类型的规模、召回率与延迟可用 python -m benchmarks.vector_bench 对比
+VECTOR_INDEX_FACTORY = "Flat"
+VECTOR_INDEX_SEARCH_PARAMS = None  # 近似索引的检索参数，如 "nprobe=16"（IVF）或 "efSearch=64"（HNSW）
 TOP_K = 3  # 检索返回结果数量
 VECTOR_SEARCH_ENABLED = True  # 是否启用向量检索
+EMBEDDING_QUERY_CACHE_SIZE = 1024  # 检索查询向量的LRU缓存条数，0 表示不缓存
+EMBEDDING_BATCH_SIZE = 32  # 服务端模式下合并编码请求的最大批次（文本数）
+EMBEDDING_BATCH_WAIT = 0.005  # 收集一个编码批次的最长等待时间（秒）
+EMBEDDING_SERVICE_ADDRESSES = None  # 向量编码服务地址列表（如 ["127.0.0.1:6010"]），设置后不在本进程加载嵌入模型
+# 编码服务的连接认证密钥（至少16字节的随机值，服务与客户端一致），None 时读取环境变量 MEM4_EMBEDDING_AUTHKEY；
+# 连接上传输 pickle 数据，密钥泄露等同于允许执行任意代码，不要提交到代码库
+EMBEDDING_SERVICE_AUTHKEY = None
+
+# 历史对话批量回填配置（python -m memory.backfill）
+BACKFILL_WORKERS = 4  # 并发处理的对话数（同时在途的记忆判断/提取请求上限）
+BACKFILL_ENCODE_BATCH_SIZE = 256  # 建索引时每批编码的记忆数
+BACKFILL_CHECKPOINT_FILE = os.path.join(DATA_DIR, "backfill.jsonl")  # 检查点文件，记录已处理的对话与提取结果
+
+# 对话日志配置
+HISTORY_JOURNAL_ENABLED = False  # 是否将每轮对话追加写入JSONL日志
+HISTORY_JOURNAL_FILE = os.path.join(DATA_DIR, "history.jsonl")  # 日志文件路径
+HISTORY_JOURNAL_MAX_BYTES = 8 * 1024 * 1024  # 活动日志轮转阈值（字节）
+HISTORY_JOURNAL_COMPRESS = True  # 是否gzip压缩轮转后的日志分段
 
 # 应用配置
 APP_NAME = "API "
 
+# 多会话服务端配置（python -m server.app）
+SERVER_HOST = "127.0.0.1"  # 监听地址
+SERVER_PORT = 8080  # 监听端口
+SERVER_MAX_SESSIONS = 100  # 同时托管的最大会话数
+BATCH_WORKERS = 8  # main.py --batch 批处理模式并发处理的会话数（不超过 SERVER_MAX_SESSIONS）
+SERVER_SESSION_IDLE_TIMEOUT = 1800  # 会话空闲多少秒后回收
+SERVER_SESSION_SWEEP_INTERVAL = 60  # 检查空闲会话的间隔（秒）
+SESSION_MEMORY_DRAIN_TIMEOUT = 10  # 关闭会话前等待后台记忆任务处理完的最长秒数
+SERVER_EXECUTOR_WORKERS = 16  # 向量编码、检索与同步工具函数共用的线程数
+
 # 在文件末尾添加高德地图API配置
 AMAP_KEY = "天气查询api"  # 替换为实际的密钥
+AMAP_BASE_URL = "https://restapi.amap.com"  # 高德接口地址，可指向本地替身（python -m mock.amap_server）
+
+# 天气缓存配置
+WEATHER_CACHE_ENABLED = True  # 是否缓存天气查询结果
+WEATHER_REFRESH_INTERVAL = 3600  # 实况天气的更新间隔（秒），缓存至 reporttime + 该间隔
+WEATHER_FORECAST_REFRESH_INTERVAL = 3 * 3600  # 天气预报的更新间隔（秒）
+WEATHER_MIN_TTL = 300  # 缓存的最短有效期（秒）
+WEATHER_CACHE_MAX_ENTRIES = 256  # 最大缓存条目数
+WEATHER_CITY_CODES_FILE = None  # 额外的城市编码JSON文件（{"codes": {...}, "aliases": {...}}），None 表示只用内置表
@@ -1,8 +1,33 @@
 """
 核心模块包
+
+子模块按需导入，只用到其中一个类时不会连带加载其余模块
 """
-from .session import Session
-from .memory_manager import MemoryManager
-from .response_manager import ResponseManager
+import importlib
+
+# 导出名 -> 所在子模块，首次访问时才导入（PEP 562）
+_EXPORTS = {
+    'Session': '.session',
+    'AsyncSession': '.async_session',
+    'MemoryManager': '.memory_manager',
+    'ResponseManager': '.response_manager',
+    'ToolLoop': '.tool_loop',
+    'AsyncToolLoop': '.tool_loop',
+    'TurnPipeline': '.pipeline',
+    'TurnTimings': '.pipeline',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
 
-__all__ = ['Session', 'MemoryManager', 'ResponseManager']
\ No newline at end of file
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
\ No newline at end of file
@@ -0,0 +1,367 @@
+"""
+异步会话模块 - 基于 asyncio 的对话与记忆流程，单进程内可承载大量并发会话
+"""
+import asyncio
+import contextvars
+import functools
+import time
+from contextlib import aclosing
+from .memory_manager import MemoryManager
+from .response_manager import ResponseManager
+from .session import retrieve_memory_context
+from .tool_loop import AsyncToolLoop
+from .pipeline import TurnPipeline
+from model.prompts import MEMORY_JUDGE_PROMPT
+from model.errors import LLMError
+from model.llm_client import build_messages
+from memory.extract import MemoryExtractor
+from observability.metrics import get_registry
+from observability.tracing import get_tracer, span, atrace_iter
+from functions.function_registry import FunctionRegistry
+from functions.tool_selector import ToolSelector
+
+
+class AsyncSession:
+    def __init__(self, llm_client, config, embedder=None, retriever=None, executor=None, function_registry=None,
+                 tool_selector=None, memory_namespace=None):
+        """
+        初始化异步会话
+
+        与 Session 不同，AsyncSession 不创建线程：记忆处理是事件循环中的一个任务，
+        向量编码、检索和同步工具函数在执行器中运行。多个会话应共享同一个
+        embedder/retriever，避免每个会话各自加载嵌入模型。
+
+        Args:
+            llm_client: AsyncGrokClient 实例
+            config: 配置对象
+            embedder: 共享的 MemoryEmbedder 实例(可选)
+            retriever: 共享的 MemoryRetriever 实例(可选)
+            executor: 运行阻塞操作的执行器，默认使用事件循环的默认执行器
+            function_registry: 共享的 FunctionRegistry 实例(可选)，服务端模式下所有会话共用一份工具
+            tool_selector: 共享的 ToolSelector 实例(可选)，与 function_registry 配套使用
+            memory_namespace (str, optional): 记忆的命名空间，共享 embedder 时本会话只写入和检索
+                该命名空间的记忆，并且不在标准输出打印检索到的记忆；服务端模式下为会话ID
+        """
+        self.llm_client = llm_client
+        self.config = config
+        self.embedder = embedder
+        self.retriever = retriever
+        self.executor = executor
+        self.memory_namespace = memory_namespace
+
+        # 记忆任务队列，由 start() 启动的后台任务消费
+        self.memory_queue = asyncio.Queue()
+
+        self.extractor = MemoryExtractor(llm_client)
+        self.response_manager = ResponseManager(llm_client, config)
+        # 同步工具函数在会话的执行器中运行
+        self.function_registry = function_registry or FunctionRegistry(
+            max_workers=getattr(config, 'TOOL_MAX_WORKERS', 8),
+            process_workers=getattr(config, 'TOOL_PROCESS_WORKERS', 2),
+            executor=executor
+        )
+        self.tool_loop = AsyncToolLoop.from_config(llm_client, self.function_registry, config)
+        self.tool_selector = tool_selector or ToolSelector.from_config(
+            self.function_registry, config, encoder=embedder if embedder and embedder.model else None
+        )
+        self.pipeline = TurnPipeline.from_config(config)
+        self.last_turn_timings = None
+        self.last_turn_status = None
+        self.registry = get_registry()
+
+        # 会话状态
+        self.system_message = None
+        self.model = config.DEFAULT_MODEL
+        self.enable_memory = config.ENABLE_MEMORY
+        self.auto_memory = False
+        self.running = False
+        self.memories = []
+
+        self._memory_task = None
+        # 已提交但尚未处理完的记忆任务数（包括正在处理的）
+        self._memory_pending = 0
+
+    @property
+    def memory_busy(self):
+        """后台是否还有未处理完的记忆任务，此时回收会话会丢失这些记忆"""
+        return self._memory_pending > 0
+
+    async def start(self):
+        """启动会话，创建记忆处理任务"""
+        if self.running:
+            return
+
+        self.running = True
+        self._memory_task = asyncio.create_task(self._memory_processor())
+
+    async def stop(self, drain_timeout=None):
+        """
+        停止会话及记忆处理任务
+
+        Args:
+            drain_timeout (float, optional): 先等待已提交的记忆任务处理完的最长秒数，
+                默认使用 config.SESSION_MEMORY_DRAIN_TIMEOUT，超时后剩余任务被丢弃
+        """
+        if drain_timeout is None:
+            drain_timeout = getattr(self.config, 'SESSION_MEMORY_DRAIN_TIMEOUT', 10)
+        if self._memory_task and self.memory_busy and drain_timeout:
+            try:
+                await asyncio.wait_for(self.memory_queue.join(), drain_timeout)
+            except asyncio.TimeoutError:
+                print(f"⚠️ 会话关闭时仍有 {self._memory_pending} 个记忆任务未完成，已丢弃")
+        self.running = False
+        if self._memory_task:
+            self._memory_task.cancel()
+            try:
+                await self._memory_task
+            except asyncio.CancelledError:
+                pass
+            self._memory_task = None
+
+    async def _run_blocking(self, func, *args, **kwargs):
+        """在执行器中运行阻塞或CPU密集的调用（携带当前上下文，追踪 span 保持父子关系）"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, contextvars.copy_context().run, functools.partial(func, *args, **kwargs)
+        )
+
+    def _turn_stages(self, user_message):
+        """
+        本轮的准备阶段：{阶段名: (函数, 兜底值)}，普通函数由 TurnPipeline 在执行器中运行
+
+        检索超时或失败时按没有记忆上下文作答；工具选择超时时携带全部工具定义。
+        """
+        all_definitions = self.function_registry.get_function_definitions()
+
+        async def history():
+            return self.response_manager.get_history_messages()
+
+        async def all_tools():
+            return all_definitions
+
+        # 不需要编码用户消息时直接返回全部定义，不占用执行器
+        tools = functools.partial(self.tool_selector.select, user_message) if self.tool_selector.active else all_tools
+        stages = {"tools": (tools, all_definitions)}
+        if self.enable_memory:
+            stages["history"] = (history, None)
+        if self.retriever and self.config.VECTOR_SEARCH_ENABLED:
+            stages["retrieval"] = (
+                functools.partial(retrieve_memory_context, self.retriever, user_message, self.config.TOP_K,
+                                  namespace=self.memory_namespace, verbose=self.memory_namespace is None), ""
+            )
+        return stages
+
+    async def _prepare_turn(self, user_message):
+        """
+        构建本轮请求的上下文，历史组装、向量检索与工具选择并发进行
+
+        Returns:
+            tuple: (历史消息列表或None, 附加了记忆上下文的用户消息, 函数定义列表, TurnTimings)
+        """
+        results, timings = await self.pipeline.run_async(self._turn_stages(user_message), executor=self.executor)
+
+        enhanced_message = user_message
+        memory_context = results.get("retrieval")
+        if memory_context:
+            enhanced_message = memory_context + "\n\n" + user_message
+
+        return results.get("history"), enhanced_message, results["tools"], timings
+
+    def _finish_timings(self, timings, llm_start, status="ok"):
+        """记录模型阶段与整轮耗时，并计入 turns_total{status}"""
+        self.registry.inc("turns_total", status=status)
+        self.last_turn_status = status
+        timings.record("llm", time.monotonic() - llm_start)
+        self.last_turn_timings = timings.finish()
+
+    def _complete_turn(self, user_message, response):
+        """保存对话记录并提交自动记忆任务"""
+        self.response_manager.add_exchange(user_message, response)
+
+        if self.auto_memory:
+            self._memory_pending += 1
+            self.memory_queue.put_nowait({
+                "type": "analyze",
+                "content": user_message,
+                "timestamp": time.time(),
+                "trace": get_tracer().current_span()
+            })
+
+    async def process_message(self, user_message):
+        """
+        处理用户消息，生成回复
+
+        有可用函数时进入多步工具调用循环。LLM 请求失败时返回错误提示，但不会写入对话历史。
+
+        Args:
+            user_message (str): 用户消息
+
+        Returns:
+            str: 助手回复
+        """
+        with span("turn", stream=False):
+            return await self._respond(user_message)
+
+    async def _respond(self, user_message):
+        """process_message 的实现，在本轮的追踪 span 内运行"""
+        history_messages, enhanced_message, function_definitions, timings = await self._prepare_turn(user_message)
+        llm_start = time.monotonic()
+        status = "ok"
+
+        try:
+            if function_definitions:
+                messages = build_messages(enhanced_message, self.system_message, history_messages)
+                result = await self.tool_loop.run(messages, function_definitions, model=self.model)
+                response = result["content"]
+            else:
+                response = await self.llm_client.ask(
+                    prompt=enhanced_message,
+                    model=self.model,
+                    system_message=self.system_message,
+                    history_messages=history_messages
+                )
+        except LLMError as e:
+            status = "error"
+            error_msg = f"请求出错: {str(e)}"
+            print(f"❌ {error_msg}")
+            return error_msg
+        except BaseException as e:
+            status = "error" if isinstance(e, Exception) else "aborted"
+            raise
+        finally:
+            self._finish_timings(timings, llm_start, status)
+
+        self._complete_turn(user_message, response)
+        return response
+
+    def process_message_stream(self, user_message):
+        """
+        流式处理用户消息
+
+        Args:
+            user_message (str): 用户消息
+
+        Returns:
+            AsyncGenerator: 逐段产出增量回复文本
+        """
+        # 本轮 span 跨越 yield，生成器被放弃时可能在另一个上下文中结束，不能用 with 进入；
+        # 直接返回 atrace_iter 的异步生成器，调用方关闭它时内层生成器随之关闭
+        return atrace_iter(span("turn", stream=True), self._respond_stream(user_message))
+
+    async def _respond_stream(self, user_message):
+        """process_message_stream 的实现，在本轮的追踪 span 内运行"""
+        history_messages, enhanced_message, function_definitions, timings = await self._prepare_turn(user_message)
+        llm_start = time.monotonic()
+        status = "ok"
+        chunks = []
+
+        try:
+            if function_definitions:
+                messages = build_messages(enhanced_message, self.system_message, history_messages)
+                async with aclosing(self.tool_loop.run_stream(messages, function_definitions,
+                                                              model=self.model)) as events:
+                    async for event in events:
+                        if event["type"] == "content":
+                            chunks.append(event["content"])
+                            yield event["content"]
+                        elif event["type"] == "tool_step":
+                            chunks = []
+            else:
+                texts = await self.llm_client.ask(
+                    prompt=enhanced_message,
+                    model=self.model,
+                    system_message=self.system_message,
+                    history_messages=history_messages,
+                    stream=True
+                )
+                async with aclosing(texts):
+                    async for text in texts:
+                        chunks.append(text)
+                        yield text
+        except LLMError as e:
+            status = "error"
+            error_msg = f"请求出错: {str(e)}"
+            print(f"❌ {error_msg}")
+            yield error_msg
+            return
+        except BaseException as e:
+            # 生成器被提前关闭（客户端断开）或任务被取消时记为 aborted，其余未预期异常记为 error
+            status = "error" if isinstance(e, Exception) else "aborted"
+            raise
+        finally:
+            self._finish_timings(timings, llm_start, status)
+
+        self._complete_turn(user_message, "".join(chunks))
+
+    async def _analyze(self, content):
+        """判断内容是否需要记忆，需要则提取并向量化存储"""
+        with span("memory.judge") as current:
+            try:
+                response = await self.llm_client.ask(prompt=content, system_message=MEMORY_JUDGE_PROMPT,
+                                                      use_cache=True, call_site="judge")
+            except LLMError as e:
+                print(f"❗ 记忆判断请求失败: {e}")
+                current.set(failed=True)
+                self.registry.inc("memory_judgements_total", result="error")
+                return
+            remember = MemoryManager.is_positive_judgement(response)
+            current.set(remember=remember)
+        self.registry.inc("memory_judgements_total", result="positive" if remember else "negative")
+        if not remember:
+            return
+
+        with span("memory.extract") as current:
+            memories = await self.extractor.extract_async(content)
+            current.set(count=len(memories))
+        MemoryManager.count_extraction(self.registry, memories)
+        if not memories:
+            return
+
+        if self.embedder:
+            try:
+                await self._run_blocking(self.embedder.add_memories, memories, namespace=self.memory_namespace)
+            except Exception as e:
+                print(f"❗ 向量化记忆失败: {e}")
+
+        for memory in memories:
+            self.memories.append(memory.dict())
+
+    async def _memory_processor(self):
+        """记忆处理任务的主循环"""
+        while self.running:
+            task = await self.memory_queue.get()
+            try:
+                if task["type"] == "analyze":
+                    with span("memory.analyze", parent=task.get("trace")):
+                        await self._analyze(task["content"])
+            except Exception as e:
+                print(f"记忆处理任务错误: {e}")
+            finally:
+                self._memory_pending -= 1
+                self.memory_queue.task_done()
+
+    # 便捷方法
+    def set_system_message(self, message):
+        self.system_message = message
+
+    def set_model(self, model):
+        self.model = model
+
+    def toggle_memory(self, enable):
+        self.enable_memory = enable
+
+    def toggle_auto_memory(self, enable):
+        self.auto_memory = enable
+
+    def get_memories(self):
+        return self.memories
+
+    def clear_history(self):
+        self.response_manager.clear_history()
+
+    def get_history(self, turns=None):
+        return self.response_manager.get_history(turns)
+
+    def register_function(self, func, name=None, description=None, parameters=None, **options):
+        """注册一个可调用的函数（支持协程函数），options 为执行策略（timeout、max_concurrency、memoize、isolation）"""
+        self.function_registry.register(func, name, description, parameters, **options)
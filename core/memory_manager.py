@@ -3,6 +3,9 @@
 """
 from model.prompts import MEMORY_JUDGE_PROMPT
 from memory.extract import MemoryExtractor
+from model.errors import LLMError
+from observability.metrics import get_registry
+from observability.tracing import span
 import time
 
 class MemoryManager:
@@ -21,6 +24,7 @@ class MemoryManager:
         self.output_queue = output_queue
         self.extractor = MemoryExtractor(llm_client)
         self.embedder = embedder
+        self.registry = get_registry()
         
     def should_remember(self, content):
         """
@@ -33,18 +37,50 @@ class MemoryManager:
             bool: 是否应该记忆
         """
         print("📝 正在分析内容是否包含重要信息...")
-        response = self.llm_client.ask(
-            prompt=content,
-            system_message=MEMORY_JUDGE_PROMPT
-        )
+        with span("memory.judge") as current:
+            try:
+                response = self.llm_client.ask(
+                    prompt=content,
+                    system_message=MEMORY_JUDGE_PROMPT,
+                    use_cache=True,
+                    call_site="judge"
+                )
+            except LLMError as e:
+                # 请求失败时不把错误信息当作模型的判断结果
+                print(f"❗ 记忆判断请求失败: {e}")
+                current.set(failed=True)
+                self.registry.inc("memory_judgements_total", result="error")
+                return False
+            
+            result = self.is_positive_judgement(response)
+            current.set(remember=result)
+        self.registry.inc("memory_judgements_total", result="positive" if result else "negative")
         
-        result = response.lower().strip() in ["是", "yes", "true", "1"]
         if result:
             print("✅ 检测到包含值得记忆的信息")
         else:
             print("❌ 未检测到需要记忆的重要信息")
         return result
 
+    @staticmethod
+    def count_extraction(registry, memories):
+        """计入 memory_extractions_total{status} 与 memories_extracted_total"""
+        registry.inc("memory_extractions_total", status="ok" if memories else "empty")
+        registry.inc("memories_extracted_total", len(memories))
+
+    @staticmethod
+    def is_positive_judgement(response):
+        """
+        解析记忆判断模型的回复
+        
+        Args:
+            response (str): 模型回复
+            
+        Returns:
+            bool: 是否判定为需要记忆
+        """
+        return response.lower().strip() in ["是", "yes", "true", "1"]
+
     def extract_memory(self, content):
         """
         从内容中提取结构化记忆
@@ -57,7 +93,10 @@ class MemoryManager:
         """
         print("🔍 正在分析并提取结构化记忆...")
         # 使用提取器获取结构化记忆
-        memories = self.extractor.extract(content)
+        with span("memory.extract") as current:
+            memories = self.extractor.extract(content)
+            current.set(count=len(memories))
+        self.count_extraction(self.registry, memories)
         
         if not memories:
             print("⚠️ 未能提取出结构化记忆")
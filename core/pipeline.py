@@ -0,0 +1,206 @@
+"""
+每轮对话的准备流水线 - 历史组装、记忆检索与工具选择并发执行，各阶段有独立的截止时间
+"""
+import time
+import asyncio
+import threading
+import functools
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from observability.metrics import get_registry
+from observability.tracing import span
+
+
+class TurnTimings:
+    """
+    一轮对话各阶段的耗时与结果状态
+
+    status 取值：ok（按时完成）、timeout（超过截止时间，使用了兜底值）、error（出错，使用了兜底值）
+    """
+
+    def __init__(self, registry=None):
+        self.registry = registry or get_registry()
+        self.start = time.monotonic()
+        self.stages = {}
+
+    def record(self, stage, elapsed, status="ok"):
+        """记录一个阶段，同时写入指标 turn_stage_seconds{stage} 与 turn_stage_fallbacks_total{stage,status}"""
+        self.stages[stage] = {"seconds": elapsed, "status": status}
+        self.registry.observe("turn_stage_seconds", elapsed, stage=stage)
+        if status != "ok":
+            self.registry.inc("turn_stage_fallbacks_total", stage=stage, status=status)
+
+    def finish(self):
+        """记录整轮耗时"""
+        self.record("total", time.monotonic() - self.start)
+        return self
+
+    def as_dict(self):
+        return {stage: dict(item) for stage, item in self.stages.items()}
+
+    def __str__(self):
+        parts = []
+        for stage, item in self.stages.items():
+            mark = "" if item["status"] == "ok" else f"[{item['status']}]"
+            parts.append(f"{stage} {item['seconds'] * 1000:.0f}ms{mark}")
+        return "，".join(parts)
+
+
+class TurnPipeline:
+    """
+    并发执行一轮对话的准备阶段
+
+    每个阶段为 (函数, 兜底值)。所有阶段同时开始，超过各自截止时间（从流水线
+    开始计算）或出错的阶段使用兜底值，不再等待，例如检索过慢时本轮按“没有记忆
+    上下文”作答。线程中超时的阶段无法中断，其结果被丢弃。
+
+    超时的阶段仍占用线程池的线程；线程全部被占用时新阶段不在池中排队（排队只会
+    让它也超时），而是在临时线程中运行，并计入 turn_pipeline_saturated_total{stage}。
+    """
+
+    def __init__(self, deadlines=None, default_deadline=2.0, max_workers=8, registry=None):
+        """
+        Args:
+            deadlines (dict, optional): {阶段名: 截止秒数}
+            default_deadline (float): 未单独配置的阶段的截止秒数
+            max_workers (int): 同步执行时线程池的线程数
+            registry (MetricsRegistry, optional): 指标注册表，默认使用进程内共享注册表
+        """
+        self.deadlines = dict(deadlines or {})
+        self.default_deadline = default_deadline
+        self.max_workers = max_workers
+        self.registry = registry or get_registry()
+        self._executor = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, registry=None):
+        """根据配置对象创建"""
+        return cls(
+            deadlines=getattr(config, 'TURN_STAGE_DEADLINES', None),
+            default_deadline=getattr(config, 'TURN_STAGE_DEFAULT_DEADLINE', 2.0),
+            max_workers=getattr(config, 'TURN_PIPELINE_WORKERS', 8),
+            registry=registry,
+        )
+
+    def deadline(self, stage):
+        return self.deadlines.get(stage, self.default_deadline)
+
+    def new_timings(self):
+        return TurnTimings(self.registry)
+
+    @property
+    def busy_workers(self):
+        """仍在运行的阶段数（包括已超时、结果会被丢弃的阶段）"""
+        return self._in_flight
+
+    def _submit(self, name, func):
+        """提交一个阶段，线程池已被占满时改用临时线程，不排队等待"""
+        with self._lock:
+            saturated = self._in_flight >= self.max_workers
+            self._in_flight += 1
+        # 每个阶段在当前上下文的副本中运行，追踪 span 以本轮的 span 为父
+        task = functools.partial(contextvars.copy_context().run, self._timed, name, func)
+        if saturated:
+            self.registry.inc("turn_pipeline_saturated_total", stage=name)
+            future = Future()
+            threading.Thread(target=self._run_detached, args=(future, task), daemon=True,
+                             name=f"turn-overflow-{name}").start()
+        else:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="turn")
+            future = self._executor.submit(task)
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _):
+        with self._lock:
+            self._in_flight -= 1
+
+    @staticmethod
+    def _run_detached(future, task):
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(task())
+        except BaseException as e:
+            future.set_exception(e)
+
+    def run(self, stages, timings=None):
+        """
+        在线程池中并发执行各阶段
+
+        Args:
+            stages (dict): {阶段名: (无参函数, 兜底值)}
+            timings (TurnTimings, optional): 记录耗时的对象，默认新建
+
+        Returns:
+            tuple: ({阶段名: 结果或兜底值}, TurnTimings)
+        """
+        timings = timings or self.new_timings()
+        start = time.monotonic()
+        futures = {name: self._submit(name, func) for name, (func, _) in stages.items()}
+
+        results = {}
+        for name, future in futures.items():
+            fallback = stages[name][1]
+            remaining = max(0.0, start + self.deadline(name) - time.monotonic())
+            try:
+                results[name], elapsed = future.result(timeout=remaining)
+                timings.record(name, elapsed)
+            except FuturesTimeoutError:
+                future.cancel()
+                results[name] = fallback
+                timings.record(name, time.monotonic() - start, "timeout")
+            except Exception as e:
+                print(f"❗ {name} 阶段失败: {e}")
+                results[name] = fallback
+                timings.record(name, time.monotonic() - start, "error")
+        return results, timings
+
+    async def run_async(self, stages, executor=None, timings=None):
+        """
+        在事件循环中并发执行各阶段，协程函数直接等待，普通函数在执行器中运行
+
+        Args:
+            stages (dict): {阶段名: (无参函数或协程函数, 兜底值)}
+            executor: 运行普通函数的执行器，默认使用事件循环的默认执行器
+            timings (TurnTimings, optional): 记录耗时的对象，默认新建
+
+        Returns:
+            tuple: ({阶段名: 结果或兜底值}, TurnTimings)
+        """
+        timings = timings or self.new_timings()
+        loop = asyncio.get_running_loop()
+
+        async def run_stage(name, func, fallback):
+            start = time.monotonic()
+            if asyncio.iscoroutinefunction(func):
+                awaitable = func()
+            else:
+                awaitable = loop.run_in_executor(executor, contextvars.copy_context().run, self._traced, name, func)
+            try:
+                result = await asyncio.wait_for(awaitable, self.deadline(name))
+                timings.record(name, time.monotonic() - start)
+                return name, result
+            except asyncio.TimeoutError:
+                timings.record(name, time.monotonic() - start, "timeout")
+            except Exception as e:
+                print(f"❗ {name} 阶段失败: {e}")
+                timings.record(name, time.monotonic() - start, "error")
+            return name, fallback
+
+        pairs = await asyncio.gather(*(run_stage(name, func, fallback) for name, (func, fallback) in stages.items()))
+        return dict(pairs), timings
+
+    @staticmethod
+    def _traced(name, func):
+        with span(f"turn.{name}"):
+            return func()
+
+    @classmethod
+    def _timed(cls, name, func):
+        start = time.monotonic()
+        result = cls._traced(name, func)
+        return result, time.monotonic() - start
@@ -1,22 +1,34 @@
 """
 响应管理模块 - 处理对话历史和响应生成
 """
-import json
-from datetime import datetime
+from memory.history import ConversationHistory
 
 class ResponseManager:
-    def __init__(self, llm_client, config):
+    def __init__(self, llm_client, config, journal=None):
         """
         初始化响应管理器
         
         Args:
             llm_client: LLM 客户端实例
             config: 配置对象
+            journal (HistoryJournal, optional): 追加写入的对话日志
         """
         self.llm_client = llm_client
         self.max_turns = config.MAX_CONVERSATION_TURNS
-        self.history = []
-        self.turn_count = 0
+        # 对话历史的增删、文件读写与日志恢复都由 ConversationHistory 实现
+        self.conversation = ConversationHistory(self.max_turns, journal)
+    
+    @property
+    def history(self):
+        return self.conversation.history
+    
+    @property
+    def turn_count(self):
+        return self.conversation.turn_count
+    
+    @property
+    def journal(self):
+        return self.conversation.journal
         
     def add_exchange(self, user_message, assistant_message):
         """
@@ -26,20 +38,7 @@ class ResponseManager:
             user_message (str): 用户消息
             assistant_message (str): 助手回复
         """
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        self.history.append({
-            "turn": self.turn_count + 1,
-            "timestamp": timestamp,
-            "user": user_message,
-            "assistant": assistant_message
-        })
-        
-        self.turn_count += 1
-        
-        # 如果超过最大轮数，移除最早的对话
-        if len(self.history) > self.max_turns:
-            self.history.pop(0)
+        self.conversation.add_exchange(user_message, assistant_message)
     
     def get_history_messages(self):
         """
@@ -48,13 +47,7 @@ class ResponseManager:
         Returns:
             list: 消息列表
         """
-        messages = []
-        
-        for exchange in self.history:
-            messages.append({"role": "user", "content": exchange["user"]})
-            messages.append({"role": "assistant", "content": exchange["assistant"]})
-        
-        return messages
+        return self.conversation.get_messages_for_api()
     
     def get_history(self, turns=None):
         """
@@ -66,41 +59,30 @@ class ResponseManager:
         Returns:
             list: 对话历史
         """
-        if turns is None or turns >= len(self.history):
-            return self.history
-        
-        return self.history[-turns:]
+        return self.conversation.get_recent_history(turns)
     
     def clear_history(self):
         """清空对话历史"""
-        self.history = []
-        self.turn_count = 0
+        self.conversation.clear()
+    
+    def restore_from_journal(self):
+        """从对话日志末尾恢复最近的对话历史"""
+        self.conversation.restore_from_journal()
     
     def save_history(self, filename):
         """
-        保存对话历史到文件
+        保存对话历史到文件，.jsonl 后缀按行写入
         
         Args:
             filename (str): 文件名
         """
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(self.history, f, ensure_ascii=False, indent=2)
+        self.conversation.save_to_file(filename)
     
     def load_history(self, filename):
         """
-        从文件加载对话历史
+        从文件加载对话历史，.jsonl 后缀只从文件末尾读取最近的对话
         
         Args:
             filename (str): 文件名
         """
-        try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                self.history = json.load(f)
-                
-                # 更新对话轮数
-                if self.history:
-                    self.turn_count = max(exchange["turn"] for exchange in self.history)
-        except FileNotFoundError:
-            print(f"文件不存在: {filename}")
-        except json.JSONDecodeError:
-            print(f"文件格式错误: {filename}")
\ No newline at end of file
+        self.conversation.load_from_file(filename)
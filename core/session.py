@@ -5,12 +5,54 @@ import threading
 import queue
 import time
 import os
-import json
 from .memory_manager import MemoryManager
 from .response_manager import ResponseManager
+from .tool_loop import ToolLoop
+from .pipeline import TurnPipeline
 from vector.embedder import MemoryEmbedder
 from vector.retriever import MemoryRetriever
 from functions.function_registry import FunctionRegistry
+from functions.tool_selector import ToolSelector
+from memory.journal import HistoryJournal
+from model.errors import LLMError
+from model.llm_client import build_messages
+from model.scheduler import request_owner
+from observability.metrics import get_registry
+from observability.tracing import get_tracer, span, trace_iter
+
+
+def retrieve_memory_context(retriever, user_message, top_k, namespace=None, verbose=True):
+    """
+    检索与用户消息相关的记忆并格式化为上下文
+    
+    Args:
+        retriever: MemoryRetriever 实例
+        user_message (str): 用户消息
+        top_k (int): 返回结果数量
+        namespace (str, optional): 只检索该命名空间的记忆
+        verbose (bool): 是否打印检索过程与相关度最高的记忆；服务端不应把记忆内容输出到标准输出
+        
+    Returns:
+        str: 记忆上下文，未检索到或检索失败时为空字符串
+    """
+    try:
+        if verbose:
+            print("🔎 正在检索相关记忆...")
+        results, scores = retriever.search(user_message, top_k, namespace=namespace)
+        
+        if results:
+            if verbose:
+                print(f"🔍 找到 {len(results)} 条相关记忆")
+                # 可以选择性地显示检索到的部分记忆
+                print(f"📚 相关度最高的记忆: {results[0][:50]}...")
+            return retriever.format_search_results(user_message, results, scores)
+        
+        if verbose:
+            print("📭 未找到相关记忆")
+    except Exception as e:
+        print(f"❗ 记忆检索失败: {e}")
+    return ""
+
 
 class Session:
     def __init__(self, llm_client, config):
@@ -42,7 +84,16 @@ class Session:
         
         # 创建管理器
         self.memory_manager = MemoryManager(llm_client, self.memory_queue, self.response_queue, self.embedder)
-        self.response_manager = ResponseManager(llm_client, config)
+        self.journal = None
+        if getattr(config, 'HISTORY_JOURNAL_ENABLED', False):
+            self.journal = HistoryJournal(
+                config.HISTORY_JOURNAL_FILE,
+                max_bytes=getattr(config, 'HISTORY_JOURNAL_MAX_BYTES', 8 * 1024 * 1024),
+                compress_rotated=getattr(config, 'HISTORY_JOURNAL_COMPRESS', True)
+            )
+        self.response_manager = ResponseManager(llm_client, config, self.journal)
+        if self.journal:
+            self.response_manager.restore_from_journal()
         
         # 会话状态
         self.system_message = None
@@ -56,7 +107,21 @@ class Session:
         self.memory_thread = None
         
         # 初始化函数注册中心
-        self.function_registry = FunctionRegistry()
+        self.function_registry = FunctionRegistry(
+            max_workers=getattr(config, 'TOOL_MAX_WORKERS', 8),
+            process_workers=getattr(config, 'TOOL_PROCESS_WORKERS', 2)
+        )
+        self.tool_loop = ToolLoop.from_config(llm_client, self.function_registry, config)
+        # 工具较多时按与用户消息的相关度只携带部分定义（复用记忆检索的嵌入模型）
+        self.tool_selector = ToolSelector.from_config(
+            self.function_registry, config, encoder=self.embedder if self.embedder and self.embedder.model else None
+        )
+        
+        # 每轮的历史组装、记忆检索与工具选择并发执行，各阶段超时后使用兜底值
+        self.pipeline = TurnPipeline.from_config(config)
+        self.last_turn_timings = None
+        self.last_turn_status = None
+        self.registry = get_registry()
         
     def start(self):
         """启动会话，包括记忆处理线程"""
@@ -64,6 +129,10 @@ class Session:
             return
             
         self.running = True
+        # 仪表注册在进程共享的注册表上，stop() 时移除，不让注册表持有已停止的会话
+        self.registry.gauge_function("memory_queue_depth", self.memory_queue.qsize)
+        if self.embedder:
+            self.registry.gauge_function("vector_index_size", self.embedder.size)
         self.memory_thread = threading.Thread(target=self._memory_processor)
         self.memory_thread.daemon = True  # 守护线程，主线程结束时自动退出
         self.memory_thread.start()
@@ -71,130 +140,72 @@ class Session:
     def stop(self):
         """停止会话及相关线程"""
         self.running = False
+        self.registry.remove_gauge("memory_queue_depth")
+        self.registry.remove_gauge("vector_index_size")
+        # 本会话排队中的后台请求（记忆判断、提取）已无必要继续等待，调度器可能被其他会话共享
+        scheduler = getattr(self.llm_client, 'scheduler', None)
+        if scheduler is not None:
+            scheduler.cancel(owner=self)
         if self.memory_thread:
             self.memory_thread.join(timeout=1.0)
+        if self.journal:
+            self.journal.close()
     
-    def process_message(self, user_message):
+    def _turn_stages(self, user_message):
         """
-        处理用户消息，生成回复 - 采用简化的函数调用流程
+        本轮的准备阶段：{阶段名: (函数, 兜底值)}，由 TurnPipeline 并发执行
+        
+        检索超时或失败时按没有记忆上下文作答；工具选择超时时携带全部工具定义。
         """
+        stages = {
+            "tools": (lambda: self.tool_selector.select(user_message),
+                      self.function_registry.get_function_definitions()),
+        }
         # 获取上下文历史（如果启用）
-        history_messages = None
         if self.enable_memory:
-            history_messages = self.response_manager.get_history_messages()
-        
+            stages["history"] = (self.response_manager.get_history_messages, None)
         # 检索相关记忆（如果启用向量检索）
-        memory_context = ""
         if self.retriever and self.config.VECTOR_SEARCH_ENABLED:
-            try:
-                print("🔎 正在检索相关记忆...")
-                results, scores = self.memory_manager.query_memories(
-                    user_message, 
-                    self.retriever, 
-                    self.config.TOP_K
-                )
-                
-                if results:
-                    memory_context = self.retriever.format_search_results(
-                        user_message, results, scores
-                    )
-                    print(f"🔍 找到 {len(results)} 条相关记忆")
-                    # 可以选择性地显示检索到的部分记忆
-                    if len(results) > 0:
-                        print(f"📚 相关度最高的记忆: {results[0][:50]}...")
-                else:
-                    print("📭 未找到相关记忆")
-            except Exception as e:
-                print(f"❗ 记忆检索失败: {e}")
+            stages["retrieval"] = (
+                lambda: retrieve_memory_context(self.retriever, user_message, self.config.TOP_K), ""
+            )
+        return stages
+    
+    def _prepare_turn(self, user_message):
+        """
+        构建本轮请求的上下文：对话历史、检索到的记忆与本轮携带的工具定义
+        
+        Args:
+            user_message (str): 用户消息
+            
+        Returns:
+            tuple: (历史消息列表或None, 附加了记忆上下文的用户消息, 函数定义列表, TurnTimings)
+        """
+        results, timings = self.pipeline.run(self._turn_stages(user_message))
         
         # 添加记忆上下文到用户消息
         enhanced_message = user_message
+        memory_context = results.get("retrieval")
         if memory_context:
             enhanced_message = memory_context + "\n\n" + user_message
         
-        # 获取函数定义
-        function_definitions = self.function_registry.get_function_definitions()
-        
-        if function_definitions:
-            print("🔧 正在分析是否需要调用工具函数...")
-            
-            # 生成回复（使用函数调用能力）
-            response_data = self.llm_client.ask_with_functions(
-                prompt=enhanced_message,
-                functions=function_definitions,
-                model=self.model,
-                system_message=self.system_message,
-                history_messages=history_messages
-            )
-            
-            # 检查是否有函数调用
-            if response_data.get("has_function_call", False):
-                function_call = response_data["function_call"]
-                function_name = function_call["name"]
-                arguments = function_call["arguments"]
-                
-                print(f"🔧 需要调用函数: {function_name}")
-                print(f"📋 参数: {json.dumps(arguments, ensure_ascii=False)}")
-                
-                try:
-                    # 执行函数
-                    print(f"⚙️ 正在执行函数...")
-                    function_result = self.function_registry.execute_function(function_name, arguments)
-                    print(f"✅ 函数执行完成")
-                    
-                    # 特殊处理天气查询等直接响应的功能
-                    if function_name == "get_weather":
-                        weather = function_result
-                        response = (
-                            f"我查到了{weather.get('city', '该城市')}的天气！"
-                            f"现在是{weather.get('weather', '未知天气')}，温度{weather.get('temperature', '未知')}℃，"
-                            f"湿度{weather.get('humidity', '未知')}%，{weather.get('winddirection', '未知')}风"
-                            f"{weather.get('windpower', '未知')}级。"
-                        )
-                    else:
-                        # 将函数结果内嵌到提示中，直接生成回复
-                        result_prompt = (
-                            f"{user_message}\n\n"
-                            f"函数 {function_name} 已执行，返回结果:\n"
-                            f"{json.dumps(function_result, ensure_ascii=False, indent=2)}\n\n"
-                            f"请基于以上结果回答用户的问题。"
-                        )
-                        
-                        response = self.llm_client.ask(
-                            prompt=result_prompt,
-                            model=self.model,
-                            system_message=self.system_message
-                        )
-                    
-                    # 保存对话记录
-                    self.response_manager.add_exchange(user_message, response)
-                    
-                    # 自动记忆处理
-                    if self.auto_memory:
-                        self.memory_queue.put({
-                            "type": "analyze",
-                            "content": user_message,
-                            "timestamp": time.time()
-                        })
-                    
-                    return response
-                    
-                except Exception as e:
-                    error_msg = f"函数执行失败: {str(e)}"
-                    print(f"❌ {error_msg}")
-                    return error_msg
-            else:
-                # 无函数调用，正常处理
-                response = response_data["content"]
-        else:
-            # 没有可用函数，使用普通模式
-            response = self.llm_client.ask(
-                prompt=enhanced_message,
-                model=self.model,
-                system_message=self.system_message,
-                history_messages=history_messages
-            )
+        return results.get("history"), enhanced_message, results["tools"], timings
+    
+    def _finish_timings(self, timings, llm_start, status="ok"):
+        """记录模型阶段与整轮耗时，并计入 turns_total{status}"""
+        self.registry.inc("turns_total", status=status)
+        self.last_turn_status = status
+        timings.record("llm", time.monotonic() - llm_start)
+        self.last_turn_timings = timings.finish()
+    
+    def _complete_turn(self, user_message, response):
+        """
+        保存对话记录并提交自动记忆任务
         
+        Args:
+            user_message (str): 用户消息
+            response (str): 助手回复
+        """
         # 保存对话记录
         self.response_manager.add_exchange(user_message, response)
         
@@ -203,13 +214,117 @@ class Session:
             self.memory_queue.put({
                 "type": "analyze",
                 "content": user_message,
-                "timestamp": time.time()
+                "timestamp": time.time(),
+                # 记忆线程中的 span 以本轮为父
+                "trace": get_tracer().current_span()
             })
+    
+    def process_message(self, user_message):
+        """
+        处理用户消息，生成回复
+        
+        有可用函数时进入多步工具调用循环，每一步都复用同一个包含历史与记忆上下文的消息列表。
+        LLM 请求失败时返回错误提示，但不会写入对话历史，也不会提交记忆分析。
+        """
+        with span("turn", stream=False):
+            return self._respond(user_message)
+    
+    def _respond(self, user_message):
+        """process_message 的实现，在本轮的追踪 span 内运行"""
+        history_messages, enhanced_message, function_definitions, timings = self._prepare_turn(user_message)
+        llm_start = time.monotonic()
+        status = "ok"
         
+        try:
+            if function_definitions:
+                print("🔧 正在分析是否需要调用工具函数...")
+                messages = build_messages(enhanced_message, self.system_message, history_messages)
+                result = self.tool_loop.run(messages, function_definitions, model=self.model)
+                response = result["content"]
+            else:
+                # 没有可用函数，使用普通模式
+                response = self.llm_client.ask(
+                    prompt=enhanced_message,
+                    model=self.model,
+                    system_message=self.system_message,
+                    history_messages=history_messages
+                )
+        except LLMError as e:
+            status = "error"
+            error_msg = f"请求出错: {str(e)}"
+            print(f"❌ {error_msg}")
+            return error_msg
+        except BaseException as e:
+            status = "error" if isinstance(e, Exception) else "aborted"
+            raise
+        finally:
+            self._finish_timings(timings, llm_start, status)
+        
+        self._complete_turn(user_message, response)
         return response
     
+    def process_message_stream(self, user_message):
+        """
+        流式处理用户消息，回复内容生成后立即逐段产出
+        
+        Args:
+            user_message (str): 用户消息
+            
+        Yields:
+            str: 增量回复文本
+        """
+        # 本轮 span 跨越 yield，只在生成器每次恢复执行时作为当前 span
+        yield from trace_iter(span("turn", stream=True), self._respond_stream(user_message))
+    
+    def _respond_stream(self, user_message):
+        """process_message_stream 的实现，在本轮的追踪 span 内运行"""
+        history_messages, enhanced_message, function_definitions, timings = self._prepare_turn(user_message)
+        llm_start = time.monotonic()
+        status = "ok"
+        chunks = []
+        
+        try:
+            if function_definitions:
+                print("🔧 正在分析是否需要调用工具函数...")
+                messages = build_messages(enhanced_message, self.system_message, history_messages)
+                for event in self.tool_loop.run_stream(messages, function_definitions, model=self.model):
+                    if event["type"] == "content":
+                        chunks.append(event["content"])
+                        yield event["content"]
+                    elif event["type"] == "tool_step":
+                        # 工具调用前模型可能已输出过渡文字，回复以最后一步的回答为准
+                        chunks = []
+            else:
+                for text in self.llm_client.ask(
+                    prompt=enhanced_message,
+                    model=self.model,
+                    system_message=self.system_message,
+                    history_messages=history_messages,
+                    stream=True
+                ):
+                    chunks.append(text)
+                    yield text
+        except LLMError as e:
+            status = "error"
+            error_msg = f"请求出错: {str(e)}"
+            print(f"\n❌ {error_msg}")
+            yield error_msg
+            return
+        except BaseException as e:
+            # 生成器被提前关闭（客户端断开）或任务被取消时记为 aborted，其余未预期异常记为 error
+            status = "error" if isinstance(e, Exception) else "aborted"
+            raise
+        finally:
+            self._finish_timings(timings, llm_start, status)
+        
+        self._complete_turn(user_message, "".join(chunks))
+    
     def _memory_processor(self):
-        """记忆处理线程的主循环"""
+        """记忆处理线程的主循环，线程中发出的请求归属于本会话"""
+        with request_owner(self):
+            self._process_memory_tasks()
+    
+    def _process_memory_tasks(self):
         while self.running:
             try:
                 # 非阻塞方式获取任务，超时后检查running状态
@@ -221,16 +336,17 @@ class Session:
                 # 处理不同类型的记忆任务
                 if task["type"] == "analyze":
                     # 分析内容是否需要记忆
-                    print("\n🔄 后台正在分析对话内容...")
-                    if self.memory_manager.should_remember(task["content"]):
-                        print("🧠 检测到重要信息，开始提取记忆...")
-                        success = self.memory_manager.extract_memory(task["content"])
-                        if success:
-                            print("✅ 记忆提取和存储完成")
+                    with span("memory.analyze", parent=task.get("trace")):
+                        print("\n🔄 后台正在分析对话内容...")
+                        if self.memory_manager.should_remember(task["content"]):
+                            print("🧠 检测到重要信息，开始提取记忆...")
+                            success = self.memory_manager.extract_memory(task["content"])
+                            if success:
+                                print("✅ 记忆提取和存储完成")
+                            else:
+                                print("⚠️ 记忆提取流程完成，但未提取到有效记忆")
                         else:
-                            print("⚠️ 记忆提取流程完成，但未提取到有效记忆")
-                    else:
-                        print("📝 分析完成，此内容无需记忆")
+                            print("📝 分析完成，此内容无需记忆")
                 
                 # 标记任务完成
                 self.memory_queue.task_done()
@@ -278,6 +394,6 @@ class Session:
         """开关向量检索功能"""
         self.config.VECTOR_SEARCH_ENABLED = enable
 
-    def register_function(self, func, name=None, description=None, parameters=None):
-        """注册一个可调用的函数"""
-        self.function_registry.register(func, name, description, parameters)
\ No newline at end of file
+    def register_function(self, func, name=None, description=None, parameters=None, **options):
+        """注册一个可调用的函数，options 为执行策略（timeout、max_concurrency、memoize、isolation）"""
+        self.function_registry.register(func, name, description, parameters, **options)
\ No newline at end of file
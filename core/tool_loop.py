@@ -0,0 +1,358 @@
+"""
+工具调用循环模块 - 模型 → 工具 → 模型，多步执行，受步数与总耗时预算约束
+"""
+import asyncio
+from contextlib import aclosing
+import inspect
+import json
+import time
+from model.tool_calls import tool_result_messages
+from observability.metrics import get_registry
+from observability.tracing import span
+
+
+class ToolLoop:
+    """
+    多步工具调用循环
+
+    每一步把完整的消息列表连同工具定义发给模型；模型返回工具调用时并发执行，
+    把 assistant 调用消息和 tool 结果消息追加到同一个列表后进入下一步；模型
+    直接回答时提前结束。步数用尽或剩余时间只够生成回答时，最后一次请求不再
+    提供工具，强制模型基于已有结果作答。
+    """
+
+    def __init__(self, llm_client, function_registry, max_steps=4, time_budget=90.0,
+                 step_timeout=60.0, tool_timeout=30.0, answer_reserve=15.0):
+        """
+        初始化工具调用循环
+
+        Args:
+            llm_client: GrokClient 实例
+            function_registry: FunctionRegistry 实例
+            max_steps (int): 最多允许的工具调用轮数
+            time_budget (float): 整个循环的总耗时预算（秒）
+            step_timeout (float): 单次模型请求的超时上限（秒）
+            tool_timeout (float): 单个工具的超时上限（秒）
+            answer_reserve (float): 为最终回答预留的时间（秒），剩余时间不足时停止调用工具
+        """
+        self.llm_client = llm_client
+        self.function_registry = function_registry
+        self.max_steps = max_steps
+        self.time_budget = time_budget
+        self.step_timeout = step_timeout
+        self.tool_timeout = tool_timeout
+        self.answer_reserve = answer_reserve
+
+    @classmethod
+    def from_config(cls, llm_client, function_registry, config):
+        """根据配置对象创建"""
+        return cls(
+            llm_client,
+            function_registry,
+            max_steps=getattr(config, 'TOOL_LOOP_MAX_STEPS', 4),
+            time_budget=getattr(config, 'TOOL_LOOP_BUDGET', 90.0),
+            step_timeout=getattr(config, 'TOOL_LOOP_STEP_TIMEOUT', 60.0),
+            tool_timeout=getattr(config, 'TOOL_TIMEOUT', 30.0),
+            answer_reserve=getattr(config, 'TOOL_LOOP_ANSWER_RESERVE', 15.0),
+        )
+
+    def _step_timeout(self, deadline):
+        """本步模型请求的超时：不超过单步上限，也不超过总预算的剩余时间"""
+        return max(1.0, min(self.step_timeout, deadline - time.monotonic()))
+
+    def _can_use_tools(self, step, deadline):
+        """是否还允许进入一轮工具调用"""
+        return step < self.max_steps and deadline - time.monotonic() > self.answer_reserve
+
+    def _tool_timeout(self, deadline):
+        """
+        本轮工具的超时：不超过单个工具上限，也不占用为回答预留的时间
+
+        Returns:
+            float | None: 超时秒数；模型请求已耗尽工具可用的时间时返回 None，本轮工具不再执行
+        """
+        remaining = deadline - time.monotonic() - self.answer_reserve
+        if remaining <= 0:
+            return None
+        return max(1.0, min(self.tool_timeout, remaining))
+
+    @staticmethod
+    def _call_site(steps):
+        """首次请求记为 chat，带着工具结果的后续请求记为 tool-followup"""
+        return "tool-followup" if steps else "chat"
+
+    def _stop_reason(self, steps, use_tools):
+        """最后一步的结束原因：answered / max_steps / time_budget"""
+        if use_tools:
+            return "answered"
+        return "max_steps" if len(steps) > self.max_steps else "time_budget"
+
+    @staticmethod
+    def _announce(tool_calls):
+        for call in tool_calls:
+            print(f"🔧 需要调用函数: {call['name']}")
+            print(f"📋 参数: {json.dumps(call['arguments'], ensure_ascii=False)}")
+        print(f"⚙️ 正在执行 {len(tool_calls)} 个函数...")
+
+    @staticmethod
+    def _report(results):
+        for result in results:
+            if "error" in result:
+                print(f"❌ 函数 {result['name']} 执行失败: {result['error']}")
+        print(f"✅ 函数执行完成")
+
+    def _execute_tools(self, response, messages, timeout):
+        """执行一轮工具调用，并把调用与结果追加到消息列表"""
+        tool_calls = response["tool_calls"]
+        self._announce(tool_calls)
+        results = self.function_registry.execute_tool_calls(tool_calls, timeout=timeout)
+        self._report(results)
+        messages.append(response["message"])
+        messages.extend(tool_result_messages(results))
+        return [call["name"] for call in tool_calls]
+
+    def run(self, messages, tools, model=None):
+        """
+        执行工具调用循环
+
+        Args:
+            messages (list): 已构建好的消息列表，循环中会原地追加
+            tools (list): 工具定义
+            model (str, optional): 使用的模型名称
+
+        Returns:
+            dict: {"content": 最终回答, "steps": 每步耗时与调用的工具, "elapsed": 总耗时, "stop_reason": 结束原因}
+                  结束原因为 answered（模型直接作答）、max_steps 或 time_budget
+
+        Raises:
+            LLMError: 模型请求失败
+        """
+        start = time.monotonic()
+        deadline = start + self.time_budget
+        steps = []
+
+        while True:
+            use_tools = self._can_use_tools(len(steps), deadline)
+            step_start = time.monotonic()
+            response = self.llm_client.chat(
+                messages,
+                model=model,
+                tools=tools if use_tools else None,
+                timeout=self._step_timeout(deadline),
+                call_site=self._call_site(steps)
+            )
+            step = {"step": len(steps) + 1, "llm_time": time.monotonic() - step_start, "tools": []}
+            steps.append(step)
+
+            if not response["has_function_call"]:
+                return {
+                    "content": response["content"],
+                    "steps": steps,
+                    "elapsed": time.monotonic() - start,
+                    "stop_reason": self._stop_reason(steps, use_tools),
+                }
+
+            timeout = self._tool_timeout(deadline)
+            if timeout is None:
+                # 模型请求用掉了工具的时间，不执行本轮工具，下一步不带工具直接作答
+                step["skipped_tools"] = [call["name"] for call in response["tool_calls"]]
+                continue
+            tool_start = time.monotonic()
+            step["tools"] = self._execute_tools(response, messages, timeout)
+            step["tool_time"] = time.monotonic() - tool_start
+
+    def run_stream(self, messages, tools, model=None):
+        """
+        流式执行工具调用循环
+
+        Yields:
+            dict: {"type": "content", "content": 文本} 增量事件；
+                  每轮工具调用开始前产出 {"type": "tool_step", "tools": 函数名列表}，
+                  剩余时间不足、跳过本轮工具时 tools 为空；
+                  最后产出 {"type": "result", ...}，字段同 run() 的返回值
+
+        Raises:
+            LLMError: 模型请求失败
+        """
+        start = time.monotonic()
+        deadline = start + self.time_budget
+        steps = []
+
+        while True:
+            use_tools = self._can_use_tools(len(steps), deadline)
+            step_start = time.monotonic()
+            response = {}
+            for event in self.llm_client.chat(
+                messages,
+                model=model,
+                tools=tools if use_tools else None,
+                stream=True,
+                timeout=self._step_timeout(deadline),
+                call_site=self._call_site(steps)
+            ):
+                if event["type"] == "content":
+                    yield event
+                else:
+                    response = event
+            step = {"step": len(steps) + 1, "llm_time": time.monotonic() - step_start, "tools": []}
+            steps.append(step)
+
+            if not response.get("has_function_call"):
+                yield {
+                    "type": "result",
+                    "content": response.get("content", ""),
+                    "steps": steps,
+                    "elapsed": time.monotonic() - start,
+                    "stop_reason": self._stop_reason(steps, use_tools),
+                }
+                return
+
+            timeout = self._tool_timeout(deadline)
+            if timeout is None:
+                # 仍产出 tool_step（tools 为空），调用方据此丢弃本步的过渡文字
+                step["skipped_tools"] = [call["name"] for call in response["tool_calls"]]
+                yield {"type": "tool_step", "tools": []}
+                continue
+            yield {"type": "tool_step", "tools": [call["name"] for call in response["tool_calls"]]}
+            tool_start = time.monotonic()
+            step["tools"] = self._execute_tools(response, messages, timeout)
+            step["tool_time"] = time.monotonic() - tool_start
+
+
+class AsyncToolLoop(ToolLoop):
+    """
+    ToolLoop 的 asyncio 版本，llm_client 为 AsyncGrokClient
+
+    协程工具直接等待，同步工具交给注册中心的执行引擎，在事件循环中等待其结果。
+    """
+
+    @staticmethod
+    async def _traced(name, coroutine):
+        """执行协程工具，计入 tool_calls_total{tool,status}（超时取消时 status 为 timeout）"""
+        status = "error"
+        try:
+            with span("tool.execute", tool=name, isolation="coroutine"):
+                result = await coroutine
+            status = "ok"
+            return result
+        except asyncio.CancelledError:
+            status = "timeout"
+            raise
+        finally:
+            get_registry().inc("tool_calls_total", tool=name, status=status)
+
+    async def _execute_tool_call(self, call, timeout):
+        """执行单个工具调用，返回格式同 FunctionRegistry.execute_tool_calls 的单项"""
+        result = {"id": call["id"], "name": call["name"]}
+        if "error" in call:
+            result["error"] = call["error"]
+            return result
+
+        func = self.function_registry.get_function(call["name"])
+        try:
+            if inspect.iscoroutinefunction(func):
+                self.function_registry.validate(call["name"], call["arguments"])
+                timeout = self.function_registry.functions[call["name"]]["policy"].effective_timeout(timeout)
+                awaitable = self._traced(call["name"], func(**call["arguments"]))
+            else:
+                future, timeout = self.function_registry.submit(call["name"], call["arguments"], timeout)
+                awaitable = asyncio.wrap_future(future)
+            result["result"] = await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            get_registry().inc("tool_caller_timeouts_total", tool=call["name"])
+            result["error"] = f"执行函数 '{call['name']}' 超时（{timeout}秒）"
+        except Exception as e:
+            result["error"] = str(e)
+        return result
+
+    async def _execute_tools(self, response, messages, timeout):
+        tool_calls = response["tool_calls"]
+        self._announce(tool_calls)
+        results = await asyncio.gather(*(self._execute_tool_call(call, timeout) for call in tool_calls))
+        self._report(results)
+        messages.append(response["message"])
+        messages.extend(tool_result_messages(results))
+        return [call["name"] for call in tool_calls]
+
+    async def run(self, messages, tools, model=None):
+        """异步执行工具调用循环，参数与返回值同 ToolLoop.run"""
+        start = time.monotonic()
+        deadline = start + self.time_budget
+        steps = []
+
+        while True:
+            use_tools = self._can_use_tools(len(steps), deadline)
+            step_start = time.monotonic()
+            response = await self.llm_client.chat(
+                messages,
+                model=model,
+                tools=tools if use_tools else None,
+                timeout=self._step_timeout(deadline),
+                call_site=self._call_site(steps)
+            )
+            step = {"step": len(steps) + 1, "llm_time": time.monotonic() - step_start, "tools": []}
+            steps.append(step)
+
+            if not response["has_function_call"]:
+                return {
+                    "content": response["content"],
+                    "steps": steps,
+                    "elapsed": time.monotonic() - start,
+                    "stop_reason": self._stop_reason(steps, use_tools),
+                }
+
+            timeout = self._tool_timeout(deadline)
+            if timeout is None:
+                step["skipped_tools"] = [call["name"] for call in response["tool_calls"]]
+                continue
+            tool_start = time.monotonic()
+            step["tools"] = await self._execute_tools(response, messages, timeout)
+            step["tool_time"] = time.monotonic() - tool_start
+
+    async def run_stream(self, messages, tools, model=None):
+        """异步流式执行工具调用循环，事件格式同 ToolLoop.run_stream"""
+        start = time.monotonic()
+        deadline = start + self.time_budget
+        steps = []
+
+        while True:
+            use_tools = self._can_use_tools(len(steps), deadline)
+            step_start = time.monotonic()
+            response = {}
+            events = await self.llm_client.chat(
+                messages,
+                model=model,
+                tools=tools if use_tools else None,
+                stream=True,
+                timeout=self._step_timeout(deadline),
+                call_site=self._call_site(steps)
+            )
+            # 异步生成器不会随外层关闭而关闭，显式关闭以便提前结束时立即释放连接
+            async with aclosing(events):
+                async for event in events:
+                    if event["type"] == "content":
+                        yield event
+                    else:
+                        response = event
+            step = {"step": len(steps) + 1, "llm_time": time.monotonic() - step_start, "tools": []}
+            steps.append(step)
+
+            if not response.get("has_function_call"):
+                yield {
+                    "type": "result",
+                    "content": response.get("content", ""),
+                    "steps": steps,
+                    "elapsed": time.monotonic() - start,
+                    "stop_reason": self._stop_reason(steps, use_tools),
+                }
+                return
+
+            timeout = self._tool_timeout(deadline)
+            if timeout is None:
+                step["skipped_tools"] = [call["name"] for call in response["tool_calls"]]
+                yield {"type": "tool_step", "tools": []}
+                continue
+            yield {"type": "tool_step", "tools": [call["name"] for call in response["tool_calls"]]}
+            tool_start = time.monotonic()
+            step["tools"] = await self._execute_tools(response, messages, timeout)
+            step["tool_time"] = time.monotonic() - tool_start
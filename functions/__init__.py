@@ -1,7 +1,33 @@
 """
 函数调用模块 - 包含可被大模型调用的各类工具函数
+
+导出项按需导入，python -m functions.weather 等只加载用到的模块
 """
-from .function_registry import FunctionRegistry
-from .weather import get_weather
+import importlib
+
+# 导出名 -> 所在子模块，首次访问时才导入（PEP 562）
+_EXPORTS = {
+    'FunctionRegistry': '.function_registry',
+    'ToolSelector': '.tool_selector',
+    'ToolError': '.errors',
+    'ToolArgumentError': '.errors',
+    'ToolTimeoutError': '.errors',
+    'ToolExecutionError': '.errors',
+    'get_weather': '.weather',
+    'weather_tool': '.weather',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
 
-__all__ = ['FunctionRegistry', 'get_weather']
\ No newline at end of file
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
\ No newline at end of file
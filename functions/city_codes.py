@@ -0,0 +1,99 @@
+"""
+常用城市的高德行政区编码（adcode）与别名
+"""
+
+# 城市名 → adcode
+CITY_ADCODES = {
+    "北京": "110000",
+    "天津": "120000",
+    "上海": "310000",
+    "重庆": "500000",
+    "石家庄": "130100",
+    "太原": "140100",
+    "呼和浩特": "150100",
+    "沈阳": "210100",
+    "大连": "210200",
+    "长春": "220100",
+    "哈尔滨": "230100",
+    "南京": "320100",
+    "无锡": "320200",
+    "苏州": "320500",
+    "杭州": "330100",
+    "宁波": "330200",
+    "合肥": "340100",
+    "福州": "350100",
+    "厦门": "350200",
+    "南昌": "360100",
+    "济南": "370100",
+    "青岛": "370200",
+    "郑州": "410100",
+    "武汉": "420100",
+    "长沙": "430100",
+    "广州": "440100",
+    "深圳": "440300",
+    "珠海": "440400",
+    "佛山": "440600",
+    "东莞": "441900",
+    "南宁": "450100",
+    "海口": "460100",
+    "三亚": "460200",
+    "成都": "510100",
+    "贵阳": "520100",
+    "昆明": "530100",
+    "拉萨": "540100",
+    "西安": "610100",
+    "兰州": "620100",
+    "西宁": "630100",
+    "银川": "640100",
+    "乌鲁木齐": "650100",
+    "香港": "810000",
+    "澳门": "820000",
+}
+
+# 别名（简称、拼音、英文名）→ 标准城市名
+CITY_ALIASES = {
+    "京": "北京", "beijing": "北京", "peking": "北京",
+    "津": "天津", "tianjin": "天津",
+    "沪": "上海", "申": "上海", "shanghai": "上海",
+    "渝": "重庆", "chongqing": "重庆",
+    "shijiazhuang": "石家庄",
+    "taiyuan": "太原",
+    "huhehaote": "呼和浩特", "hohhot": "呼和浩特",
+    "shenyang": "沈阳",
+    "dalian": "大连",
+    "changchun": "长春",
+    "haerbin": "哈尔滨", "harbin": "哈尔滨",
+    "金陵": "南京", "nanjing": "南京",
+    "wuxi": "无锡",
+    "姑苏": "苏州", "suzhou": "苏州",
+    "hangzhou": "杭州",
+    "甬": "宁波", "ningbo": "宁波",
+    "hefei": "合肥",
+    "榕城": "福州", "fuzhou": "福州",
+    "鹭岛": "厦门", "xiamen": "厦门",
+    "nanchang": "南昌",
+    "泉城": "济南", "jinan": "济南",
+    "qingdao": "青岛",
+    "zhengzhou": "郑州",
+    "江城": "武汉", "wuhan": "武汉",
+    "星城": "长沙", "changsha": "长沙",
+    "羊城": "广州", "穗": "广州", "guangzhou": "广州", "canton": "广州",
+    "鹏城": "深圳", "shenzhen": "深圳",
+    "zhuhai": "珠海",
+    "foshan": "佛山",
+    "dongguan": "东莞",
+    "绿城": "南宁", "nanning": "南宁",
+    "haikou": "海口",
+    "sanya": "三亚",
+    "蓉城": "成都", "蓉": "成都", "chengdu": "成都",
+    "筑": "贵阳", "guiyang": "贵阳",
+    "春城": "昆明", "kunming": "昆明",
+    "lasa": "拉萨", "lhasa": "拉萨",
+    "长安": "西安", "xian": "西安", "xi'an": "西安",
+    "lanzhou": "兰州",
+    "xining": "西宁",
+    "yinchuan": "银川",
+    "wulumuqi": "乌鲁木齐", "urumqi": "乌鲁木齐",
+    "hongkong": "香港", "hong kong": "香港",
+    "macau": "澳门", "macao": "澳门",
+}
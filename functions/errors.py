@@ -0,0 +1,27 @@
+"""
+工具函数调用异常类型
+"""
+
+
+class ToolError(Exception):
+    """工具调用失败的基类"""
+
+
+class ToolNotFoundError(ToolError, ValueError):
+    """调用了未注册的函数"""
+
+
+class ToolArgumentError(ToolError):
+    """参数不符合注册时的参数描述"""
+
+
+class ToolTimeoutError(ToolError):
+    """函数执行超时"""
+
+
+class ToolExecutionError(ToolError):
+    """函数执行中抛出异常"""
+
+    def __init__(self, message, cause=None):
+        super().__init__(message)
+        self.cause = cause
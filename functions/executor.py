@@ -0,0 +1,317 @@
+"""
+工具执行引擎 - 在线程池或进程池中执行工具函数，支持超时、并发上限与结果缓存
+"""
+import json
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from observability.metrics import get_registry
+from observability.tracing import get_tracer
+from .errors import ToolTimeoutError, ToolExecutionError
+
+
+def _call(func, arguments):
+    """进程池中执行的入口（需可被 pickle）"""
+    return func(**arguments)
+
+
+class ToolPolicy:
+    """单个函数的执行策略，在 register 时创建"""
+
+    def __init__(self, timeout=None, max_concurrency=None, memoize=None, isolation="thread", memo_max_entries=128):
+        """
+        Args:
+            timeout (float, optional): 执行超时（秒），None 表示使用调用方给出的超时
+            max_concurrency (int, optional): 同时执行的上限，None 表示不限
+            memoize (bool or float, optional): 是否按参数缓存结果；为数字时表示缓存秒数
+            isolation (str): thread（线程池）或 process（进程池，可在超时后终止，函数需可被 pickle）
+            memo_max_entries (int): 每个函数最多缓存的结果数
+        """
+        if isolation not in ("thread", "process"):
+            raise ValueError(f"未知的执行方式: {isolation}")
+        self.timeout = timeout
+        self.isolation = isolation
+        self.max_concurrency = max_concurrency
+        self._running = 0
+        self._waiting = deque()
+        self._slot_lock = threading.Lock()
+        self.memo_ttl = None if memoize is True else memoize
+        self.memoize = bool(memoize)
+        self.memo_max_entries = memo_max_entries
+        self._memo = OrderedDict()
+        self._memo_lock = threading.Lock()
+
+    @staticmethod
+    def memo_key(arguments):
+        return json.dumps(arguments, sort_keys=True, ensure_ascii=False, default=str)
+
+    def cached(self, key):
+        """读取未过期的缓存结果，返回 (是否命中, 结果)"""
+        with self._memo_lock:
+            entry = self._memo.get(key)
+            if entry is None:
+                return False, None
+            expires_at, result = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._memo[key]
+                return False, None
+            self._memo.move_to_end(key)
+            return True, result
+
+    def remember(self, key, result):
+        expires_at = time.monotonic() + self.memo_ttl if self.memo_ttl else None
+        with self._memo_lock:
+            self._memo[key] = (expires_at, result)
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.memo_max_entries:
+                self._memo.popitem(last=False)
+
+    def admit(self, job):
+        """
+        占用一个并发名额；名额已满时把 job 放入等待队列，由 release() 转交
+
+        Returns:
+            bool: 是否立即获得名额
+        """
+        with self._slot_lock:
+            if self.max_concurrency is None or self._running < self.max_concurrency:
+                self._running += 1
+                return True
+            self._waiting.append(job)
+            return False
+
+    def release(self):
+        """
+        释放一个名额；有等待中的任务时名额直接转交给最早的一个
+
+        Returns:
+            job or None: 获得名额的等待任务
+        """
+        with self._slot_lock:
+            if self._waiting:
+                return self._waiting.popleft()
+            self._running -= 1
+            return None
+
+    def effective_timeout(self, timeout):
+        """函数自身的超时与调用方超时中较小者"""
+        values = [value for value in (self.timeout, timeout) if value is not None]
+        return min(values) if values else None
+
+
+class _Job:
+    """一次待执行的调用，Future 在提交时即返回给调用方"""
+
+    def __init__(self, name, func, policy, arguments, deadline, parent):
+        self.future = Future()
+        self.name = name
+        self.func = func
+        self.policy = policy
+        self.arguments = arguments
+        self.deadline = deadline
+        self.parent = parent
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+
+class _ProcessPool:
+    """
+    进程池及其在途任务
+
+    有任务超时后进程池退役：新任务改用新建的进程池，退役池中其余在途任务
+    照常执行完，只剩超时的任务时才终止工作进程。
+    """
+
+    def __init__(self, max_workers):
+        self.executor = ProcessPoolExecutor(max_workers=max_workers)
+        self._pending = set()
+        self._stuck = set()
+        self._retired = False
+        self._terminated = False
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        future = self.executor.submit(fn, *args)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+            self._stuck.discard(future)
+            idle = self._retired and self._pending <= self._stuck
+        if idle:
+            self.terminate()
+
+    def retire(self, stuck):
+        """标记超时的任务并退役，其余在途任务都结束后终止工作进程"""
+        with self._lock:
+            self._retired = True
+            self._stuck.add(stuck)
+            idle = self._pending <= self._stuck
+        if idle:
+            self.terminate()
+
+    def terminate(self):
+        with self._lock:
+            if self._terminated:
+                return
+            self._terminated = True
+        # ProcessPoolExecutor 没有公开的终止接口，直接结束工作进程
+        for process in list((getattr(self.executor, "_processes", None) or {}).values()):
+            process.terminate()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ToolExecutor:
+    """
+    工具执行引擎
+
+    调用在线程池中执行，不阻塞请求线程；isolation="process" 的函数再转交进程池。
+    有并发上限的函数在提交时占用名额，名额已满时在该函数自己的等待队列中排队，
+    不占用共享线程池的线程。线程中的函数超时后无法中断，只能丢弃结果；进程池中
+    的函数超时后，该进程池不再接收新任务，其余在途调用完成后终止工作进程。
+    """
+
+    def __init__(self, max_workers=8, process_workers=2, executor=None):
+        """
+        Args:
+            max_workers (int): 线程池大小
+            process_workers (int): 进程池大小（首次执行 process 函数时创建）
+            executor (Executor, optional): 外部提供的线程执行器，提供时不再创建线程池
+        """
+        self.max_workers = max_workers
+        self.process_workers = process_workers
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._processes = None
+        self._lock = threading.Lock()
+
+    def _threads(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tool")
+        return self._executor
+
+    def _process_pool(self):
+        with self._lock:
+            if self._processes is None:
+                self._processes = _ProcessPool(self.process_workers)
+            return self._processes
+
+    def _retire_process_pool(self, pool, stuck):
+        """有任务超时：之后的调用使用新进程池，旧池在其余在途调用完成后终止"""
+        with self._lock:
+            if self._processes is pool:
+                self._processes = None
+        pool.retire(stuck)
+
+    def _dispatch(self, job):
+        """把已获得并发名额的任务交给线程池；任务已被取消或已超时时名额转交下一个"""
+        while job is not None:
+            if job.future.set_running_or_notify_cancel():
+                if not job.expired():
+                    try:
+                        self._threads().submit(self._run_job, job)
+                        return
+                    except RuntimeError as e:
+                        # 线程池已关闭
+                        job.future.set_exception(e)
+                        job = job.policy.release()
+                        continue
+                get_registry().inc("tool_calls_total", tool=job.name, status="timeout")
+                job.future.set_exception(ToolTimeoutError(f"执行函数 '{job.name}' 超时（等待并发名额）"))
+            job = job.policy.release()
+
+    def _run_job(self, job):
+        try:
+            job.future.set_result(self._run(job.name, job.func, job.policy, job.arguments, job.deadline, job.parent))
+        except BaseException as e:
+            job.future.set_exception(e)
+        finally:
+            self._dispatch(job.policy.release())
+
+    def _run(self, name, func, policy, arguments, deadline, parent=None):
+        """工作线程中执行并写入缓存"""
+        status = "error"
+        try:
+            with get_tracer().span("tool.execute", parent, tool=name, isolation=policy.isolation):
+                result = self._execute(name, func, policy, arguments, deadline)
+            status = "ok"
+            return result
+        except ToolTimeoutError:
+            status = "timeout"
+            raise
+        finally:
+            get_registry().inc("tool_calls_total", tool=name, status=status)
+
+    def _execute(self, name, func, policy, arguments, deadline):
+        def remaining():
+            return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+        try:
+            if policy.isolation == "process":
+                pool = self._process_pool()
+                future = pool.submit(_call, func, arguments)
+                try:
+                    result = future.result(timeout=remaining())
+                except FuturesTimeoutError:
+                    # 还在进程池中排队的任务直接取消即可，已开始执行的才需要终止工作进程
+                    if not future.cancel():
+                        self._retire_process_pool(pool, future)
+                    raise ToolTimeoutError(f"执行函数 '{name}' 超时，已停止执行")
+            else:
+                result = func(**arguments)
+        except ToolTimeoutError:
+            raise
+        except Exception as e:
+            raise ToolExecutionError(f"执行函数 '{name}' 时出错: {str(e)}", e)
+
+        if policy.memoize:
+            policy.remember(policy.memo_key(arguments), result)
+        return result
+
+    def submit(self, name, func, policy, arguments, timeout=None):
+        """
+        提交一次执行
+
+        Args:
+            name (str): 函数名称
+            func: 函数对象
+            policy (ToolPolicy): 执行策略
+            arguments (dict): 已校验的参数
+            timeout (float, optional): 调用方给出的超时
+
+        Returns:
+            tuple: (Future, 实际超时秒数或None)
+        """
+        timeout = policy.effective_timeout(timeout)
+        if policy.memoize:
+            hit, result = policy.cached(policy.memo_key(arguments))
+            if hit:
+                get_registry().inc("tool_calls_total", tool=name, status="cached")
+                future = Future()
+                future.set_result(result)
+                return future, timeout
+
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        # 工作线程中的 span 以提交时的当前 span 为父
+        job = _Job(name, func, policy, arguments, deadline, get_tracer().current_span())
+        # 并发名额在提交时占用，等待名额的任务不占用线程池的线程（等待时间计入超时）
+        if policy.admit(job):
+            self._dispatch(job)
+        return job.future, timeout
+
+    def shutdown(self):
+        """关闭自有的线程池与进程池"""
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._processes is not None:
+            self._processes.executor.shutdown(wait=False, cancel_futures=True)
+            self._processes = None
@@ -2,24 +2,46 @@
 函数注册中心 - 管理所有可供大模型调用的函数
 """
 import inspect
-import json
+import time
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from observability.metrics import get_registry
+from .errors import ToolNotFoundError, ToolArgumentError, ToolTimeoutError
+from .executor import ToolExecutor, ToolPolicy
+from .validation import compile_validator
 
 class FunctionRegistry:
-    def __init__(self):
+    def __init__(self, max_workers=8, process_workers=2, executor=None):
         """
         初始化函数注册中心
+        
+        Args:
+            max_workers (int): 并发执行工具调用的线程数
+            process_workers (int): 执行 isolation="process" 函数的进程数
+            executor (Executor, optional): 外部提供的线程执行器（如异步会话的执行器）
         """
         self.functions = {}
+        self.max_workers = max_workers
+        self.engine = ToolExecutor(max_workers=max_workers, process_workers=process_workers, executor=executor)
+        # 函数定义缓存，register 时失效；version 供工具选择器判断是否需要重新编码
+        self._definitions = None
+        self.version = 0
         
-    def register(self, func, name=None, description=None, parameters=None):
+    def register(self, func, name=None, description=None, parameters=None, timeout=None,
+                 max_concurrency=None, memoize=None, isolation="thread"):
         """
         注册一个函数
         
+        参数描述在注册时编译为校验函数，执行前先校验模型给出的参数。
+        
         Args:
             func: 要注册的函数
             name (str, optional): 函数名称，如不提供则使用函数原名
             description (str, optional): 函数描述
             parameters (dict, optional): 函数参数描述，如不提供则自动从函数签名生成
+            timeout (float, optional): 该函数的执行超时（秒），与调用方超时取较小者
+            max_concurrency (int, optional): 该函数同时执行的上限
+            memoize (bool or float, optional): 按参数缓存执行结果，为数字时表示缓存秒数
+            isolation (str): thread 在线程池中执行；process 在进程池中执行，超时后可被终止
         """
         func_name = name or func.__name__
         
@@ -34,8 +56,13 @@ class FunctionRegistry:
         self.functions[func_name] = {
             "function": func,
             "description": description,
-            "parameters": parameters
+            "parameters": parameters,
+            "validate": compile_validator(parameters),
+            "policy": ToolPolicy(timeout=timeout, max_concurrency=max_concurrency, memoize=memoize,
+                                 isolation=isolation)
         }
+        self._definitions = None
+        self.version += 1
         
         return self
     
@@ -102,48 +129,141 @@ class FunctionRegistry:
             return self.functions[name]["function"]
         return None
     
-    def get_function_definitions(self):
+    def get_function_definitions(self, names=None):
         """
-        获取所有函数的定义，用于API调用
+        获取函数的定义，用于API调用
+        
+        定义列表在首次调用时构建并缓存，注册新函数后重新构建。返回的列表在多次
+        请求间共享，调用方不应修改。
+        
+        Args:
+            names (iterable, optional): 只返回这些名称的函数定义（保持注册顺序），默认返回全部
         
         Returns:
             list: 函数定义列表，符合OpenAI tools格式
         """
-        definitions = []
-        
-        for name, info in self.functions.items():
-            definition = {
-                "type": "function",
-                "function": {
-                    "name": name,
-                    "description": info["description"] or f"Function {name}",
-                    "parameters": info["parameters"]
+        definitions = self._definitions
+        if definitions is None:
+            definitions = []
+            for name, info in self.functions.items():
+                definition = {
+                    "type": "function",
+                    "function": {
+                        "name": name,
+                        "description": info["description"] or f"Function {name}",
+                        "parameters": info["parameters"]
+                    }
                 }
-            }
-            definitions.append(definition)
+                definitions.append(definition)
+            self._definitions = definitions
+        
+        if names is None:
+            return definitions
+        names = set(names)
+        return [definition for definition in definitions if definition["function"]["name"] in names]
+    
+    def _lookup(self, name):
+        info = self.functions.get(name)
+        if info is None:
+            raise ToolNotFoundError(f"函数 '{name}' 不存在")
+        return info
+    
+    def validate(self, name, arguments):
+        """
+        按注册时的参数描述校验参数
+        
+        Raises:
+            ToolNotFoundError: 函数不存在
+            ToolArgumentError: 参数不合法
+        """
+        self._lookup(name)["validate"](arguments)
+    
+    def submit(self, name, arguments, timeout=None):
+        """
+        校验参数并提交到执行引擎，不等待结果
+        
+        Args:
+            name (str): 函数名称
+            arguments (dict): 函数参数
+            timeout (float, optional): 调用方超时
             
-        return definitions
+        Returns:
+            tuple: (Future, 实际超时秒数或None)
+        """
+        info = self._lookup(name)
+        try:
+            info["validate"](arguments)
+        except ToolArgumentError:
+            get_registry().inc("tool_calls_total", tool=name, status="invalid")
+            raise
+        return self.engine.submit(name, info["function"], info["policy"], arguments, timeout)
     
-    def execute_function(self, name, arguments):
+    def execute_function(self, name, arguments, timeout=None):
         """
         执行指定名称的函数
         
         Args:
             name (str): 函数名称
             arguments (dict): 函数参数
+            timeout (float, optional): 超时秒数，与注册时的超时取较小者
             
         Returns:
             any: 函数执行结果
             
         Raises:
-            ValueError: 如果函数不存在
-            Exception: 函数执行中的任何错误
+            ToolNotFoundError: 如果函数不存在（ValueError 的子类）
+            ToolArgumentError: 参数不合法
+            ToolTimeoutError: 执行超时
+            ToolExecutionError: 函数执行中的任何错误
         """
-        func = self.get_function(name)
-        if func is None:
-            raise ValueError(f"函数 '{name}' 不存在")
-        
+        future, timeout = self.submit(name, arguments, timeout)
         try:
-            return func(**arguments)
-        except Exception as e:
-            raise Exception(f"执行函数 '{name}' 时出错: {str(e)}")
\ No newline at end of file
+            return future.result(timeout=timeout)
+        except FuturesTimeoutError:
+            # 已开始执行的线程无法中断，结果将被丢弃
+            future.cancel()
+            get_registry().inc("tool_caller_timeouts_total", tool=name)
+            raise ToolTimeoutError(f"执行函数 '{name}' 超时（{timeout}秒）")
+    
+    def execute_tool_calls(self, tool_calls, timeout=30):
+        """
+        并发执行模型一次返回的多个工具调用
+        
+        Args:
+            tool_calls (list): 工具调用列表，每项为 {"id", "name", "arguments"}
+            timeout (float): 每个工具的超时秒数（所有工具同时开始执行，注册时指定了更短超时的函数以其为准）
+            
+        Returns:
+            list: 与 tool_calls 顺序一致的结果列表，每项为 {"id", "name", "result"}，
+                  失败或超时时为 {"id", "name", "error"}
+        """
+        start = time.monotonic()
+        submitted = []
+        for call in tool_calls:
+            if "error" in call:
+                submitted.append(call["error"])
+                continue
+            try:
+                submitted.append(self.submit(call["name"], call["arguments"], timeout))
+            except Exception as e:
+                submitted.append(str(e))
+        
+        results = []
+        for call, item in zip(tool_calls, submitted):
+            result = {"id": call["id"], "name": call["name"]}
+            if isinstance(item, str):
+                result["error"] = item
+            else:
+                future, call_timeout = item
+                try:
+                    remaining = None if call_timeout is None else max(0, start + call_timeout - time.monotonic())
+                    result["result"] = future.result(timeout=remaining)
+                except FuturesTimeoutError:
+                    # 已开始执行的线程无法中断，结果将被丢弃
+                    future.cancel()
+                    get_registry().inc("tool_caller_timeouts_total", tool=call["name"])
+                    result["error"] = f"执行函数 '{call['name']}' 超时（{call_timeout}秒）"
+                except Exception as e:
+                    result["error"] = str(e)
+            results.append(result)
+        return results
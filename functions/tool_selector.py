@@ -0,0 +1,111 @@
+"""
+工具选择模块 - 按与用户消息的语义相关度挑选本轮请求携带的工具定义
+"""
+import threading
+import numpy as np
+
+
+def tool_text(definition):
+    """
+    生成用于向量化的工具描述文本：名称、描述与各参数说明
+
+    Args:
+        definition (dict): OpenAI tools 格式的函数定义
+
+    Returns:
+        str: 描述文本
+    """
+    function = definition["function"]
+    parts = [function["name"], function.get("description") or ""]
+    for name, schema in (function.get("parameters") or {}).get("properties", {}).items():
+        parts.append(f"{name}: {schema.get('description', '')}")
+    return "\n".join(part for part in parts if part)
+
+
+class ToolSelector:
+    """
+    工具选择器
+
+    注册的工具不超过 top_n 个时原样返回全部定义；超过时用嵌入模型计算用户消息与
+    各工具描述的相似度，只携带最相关的 top_n 个（always_include 中的工具始终携带），
+    减少每次请求的提示token与首字延迟。工具描述的向量在首次选择时计算，
+    之后只为新注册的工具补算。
+    """
+
+    def __init__(self, function_registry, encoder=None, top_n=8, always_include=None):
+        """
+        Args:
+            function_registry: FunctionRegistry 实例
+            encoder: 带 encode(texts, normalize_embeddings=True) 方法的嵌入模型，None 时不做选择
+            top_n (int, optional): 每次最多携带的工具数，None 或 0 表示不限
+            always_include (iterable, optional): 始终携带的工具名
+        """
+        self.function_registry = function_registry
+        self.encoder = encoder
+        self.top_n = top_n
+        self.always_include = set(always_include or ())
+
+        self._vectors = {}  # 工具名 → (描述文本, 向量)
+        self._matrix = None
+        self._names = []
+        self._version = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, function_registry, config, encoder=None):
+        """根据配置对象创建"""
+        return cls(
+            function_registry,
+            encoder=encoder,
+            top_n=getattr(config, 'TOOL_SELECTION_TOP_N', 8),
+            always_include=getattr(config, 'TOOL_SELECTION_ALWAYS_INCLUDE', None),
+        )
+
+    @property
+    def active(self):
+        """当前是否需要按相关度选择（需要编码用户消息）"""
+        return bool(self.encoder is not None and self.top_n
+                    and len(self.function_registry.functions) > self.top_n)
+
+    def _refresh(self, definitions):
+        """注册表变化后重建工具向量矩阵，只编码新增或描述变化的工具（需持有锁）"""
+        if self._version == self.function_registry.version:
+            return
+        texts = {definition["function"]["name"]: tool_text(definition) for definition in definitions}
+        pending = [name for name, text in texts.items()
+                   if name not in self._vectors or self._vectors[name][0] != text]
+        if pending:
+            vectors = self.encoder.encode([texts[name] for name in pending], normalize_embeddings=True)
+            for name, vector in zip(pending, np.asarray(vectors, dtype='float32')):
+                self._vectors[name] = (texts[name], vector)
+
+        self._names = list(texts)
+        self._matrix = np.stack([self._vectors[name][1] for name in self._names])
+        self._version = self.function_registry.version
+
+    def select(self, query):
+        """
+        选择本轮请求携带的工具定义
+
+        Args:
+            query (str): 用户消息
+
+        Returns:
+            list: 函数定义列表（保持注册顺序）
+        """
+        definitions = self.function_registry.get_function_definitions()
+        if not self.active or not query:
+            return definitions
+
+        with self._lock:
+            self._refresh(definitions)
+            names, matrix = self._names, self._matrix
+
+        query_vec = np.asarray(self.encoder.encode([query], normalize_embeddings=True), dtype='float32')[0]
+        scores = matrix @ query_vec
+        chosen = {names[i] for i in np.argsort(-scores)[:self.top_n]}
+        chosen.update(name for name in self.always_include if name in self.function_registry.functions)
+
+        selected = self.function_registry.get_function_definitions(chosen)
+        print(f"🧰 已为本轮请求选择 {len(selected)}/{len(definitions)} 个工具")
+        return selected
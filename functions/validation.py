@@ -0,0 +1,174 @@
+"""
+参数校验模块 - 在注册时把函数的参数描述（JSON Schema 子集）编译为校验函数
+"""
+from .errors import ToolArgumentError
+
+_TYPE_CHECKS = {
+    "string": lambda value: isinstance(value, str),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "boolean": lambda value: isinstance(value, bool),
+    "array": lambda value: isinstance(value, list),
+    "object": lambda value: isinstance(value, dict),
+    "null": lambda value: value is None,
+}
+
+
+def _resolve_ref(ref, root):
+    """解析 #/$defs/... 形式的本地引用"""
+    node = root
+    for part in ref.lstrip("#/").split("/"):
+        node = node[part]
+    return node
+
+
+def _compile(schema, root, refs=()):
+    """
+    把一个 schema 节点编译为检查函数列表
+
+    每个检查函数接收 (value, where)，不合法时抛出 ToolArgumentError。
+    refs 为正在展开的引用，递归引用不再展开（不做校验）。
+    """
+    if "$ref" in schema:
+        ref = schema["$ref"]
+        if ref in refs:
+            return []
+        return _compile(_resolve_ref(ref, root), root, refs + (ref,))
+
+    checks = []
+
+    types = schema.get("type")
+    if types:
+        types = [types] if isinstance(types, str) else list(types)
+        type_checks = [_TYPE_CHECKS[name] for name in types if name in _TYPE_CHECKS]
+        if type_checks:
+            expected = "/".join(types)
+
+            def check_type(value, where):
+                if not any(check(value) for check in type_checks):
+                    raise ToolArgumentError(f"参数 {where} 应为 {expected}，实际为 {type(value).__name__}")
+            checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = list(schema["enum"])
+
+        def check_enum(value, where):
+            if value not in allowed:
+                raise ToolArgumentError(f"参数 {where} 的取值应为 {allowed} 之一，实际为 {value!r}")
+        checks.append(check_enum)
+
+    if "const" in schema:
+        constant = schema["const"]
+
+        def check_const(value, where):
+            if value != constant:
+                raise ToolArgumentError(f"参数 {where} 应为 {constant!r}")
+        checks.append(check_const)
+
+    minimum, maximum = schema.get("minimum"), schema.get("maximum")
+    if minimum is not None or maximum is not None:
+        def check_range(value, where):
+            if not _TYPE_CHECKS["number"](value):
+                return
+            if minimum is not None and value < minimum:
+                raise ToolArgumentError(f"参数 {where} 不能小于 {minimum}")
+            if maximum is not None and value > maximum:
+                raise ToolArgumentError(f"参数 {where} 不能大于 {maximum}")
+        checks.append(check_range)
+
+    min_length, max_length = schema.get("minLength"), schema.get("maxLength")
+    if min_length is not None or max_length is not None:
+        def check_length(value, where):
+            if not isinstance(value, str):
+                return
+            if min_length is not None and len(value) < min_length:
+                raise ToolArgumentError(f"参数 {where} 长度不能小于 {min_length}")
+            if max_length is not None and len(value) > max_length:
+                raise ToolArgumentError(f"参数 {where} 长度不能大于 {max_length}")
+        checks.append(check_length)
+
+    alternatives = schema.get("anyOf") or schema.get("oneOf")
+    if alternatives:
+        compiled = [_compile(option, root, refs) for option in alternatives]
+
+        def check_any(value, where):
+            errors = []
+            for option_checks in compiled:
+                try:
+                    _run(option_checks, value, where)
+                    return
+                except ToolArgumentError as e:
+                    errors.append(str(e))
+            raise ToolArgumentError("；".join(errors))
+        checks.append(check_any)
+
+    for option in schema.get("allOf") or []:
+        checks.extend(_compile(option, root, refs))
+
+    if "properties" in schema or "required" in schema or schema.get("additionalProperties") is False:
+        checks.append(_compile_object(schema, root, refs))
+
+    if "items" in schema and isinstance(schema["items"], dict):
+        item_checks = _compile(schema["items"], root, refs)
+
+        def check_items(value, where):
+            if isinstance(value, list):
+                for i, item in enumerate(value):
+                    _run(item_checks, item, f"{where}[{i}]")
+        checks.append(check_items)
+
+    return checks
+
+
+def _compile_object(schema, root, refs):
+    properties = {
+        name: _compile(prop, root, refs) for name, prop in (schema.get("properties") or {}).items()
+    }
+    required = list(schema.get("required") or [])
+    closed = schema.get("additionalProperties") is False
+
+    def check_object(value, where):
+        if not isinstance(value, dict):
+            return
+        prefix = f"{where}." if where else ""
+        missing = [name for name in required if name not in value]
+        if missing:
+            raise ToolArgumentError(f"缺少必需参数: {', '.join(prefix + name for name in missing)}")
+        for name, item in value.items():
+            item_checks = properties.get(name)
+            if item_checks is None:
+                if closed:
+                    raise ToolArgumentError(f"未知参数: {prefix + name}")
+                continue
+            _run(item_checks, item, prefix + name)
+    return check_object
+
+
+def _run(checks, value, where):
+    for check in checks:
+        check(value, where)
+
+
+def compile_validator(schema):
+    """
+    把参数描述编译为校验函数
+
+    支持 type、enum、const、required、properties、additionalProperties: false、
+    items、anyOf/oneOf/allOf、minimum/maximum、minLength/maxLength 以及
+    指向 $defs/definitions 的本地 $ref，其余关键字忽略。
+
+    Args:
+        schema (dict): 函数的 parameters 描述
+
+    Returns:
+        callable: validate(arguments)，参数不合法时抛出 ToolArgumentError
+    """
+    schema = schema or {}
+    checks = _compile(schema, schema)
+
+    def validate(arguments):
+        if not isinstance(arguments, dict):
+            raise ToolArgumentError("参数应为JSON对象")
+        _run(checks, arguments, "")
+
+    return validate
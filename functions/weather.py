@@ -1,107 +1,180 @@
 """
 天气查询模块 - 使用高德地图API查询天气
 """
-import requests
+import httpx
 import json
 import argparse
 import sys
 
 # 添加 Pydantic 模型定义
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Literal, Optional
 
 class WeatherRequest(BaseModel):
+    # 生成的参数描述带 additionalProperties: false，模型传入未声明的参数时校验失败
+    model_config = ConfigDict(extra="forbid")
+
     city: str = Field(description="城市名称，例如'北京'")
     extensions: Literal["base", "all"] = Field(
         default="base", 
         description="天气数据类型，'base'为实况天气，'all'为预报天气"
     )
 
-def get_weather(city, key=None, extensions="base", unit="celsius"):
+class WeatherAPIError(Exception):
+    """高德天气接口返回错误或没有数据"""
+
+
+def fetch_weather_data(city_code, extensions, api_key, base_url=None, http_client=None):
+    """
+    请求高德天气接口
+    
+    Args:
+        city_code (str): adcode 或城市名
+        extensions (str): 'base'为实况天气，'all'为预报天气
+        api_key (str): 高德地图API密钥
+        base_url (str, optional): 接口地址，默认 https://restapi.amap.com，测试时可指向本地替身服务
+        http_client (httpx.Client, optional): HTTP客户端，默认使用进程内共享连接池
+        
+    Returns:
+        dict: 实况天气为 lives[0]，预报天气为 forecasts[0]
+        
+    Raises:
+        WeatherAPIError: 接口返回错误或没有数据
+        httpx.HTTPError: 网络请求失败
+    """
+    from transport.http_pool import get_shared_pool
+    
+    url = (base_url or "https://restapi.amap.com").rstrip("/") + "/v3/weather/weatherInfo"
+    params = {
+        "key": api_key,
+        "city": city_code,
+        "extensions": extensions,
+        "output": "JSON"
+    }
+    
+    # 发起请求（复用共享连接池中的keep-alive连接）
+    client = http_client or get_shared_pool().client
+    response = client.get(url, params=params, timeout=10)
+    data = response.json()
+    
+    # 检查请求状态，高德API成功状态码为"1"
+    if data.get("status") != "1":
+        raise WeatherAPIError(f"API错误: {data.get('info', '未知错误')}")
+    items = data.get("lives") if extensions == "base" else data.get("forecasts")
+    if not items:
+        raise WeatherAPIError("未找到天气数据")
+    return items[0]
+
+
+def get_weather(city, key=None, extensions="base", unit="celsius", http_client=None, base_url=None, cache=None):
     """
     查询指定城市的天气信息
     
+    相同城市（包括“北京市”、“beijing”等别名）在数据发布后的更新间隔内直接使用缓存，
+    并发查询同一城市时只发出一次请求。
+    
     Args:
         city (str): 城市名称，例如：'北京'
         key (str, optional): 高德地图API密钥
         extensions (str, optional): 天气数据类型，'base'为实况天气，'all'为预报天气
         unit (str, optional): 温度单位，'celsius'或'fahrenheit'
+        http_client (httpx.Client, optional): HTTP客户端，默认使用进程内共享连接池
+        base_url (str, optional): 高德接口地址，默认读取 config.AMAP_BASE_URL
+        cache (WeatherCache, optional): 天气缓存，默认使用进程内共享缓存（config.WEATHER_CACHE_ENABLED 为 False 时不缓存）
         
     Returns:
         dict: 天气信息
     """
-    from config import AMAP_KEY
+    import config
+    from .weather_cache import get_weather_cache
     
     # 使用配置文件中的密钥或传入的密钥
-    api_key = key or AMAP_KEY
-    
-    # 构建API请求URL
-    url = "https://restapi.amap.com/v3/weather/weatherInfo"
-    params = {
-        "key": api_key,
-        "city": city,
-        "extensions": extensions,
-        "output": "JSON"
-    }
+    api_key = key or config.AMAP_KEY
+    base_url = base_url or getattr(config, 'AMAP_BASE_URL', None)
+    if cache is None and getattr(config, 'WEATHER_CACHE_ENABLED', True):
+        cache = get_weather_cache(config)
     
     try:
-        # 发起请求
-        response = requests.get(url, params=params, timeout=10)
-        data = response.json()
+        if cache is not None:
+            city_code = cache.index.resolve(city)
+            
+            def fetch():
+                item = fetch_weather_data(city_code, extensions, api_key, base_url, http_client)
+                # 记住接口返回的编码，别名与编码共享同一个缓存条目
+                cache.index.learn(city, item.get("adcode"))
+                cache.index.learn(item.get("city"), item.get("adcode"))
+                if item.get("adcode") and item["adcode"] != city_code:
+                    cache.put((item["adcode"], extensions), item, extensions)
+                return item
+            
+            item = cache.get_or_fetch((city_code, extensions), fetch)
+        else:
+            item = fetch_weather_data(city, extensions, api_key, base_url, http_client)
         
-        # 检查请求状态
-        if data["status"] == "1":  # 高德API成功状态码为"1"
-            if extensions == "base" and "lives" in data and data["lives"]:
-                # 处理实况天气
-                weather_info = data["lives"][0]
-                temperature = float(weather_info["temperature"])
-                
-                # 温度单位转换
-                if unit.lower() == "fahrenheit":
-                    temperature = temperature * 9 / 5 + 32
-                    unit_display = "°F"
-                else:
-                    unit_display = "°C"
-                
-                # 返回实况天气
-                return {
-                    "city": weather_info["city"],
-                    "weather": weather_info["weather"],
-                    "temperature": str(round(temperature, 1)) + unit_display,
-                    "winddirection": weather_info["winddirection"],
-                    "windpower": weather_info["windpower"],
-                    "humidity": weather_info["humidity"],
-                    "reporttime": weather_info["reporttime"]
-                }
-            elif extensions == "all" and "forecasts" in data and data["forecasts"]:
-                # 返回天气预报
-                forecast = data["forecasts"][0]
-                return {
-                    "city": forecast["city"],
-                    "forecasts": [
-                        {
-                            "date": cast["date"],
-                            "dayweather": cast["dayweather"],
-                            "nightweather": cast["nightweather"],
-                            "daytemp": cast["daytemp"],
-                            "nighttemp": cast["nighttemp"],
-                            "daywind": cast["daywind"],
-                            "nightwind": cast["nightwind"]
-                        } for cast in forecast["casts"]
-                    ]
-                }
+        if extensions == "base":
+            # 处理实况天气
+            temperature = float(item["temperature"])
+            
+            # 温度单位转换
+            if unit.lower() == "fahrenheit":
+                temperature = temperature * 9 / 5 + 32
+                unit_display = "°F"
             else:
-                return {"error": "未找到天气数据"}
-        else:
-            return {"error": f"API错误: {data.get('info', '未知错误')}"}
+                unit_display = "°C"
+            
+            # 返回实况天气
+            return {
+                "city": item["city"],
+                "weather": item["weather"],
+                "temperature": str(round(temperature, 1)) + unit_display,
+                "winddirection": item["winddirection"],
+                "windpower": item["windpower"],
+                "humidity": item["humidity"],
+                "reporttime": item["reporttime"]
+            }
+        
+        # 返回天气预报
+        return {
+            "city": item["city"],
+            "forecasts": [
+                {
+                    "date": cast["date"],
+                    "dayweather": cast["dayweather"],
+                    "nightweather": cast["nightweather"],
+                    "daytemp": cast["daytemp"],
+                    "nighttemp": cast["nighttemp"],
+                    "daywind": cast["daywind"],
+                    "nightwind": cast["nightwind"]
+                } for cast in item["casts"]
+            ]
+        }
     
-    except requests.Timeout:
+    except WeatherAPIError as e:
+        return {"error": str(e)}
+    except httpx.TimeoutException:
         return {"error": "天气API请求超时"}
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         return {"error": f"网络请求异常: {str(e)}"}
     except Exception as e:
         return {"error": f"处理天气数据时出错: {str(e)}"}
 
+def weather_tool(city, extensions="base"):
+    """
+    注册给模型调用的天气查询入口，只接受 WeatherRequest 中声明的参数
+
+    接口地址、密钥、缓存与HTTP客户端一律来自配置，不能由模型指定
+    （否则可把密钥发往任意地址）。
+
+    Args:
+        city (str): 城市名称
+        extensions (str): 'base'为实况天气，'all'为预报天气
+
+    Returns:
+        dict: 同 get_weather
+    """
+    return get_weather(city, extensions=extensions)
+
+
 def print_weather_report(weather_data):
     """
     格式化打印天气数据
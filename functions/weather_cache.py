@@ -0,0 +1,280 @@
+"""
+天气缓存模块 - 城市名到 adcode 的本地索引、按发布时间确定有效期的缓存与并发请求合并
+"""
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from .city_codes import CITY_ADCODES, CITY_ALIASES
+
+# 高德返回的 reporttime 为北京时间
+_CHINA_TZ = timezone(timedelta(hours=8))
+
+_SUFFIX_PATTERN = re.compile(r"(特别行政区|自治州|地区|市)$")
+# 只去掉单独成词的后缀（"beijing shi"、"beijing city"），不误伤 "lishi"、"xiamencity" 这类名称
+_PINYIN_SUFFIX_PATTERN = re.compile(r"\s+(city|shi)$")
+
+
+class CityCodeIndex:
+    """
+    城市名 → adcode 索引
+
+    内置常用城市及其简称、拼音别名；查询天气后还会记住接口返回的 adcode，
+    使“北京”、“北京市”、“beijing”、“110000”等写法命中同一个缓存条目。
+    """
+
+    def __init__(self, codes=None, aliases=None):
+        """
+        Args:
+            codes (dict, optional): 额外的 {城市名: adcode}
+            aliases (dict, optional): 额外的 {别名: 城市名}
+        """
+        self._codes = {}
+        self._lock = threading.Lock()
+        for name, adcode in {**CITY_ADCODES, **(codes or {})}.items():
+            self._codes[self.normalize(name)] = adcode
+        for alias, name in {**CITY_ALIASES, **(aliases or {})}.items():
+            adcode = self._codes.get(self.normalize(name))
+            if adcode:
+                self._codes[self.normalize(alias)] = adcode
+
+    @classmethod
+    def from_file(cls, filename):
+        """
+        从 JSON 文件加载额外的城市编码
+
+        Args:
+            filename (str): {"codes": {城市名: adcode}, "aliases": {别名: 城市名}} 格式的文件
+        """
+        with open(filename, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("codes"), data.get("aliases"))
+
+    @staticmethod
+    def normalize(name):
+        """规范化城市名：去空白、转小写、去掉“市”等后缀"""
+        name = (name or "").strip().lower()
+        if name.isascii():
+            return _PINYIN_SUFFIX_PATTERN.sub("", name).strip()
+        return _SUFFIX_PATTERN.sub("", name) or name
+
+    def resolve(self, city):
+        """
+        解析城市对应的 adcode
+
+        Args:
+            city (str): 城市名、别名或 adcode
+
+        Returns:
+            str: adcode；未收录的城市原样返回调用方给出的名称（仅去掉首尾空白），由接口自行解析
+        """
+        normalized = self.normalize(city)
+        if normalized.isdigit():
+            return normalized
+        with self._lock:
+            adcode = self._codes.get(normalized)
+        return adcode if adcode is not None else (city or "").strip()
+
+    def learn(self, city, adcode):
+        """记录接口返回的城市编码"""
+        if city and adcode:
+            with self._lock:
+                self._codes[self.normalize(city)] = str(adcode)
+
+
+def parse_reporttime(value):
+    """
+    解析高德的发布时间
+
+    Args:
+        value (str): 形如 "2024-05-01 14:02:33" 的北京时间
+
+    Returns:
+        float or None: Unix 时间戳，无法解析时为 None
+    """
+    try:
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").replace(tzinfo=_CHINA_TZ).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class _Flight:
+    """一次进行中的请求，供并发的相同请求等待结果"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class WeatherCache:
+    """
+    天气数据缓存
+
+    以 (adcode, extensions) 为键。实况天气约每小时发布一次，有效期为
+    发布时间 + 更新间隔，过了预计更新时间但接口仍返回旧数据时，至少再缓存
+    min_ttl 秒，避免反复请求。同一键的并发请求只会发出一个，其余等待其结果。
+    """
+
+    def __init__(self, refresh_interval=3600, forecast_refresh_interval=3 * 3600, min_ttl=300,
+                 max_entries=256, index=None):
+        """
+        Args:
+            refresh_interval (float): 实况天气的更新间隔（秒）
+            forecast_refresh_interval (float): 天气预报的更新间隔（秒）
+            min_ttl (float): 缓存的最短有效期（秒）
+            max_entries (int): 最大缓存条目数
+            index (CityCodeIndex, optional): 城市编码索引
+        """
+        self.refresh_interval = refresh_interval
+        self.forecast_refresh_interval = forecast_refresh_interval
+        self.min_ttl = min_ttl
+        self.max_entries = max_entries
+        self.index = index or CityCodeIndex()
+
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """根据配置对象创建"""
+        codes_file = getattr(config, 'WEATHER_CITY_CODES_FILE', None)
+        return cls(
+            refresh_interval=getattr(config, 'WEATHER_REFRESH_INTERVAL', 3600),
+            forecast_refresh_interval=getattr(config, 'WEATHER_FORECAST_REFRESH_INTERVAL', 3 * 3600),
+            min_ttl=getattr(config, 'WEATHER_MIN_TTL', 300),
+            max_entries=getattr(config, 'WEATHER_CACHE_MAX_ENTRIES', 256),
+            index=CityCodeIndex.from_file(codes_file) if codes_file else None,
+        )
+
+    def ttl_for(self, item, extensions):
+        """
+        根据发布时间计算缓存有效期
+
+        Args:
+            item (dict): 接口返回的 lives[0] 或 forecasts[0]
+            extensions (str): base 或 all
+
+        Returns:
+            float: 有效秒数
+        """
+        interval = self.forecast_refresh_interval if extensions == "all" else self.refresh_interval
+        reported = parse_reporttime(item.get("reporttime"))
+        if reported is None:
+            return self.min_ttl
+        return min(interval, max(self.min_ttl, reported + interval - time.time()))
+
+    def get(self, key):
+        """读取未过期的缓存，没有时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, item = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return item
+
+    def put(self, key, item, extensions):
+        """写入缓存"""
+        expires_at = time.time() + self.ttl_for(item, extensions)
+        with self._lock:
+            self._entries[key] = (expires_at, item)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_fetch(self, key, fetch):
+        """
+        读取缓存，未命中时调用 fetch 获取；同一键的并发调用共享一次请求
+
+        Args:
+            key (tuple): (adcode, extensions)
+            fetch: 无参可调用对象，返回接口数据，失败时抛出异常（失败结果不缓存）
+
+        Returns:
+            dict: 天气数据
+        """
+        item = self.get(key)
+        if item is not None:
+            with self._lock:
+                self.hits += 1
+            return item
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                self.misses += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fetch()
+            self.put(key, flight.result, key[1])
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        获取缓存统计
+
+        Returns:
+            dict: 命中、未命中、合并的并发请求次数与当前条目数
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared": self.shared,
+                "entries": len(self._entries),
+            }
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_weather_cache(config=None):
+    """
+    获取进程内共享的天气缓存，首次调用时根据配置创建
+
+    Args:
+        config: 配置对象(可选)，不提供时使用默认参数
+
+    Returns:
+        WeatherCache: 共享缓存
+    """
+    global _shared_cache
+    if _shared_cache is None:
+        with _shared_lock:
+            if _shared_cache is None:
+                _shared_cache = WeatherCache.from_config(config) if config is not None else WeatherCache()
+    return _shared_cache
@@ -1,19 +1,267 @@
 import config
+import argparse
+import asyncio
 import datetime
+import json
+import logging
 import os
+import time
+from collections import deque
 from model.llm_client import GrokClient
+from model.response_cache import ResponseCache
+from model.resilience import ResilientCaller
+from model.router import ModelRouter
+from model.scheduler import RequestScheduler
+from observability.llm_calls import LLMCallRecorder
+from observability.metrics import get_registry, Histogram
+from observability.exporter import MetricsServer
+from observability.tracing import configure_tracing
+from transport.http_pool import get_shared_pool
 from core.session import Session
-from functions.weather import get_weather, WeatherRequest
+from functions.weather import weather_tool, WeatherRequest
+
+def _ratio(part, total):
+    return f"{part / total:.1%}" if total else "-"
+
+
+def print_stats(registry):
+    """
+    打印运行统计：对话轮数、记忆流水线、向量索引、查询缓存、LLM延迟与工具调用
+    
+    Args:
+        registry (MetricsRegistry): 指标注册表
+    """
+    print("\n---- 运行统计 ----")
+    ok = registry.counter("turns_total", status="ok")
+    errors = registry.counter("turns_total", status="error")
+    aborted = registry.counter("turns_total", status="aborted")
+    print(f"对话轮数: {ok + errors + aborted}（失败 {errors}，中断 {aborted}）")
+    
+    queue_depth = registry.gauge("memory_queue_depth")
+    judged = registry.counter_sum("memory_judgements_total")
+    positive = registry.counter("memory_judgements_total", result="positive")
+    failed = registry.counter("memory_judgements_total", result="error")
+    print(f"记忆队列: 等待 {queue_depth if queue_depth is not None else '-'} 个任务")
+    print(f"记忆判断: {judged} 次，需要记忆 {positive} 次（{_ratio(positive, judged - failed)}），失败 {failed} 次")
+    extractions = registry.counter_sum("memory_extractions_total")
+    empty = registry.counter("memory_extractions_total", status="empty")
+    print(f"记忆提取: {extractions} 次（无结果 {empty} 次），共提取 {registry.counter('memories_extracted_total')} 条")
+    
+    index_size = registry.gauge("vector_index_size")
+    if index_size is not None:
+        print(f"向量索引: {index_size} 条")
+    lookups = registry.counter_sum("embedding_cache_requests_total")
+    hits = registry.counter("embedding_cache_requests_total", result="hit")
+    print(f"查询向量缓存: 命中率 {_ratio(hits, lookups)}（{hits}/{lookups}）")
+    
+    snapshot = registry.snapshot()
+    for item in snapshot["histograms"]:
+        if item["name"] == "llm_call_seconds" and item["count"]:
+            labels = item["labels"]
+            print(f"LLM延迟 {labels.get('call_site')} ({labels.get('model')}): {item['count']} 次，"
+                  f"p50 {item['p50']:.2f}s，p95 {item['p95']:.2f}s")
+    
+    tools = {}
+    for item in snapshot["counters"]:
+        if item["name"] == "tool_calls_total":
+            counts = tools.setdefault(item["labels"].get("tool"), {})
+            counts[item["labels"].get("status")] = item["value"]
+    for tool, counts in sorted(tools.items()):
+        total = sum(counts.values())
+        failed = counts.get("error", 0) + counts.get("timeout", 0) + counts.get("invalid", 0)
+        print(f"工具 {tool}: {total} 次，失败 {failed} 次（{_ratio(failed, total)}），"
+              f"调用方超时 {registry.counter('tool_caller_timeouts_total', tool=tool)} 次")
+
+
+def load_batch(filename):
+    """
+    读取批处理输入（JSONL，每行 {"session_id", "message"}），按会话分组
+    
+    Args:
+        filename (str): 输入文件路径
+        
+    Returns:
+        dict: {会话ID: [(行号, 消息), ...]}，会话按首次出现的顺序排列，会话内保持输入顺序
+        list: 无法处理的行 [(行号, 错误信息), ...]
+    """
+    sessions = {}
+    invalid = []
+    with open(filename, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                invalid.append((line_number, f"JSON 格式错误: {e}"))
+                continue
+            if not isinstance(record, dict) or not record.get("session_id") or not record.get("message"):
+                invalid.append((line_number, "缺少 session_id 或 message"))
+                continue
+            sessions.setdefault(str(record["session_id"]), []).append((line_number, record["message"]))
+    return sessions, invalid
+
+
+async def replay_batch(pool, sessions, output, workers=8, auto_memory=False):
+    """
+    并发回放多个会话的消息
+    
+    每个工作协程一次处理一个会话：按输入顺序逐条发送该会话的消息，全部完成后
+    （开启自动记忆时先等待记忆任务完成）关闭会话，再取下一个会话。不同会话之间并发，
+    同时打开的会话数不超过 workers。
+    
+    Args:
+        pool (SessionPool): 会话池（共享嵌入模型、索引、工具与 LLM 客户端）
+        sessions (dict): load_batch 返回的 {会话ID: [(行号, 消息), ...]}
+        output: 结果文件对象，每条消息写入一行 JSON
+        workers (int): 并发处理的会话数
+        auto_memory (bool): 是否开启自动记忆
+        
+    Returns:
+        dict: 消息数、失败数与每条消息耗时的汇总
+    """
+    pending = deque(sessions.items())
+    latencies = Histogram(window=max(1, sum(len(items) for items in sessions.values())))
+    summary = {"messages": 0, "errors": 0}
+    
+    async def worker():
+        while pending:
+            session_id, items = pending.popleft()
+            for turn, (line_number, message) in enumerate(items, 1):
+                record = {"line": line_number, "session_id": session_id, "turn": turn, "message": message}
+                start = time.perf_counter()
+                try:
+                    async with pool.use(session_id) as session:
+                        session.auto_memory = auto_memory
+                        record["response"] = await session.process_message(message)
+                        record["status"] = session.last_turn_status
+                        record["stages"] = session.last_turn_timings.as_dict()
+                except Exception as e:
+                    record.update(response=None, status="error", error=str(e))
+                record["latency"] = time.perf_counter() - start
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+                latencies.observe(record["latency"])
+                summary["messages"] += 1
+                summary["errors"] += record["status"] != "ok"
+            if auto_memory:
+                try:
+                    await pool.get(session_id).memory_queue.join()
+                except KeyError:
+                    pass
+            await pool.close(session_id)
+    
+    workers = max(1, min(workers, pool.max_sessions, len(sessions) or 1))
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    summary["latency"] = latencies.summary()
+    return summary
+
+
+def run_batch(input_file, output_file, workers=8, auto_memory=False):
+    """
+    批处理模式：回放输入文件中的消息，把回复与耗时写入输出文件（JSONL）
+    
+    会话与多会话服务端使用相同的共享组件（见 server.app.build_server）。每条输入
+    消息对应一行输出 {"line", "session_id", "turn", "message", "response", "status",
+    "stages", "latency"}，按完成顺序写入，可按 line 排序还原输入顺序。
+    
+    Args:
+        input_file (str): 输入文件
+        output_file (str): 输出文件
+        workers (int): 并发处理的会话数
+        auto_memory (bool): 是否开启自动记忆
+    """
+    from server.app import build_server
+    
+    sessions, invalid = load_batch(input_file)
+    server = build_server(config)
+    
+    async def replay(output):
+        await server.pool.start()
+        try:
+            return await replay_batch(server.pool, sessions, output, workers, auto_memory)
+        finally:
+            await server.pool.stop()
+    
+    total = sum(len(items) for items in sessions.values())
+    print(f"📂 批处理: {len(sessions)} 个会话，{total} 条消息，并发 {workers} 个会话")
+    start = time.perf_counter()
+    with open(output_file, 'w', encoding='utf-8') as output:
+        for line_number, error in invalid:
+            output.write(json.dumps({"line": line_number, "status": "invalid", "error": error},
+                                    ensure_ascii=False) + "\n")
+        summary = asyncio.run(replay(output))
+    elapsed = time.perf_counter() - start
+    
+    latency = summary["latency"]
+    throughput = summary["messages"] / elapsed if elapsed else 0
+    print(f"✅ 完成 {summary['messages']} 条消息（失败 {summary['errors']}，无效输入 {len(invalid)}），"
+          f"耗时 {elapsed:.1f}s，{throughput:.2f} 条/秒")
+    if latency["count"]:
+        print(f"⏱️ 每条消息耗时 p50 {latency['p50']:.2f}s，p95 {latency['p95']:.2f}s，p99 {latency['p99']:.2f}s")
+    print(f"📄 结果已写入 {output_file}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=f"{config.APP_NAME}（默认进入交互模式）")
+    parser.add_argument("--batch", metavar="INPUT",
+                        help="批处理模式：读取 JSONL 文件（每行 {\"session_id\", \"message\"}）回放后退出")
+    parser.add_argument("--output", help="批处理结果文件（JSONL），默认为输入文件名加 .out.jsonl")
+    parser.add_argument("--workers", type=int, default=getattr(config, 'BATCH_WORKERS', 8),
+                        help="批处理时并发处理的会话数")
+    parser.add_argument("--auto-memory", action="store_true", help="批处理时开启自动记忆（关闭会话前等待记忆任务完成）")
+    return parser.parse_args()
+
 
 def main():
+    args = parse_args()
+    logging.basicConfig(
+        level=getattr(config, 'LOG_LEVEL', 'WARNING'),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    
     # 确保数据目录存在
     os.makedirs(getattr(config, 'DATA_DIR', 'data'), exist_ok=True)
     
+    if args.batch:
+        output_file = args.output or os.path.splitext(args.batch)[0] + ".out.jsonl"
+        run_batch(args.batch, output_file, args.workers, args.auto_memory)
+        return
+    
+    # 按采样率记录每轮各阶段的追踪
+    tracer = configure_tracing(config)
+    
+    # 设置 METRICS_PORT 时在本地提供 Prometheus 格式的 /metrics
+    metrics_server = MetricsServer.from_config(config)
+    if metrics_server is not None:
+        metrics_server.start()
+    
+    # 创建响应缓存（记忆判断、记忆提取等确定性调用按需使用）
+    cache = None
+    if getattr(config, 'LLM_CACHE_ENABLED', False):
+        cache = ResponseCache(
+            ttl=config.LLM_CACHE_TTL,
+            max_entries=config.LLM_CACHE_MAX_ENTRIES,
+            sqlite_path=getattr(config, 'LLM_CACHE_SQLITE_FILE', None)
+        )
+    
+    # LLM客户端与工具函数共享同一个连接池
+    http_pool = get_shared_pool(config)
+    
+    # 每次LLM调用的埋点记录
+    llm_calls = LLMCallRecorder.from_config(config)
+    
     # 创建客户端实例
     grok = GrokClient(
         api_key=config.API_KEY,
         base_url=config.BASE_URL,
-        default_model=config.DEFAULT_MODEL
+        default_model=config.DEFAULT_MODEL,
+        cache=cache,
+        resilience=ResilientCaller.from_config(config),
+        http_client=http_pool.client,
+        instrumentation=llm_calls,
+        router=ModelRouter.from_config(config),
+        scheduler=RequestScheduler.from_config(config)
     )
     
     # 创建会话
@@ -22,9 +270,12 @@ def main():
     # 注册天气查询功能
     weather_schema = WeatherRequest.model_json_schema()
     session.register_function(
-        get_weather,
+        weather_tool,
+        name="get_weather",
         description="查询指定城市的天气信息。仅当用户明确询问天气时才调用此函数。",
-        parameters=weather_schema
+        parameters=weather_schema,
+        timeout=15,
+        max_concurrency=4
     )
     
     # 启动会话（开始记忆线程）
@@ -37,11 +288,17 @@ def main():
     print("(输入 'memory:on/off' 开关记忆功能，输入 'automemory:on/off' 开关自动记忆)")
     print("(输入 'vector:on/off' 开关向量检索功能)")
     print("(输入 'memories' 查看已记忆的内容)")
+    print("(输入 'stream:on/off' 开关流式输出，输入 'cache' 查看响应缓存命中率，输入 'pool' 查看连接池)")
+    print("(输入 'metrics' 查看各调用点的LLM请求统计，输入 'stats' 查看运行统计，输入 'trace:文件名' 导出追踪)")
+    if metrics_server is not None:
+        print(f"指标导出: {metrics_server.url}")
     print(f"当前默认模型: {config.DEFAULT_MODEL}")
     print(f"对话历史记忆: {'启用' if config.ENABLE_MEMORY else '禁用'}")
     print(f"向量检索功能: {'启用' if getattr(config, 'VECTOR_SEARCH_ENABLED', False) else '禁用'}")
     print(f"最大记忆轮数: {config.MAX_CONVERSATION_TURNS}")
     
+    stream_responses = getattr(config, 'STREAM_RESPONSES', False)
+    
     try:
         while True:
             user_input = input("\n请输入您的问题: ")
@@ -132,6 +389,78 @@ def main():
                 print("向量检索功能已禁用")
                 continue
                 
+            elif user_input.lower() == 'stream:on':
+                stream_responses = True
+                print("流式输出已启用")
+                continue
+                
+            elif user_input.lower() == 'stream:off':
+                stream_responses = False
+                print("流式输出已禁用")
+                continue
+                
+            elif user_input.lower() == 'cache':
+                if cache is None:
+                    print("响应缓存未启用")
+                else:
+                    stats = cache.stats()
+                    print(f"响应缓存: 命中 {stats['hits'] + stats['sqlite_hits']} 次"
+                          f"（其中SQLite {stats['sqlite_hits']} 次），未命中 {stats['misses']} 次，"
+                          f"命中率 {stats['hit_rate']:.1%}，当前 {stats['entries']} 条")
+                continue
+                
+            elif user_input.lower() == 'pool':
+                stats = http_pool.stats()
+                print(f"连接池: 累计请求 {stats['requests']} 次，HTTP/2 {'启用' if stats['http2'] else '未启用'}，"
+                      f"最大连接数 {stats['max_connections']}")
+                sync_stats = stats.get('sync')
+                if sync_stats:
+                    print(f"当前连接 {sync_stats['connections']} 个（活跃 {sync_stats['active']}，空闲 {sync_stats['idle']}）")
+                continue
+                
+            elif user_input.lower() == 'metrics':
+                summary = llm_calls.summary()
+                if not summary:
+                    print("暂无LLM调用记录")
+                else:
+                    print("\n---- LLM调用统计（最近记录） ----")
+                    for call_site, item in summary.items():
+                        latency = f"{item['avg_latency']:.2f}s" if item['avg_latency'] is not None else "-"
+                        print(f"{call_site}: {item['calls']} 次（缓存 {item['cached']}，失败 {item['errors']}，"
+                              f"重试 {item['retries']}），平均耗时 {latency}，"
+                              f"token 输入 {item['prompt_tokens']} / 输出 {item['completion_tokens']}")
+                for priority, item in grok.scheduler.stats().items():
+                    queue_time = f"{item['avg_queue_time']:.2f}s" if item['avg_queue_time'] is not None else "-"
+                    print(f"调度队列 {priority}: 排队中 {item['waiting']}，已放行 {item['admitted']}，"
+                          f"已取消 {item['cancelled']}，平均排队 {queue_time}")
+                registry = get_registry()
+                for stage in ("history", "retrieval", "tools", "llm", "total"):
+                    item = registry.summary("turn_stage_seconds", stage=stage)
+                    if item:
+                        fallbacks = (registry.counter("turn_stage_fallbacks_total", stage=stage, status="timeout")
+                                     + registry.counter("turn_stage_fallbacks_total", stage=stage, status="error"))
+                        print(f"对话阶段 {stage}: {item['count']} 次，p50 {item['p50'] * 1000:.0f}ms，"
+                              f"p95 {item['p95'] * 1000:.0f}ms，兜底 {fallbacks} 次")
+                if session.last_turn_timings is not None:
+                    print(f"上一轮耗时（{session.last_turn_status}）: {session.last_turn_timings}")
+                saturated = registry.counter_sum("turn_pipeline_saturated_total")
+                if saturated:
+                    print(f"⚠️ 准备阶段线程池被超时阶段占满 {saturated} 次（当前运行中 {session.pipeline.busy_workers} 个）")
+                continue
+                
+            elif user_input.lower() == 'stats':
+                print_stats(get_registry())
+                continue
+                
+            elif user_input.lower().startswith('trace:'):
+                filename = user_input[6:].strip()
+                if not tracer.enabled:
+                    print("追踪未启用，请在 config.py 中设置 TRACE_SAMPLE_RATE")
+                elif filename:
+                    count = tracer.export_chrome(filename)
+                    print(f"已导出 {count} 个追踪区间到 {filename}（可在 chrome://tracing 或 ui.perfetto.dev 中打开）")
+                continue
+                
             elif user_input.lower() == 'memories':
                 memories = session.get_memories()
                 if not memories:
@@ -147,6 +476,22 @@ def main():
             
             # 处理用户输入并获取回复
             print("正在请求Grok...")
+            if stream_responses:
+                printed_header = False
+                for text in session.process_message_stream(user_input):
+                    if not printed_header:
+                        print("\nGrok回答:")
+                        printed_header = True
+                    print(text, end="", flush=True)
+                print()
+                
+                stats = grok.last_stream_stats
+                if stats and stats.ttft is not None:
+                    speed = stats.tokens_per_second
+                    speed_text = f"，生成速度 {speed:.1f} tokens/s" if speed else ""
+                    print(f"⏱ 首字延迟 {stats.ttft:.2f}s{speed_text}")
+                continue
+            
             response = session.process_message(user_input)
             
             print("\nGrok回答:")
@@ -155,6 +500,13 @@ def main():
     finally:
         # 确保在程序退出时停止后台线程
         session.stop()
+        grok.resilience.close()
+        llm_calls.close()
+        trace_file = getattr(config, 'TRACE_OUTPUT_FILE', None)
+        if tracer.enabled and trace_file:
+            tracer.export_chrome(trace_file)
+        if metrics_server is not None:
+            metrics_server.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
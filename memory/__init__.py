@@ -2,5 +2,6 @@
 记忆管理包
 """
 from .history import ConversationHistory
+from .journal import HistoryJournal
 
-__all__ = ['ConversationHistory']
\ No newline at end of file
+__all__ = ['ConversationHistory', 'HistoryJournal']
\ No newline at end of file
@@ -0,0 +1,370 @@
+"""
+历史对话批量回填 - 把保存的对话记录转换为向量记忆
+
+支持 save_history 写出的 JSON 数组（.json）与按行写入的 JSONL（.jsonl，包括对话日志
+轮转出的 .jsonl.N / .jsonl.N.gz 分段），目录会递归展开。分两个阶段:
+
+    1. 提取：逐文件流式读取每轮对话的用户消息，用线程池并发执行记忆判断与提取
+       （并发数即同时在途的LLM请求数），每处理完一条就把结果追加到检查点文件
+    2. 建索引：从检查点文件读出全部记忆，去掉与索引中已有文本重复的内容，按大批次
+       编码写入索引，全部写入后只保存一次索引
+
+检查点文件（JSONL）每行记录一轮对话的处理结果 {"file", "index", "memories"}，中断后
+重新运行会跳过已处理的对话；请求失败的对话不写入检查点，下次运行时重试。
+
+用法:
+    python -m memory.backfill data/history/ saved_chat.json --workers 8
+    python -m memory.backfill logs/ --extract-only      # 只提取，稍后在有嵌入模型的机器上建索引
+    python -m memory.backfill --index-only
+"""
+import os
+import sys
+import json
+import gzip
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from core.memory_manager import MemoryManager
+from model.prompts import MEMORY_JUDGE_PROMPT
+from model.errors import LLMError
+from memory.extract import MemoryExtractor
+from observability.metrics import get_registry
+
+
+def _is_history_file(path):
+    name = os.path.basename(path)
+    if name.endswith(".gz"):
+        name = name[:-3]
+    base, _, suffix = name.rpartition(".")
+    return name.endswith((".json", ".jsonl")) or (suffix.isdigit() and base.endswith(".jsonl"))
+
+
+def iter_history_files(paths):
+    """
+    展开文件与目录
+
+    Args:
+        paths (list): 文件或目录路径
+
+    Yields:
+        str: 对话记录文件的绝对路径，目录内按文件名排序
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if _is_history_file(name):
+                        yield os.path.abspath(os.path.join(root, name))
+        else:
+            yield os.path.abspath(path)
+
+
+def iter_exchanges(path):
+    """
+    流式读取一个文件中的对话记录
+
+    .json 文件为 save_history 写出的数组（受最大对话轮数限制，整体读取）；其他文件
+    按 JSONL 逐行读取，.gz 结尾时先解压。清空标记等非对话记录与残缺行被跳过。
+
+    Args:
+        path (str): 文件路径
+
+    Yields:
+        tuple: (在文件中的序号, 对话记录)
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        if path.endswith((".json", ".json.gz")):
+            records = json.load(f)
+        else:
+            records = _iter_json_lines(f)
+        for index, record in enumerate(records):
+            if isinstance(record, dict) and record.get("user"):
+                yield index, record
+
+
+def _iter_json_lines(f):
+    for line in f:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            # 写入中断造成的残缺行
+            yield None
+
+
+class MemoryBackfill:
+    """
+    批量回填：并发判断与提取，结果写入检查点文件，最后一次性建索引
+    """
+
+    def __init__(self, llm_client, checkpoint_file, workers=4, progress_every=100):
+        """
+        Args:
+            llm_client: LLM 客户端（GrokClient），判断与提取调用在线程池中并发执行
+            checkpoint_file (str): 检查点文件路径（JSONL）
+            workers (int): 并发处理的对话数，即同时在途的LLM请求上限
+            progress_every (int): 每处理多少条对话打印一次进度
+        """
+        self.llm_client = llm_client
+        self.extractor = MemoryExtractor(llm_client)
+        self.checkpoint_file = checkpoint_file
+        self.workers = workers
+        self.progress_every = progress_every
+        self.registry = get_registry()
+
+        directory = os.path.dirname(checkpoint_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _read_checkpoint(self):
+        """逐行读取检查点文件中的记录"""
+        if not os.path.exists(self.checkpoint_file):
+            return
+        with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def completed(self):
+        """
+        已处理的对话
+
+        Returns:
+            set: (文件路径, 序号) 集合
+        """
+        return {(record["file"], record["index"]) for record in self._read_checkpoint()}
+
+    def analyze(self, content):
+        """
+        判断一条用户消息是否需要记忆，需要时提取记忆
+
+        Args:
+            content (str): 用户消息
+
+        Returns:
+            list: 提取的记忆（字典），无需记忆时为空列表
+
+        Raises:
+            LLMError: 判断请求失败
+            Exception: 提取请求或解析失败
+        """
+        try:
+            response = self.llm_client.ask(
+                prompt=content,
+                system_message=MEMORY_JUDGE_PROMPT,
+                use_cache=True,
+                call_site="judge"
+            )
+        except LLMError:
+            self.registry.inc("memory_judgements_total", result="error")
+            raise
+        remember = MemoryManager.is_positive_judgement(response)
+        self.registry.inc("memory_judgements_total", result="positive" if remember else "negative")
+        if not remember:
+            return []
+
+        memories = self.extractor.extract(content, raise_errors=True)
+        MemoryManager.count_extraction(self.registry, memories)
+        return [memory.dict() for memory in memories]
+
+    def extract(self, paths, limit=None):
+        """
+        提取阶段：并发处理所有未处理过的对话，结果追加到检查点文件
+
+        同时在途的对话数不超过 workers 的两倍，文件按需读取，内存占用与文件总量无关。
+
+        Args:
+            paths (list): 文件或目录路径
+            limit (int, optional): 本次最多处理的对话数
+
+        Returns:
+            dict: 本次处理、跳过、失败的对话数与提取的记忆数
+        """
+        done = self.completed()
+        stats = {"processed": 0, "skipped": 0, "failed": 0, "remembered": 0, "memories": 0}
+        start = time.monotonic()
+
+        def pending():
+            submitted = 0
+            for path in iter_history_files(paths):
+                try:
+                    for index, record in iter_exchanges(path):
+                        if (path, index) in done:
+                            stats["skipped"] += 1
+                            continue
+                        if limit is not None and submitted >= limit:
+                            return
+                        submitted += 1
+                        yield path, index, record["user"]
+                except (OSError, ValueError) as e:
+                    print(f"❗ 读取 {path} 失败: {e}", file=sys.stderr)
+
+        with open(self.checkpoint_file, 'a', encoding='utf-8') as checkpoint, \
+                ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="backfill") as pool:
+
+            def collect(finished):
+                for future in finished:
+                    path, index = futures.pop(future)
+                    try:
+                        memories = future.result()
+                    except Exception as e:
+                        stats["failed"] += 1
+                        print(f"❗ {os.path.basename(path)} 第 {index + 1} 条处理失败: {e}", file=sys.stderr)
+                        continue
+                    checkpoint.write(json.dumps({"file": path, "index": index, "memories": memories},
+                                                ensure_ascii=False) + "\n")
+                    checkpoint.flush()
+                    stats["processed"] += 1
+                    stats["remembered"] += bool(memories)
+                    stats["memories"] += len(memories)
+                    if stats["processed"] % self.progress_every == 0:
+                        rate = stats["processed"] / (time.monotonic() - start)
+                        print(f"📥 已处理 {stats['processed']} 条对话（{rate:.1f} 条/秒），"
+                              f"提取 {stats['memories']} 条记忆，失败 {stats['failed']} 条", file=sys.stderr)
+
+            futures = {}
+            for path, index, content in pending():
+                if len(futures) >= self.workers * 2:
+                    finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    collect(finished)
+                futures[pool.submit(self.analyze, content)] = (path, index)
+            while futures:
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                collect(finished)
+
+        stats["seconds"] = time.monotonic() - start
+        return stats
+
+    def build_index(self, embedder, batch_size=256):
+        """
+        建索引阶段：检查点中的全部记忆按批编码写入索引，最后保存一次
+
+        与索引中已有文本（或本次已写入的文本）相同的记忆被跳过，因此可以重复运行。
+        需要训练的索引（IVF）首批至少取 nlist 条用于训练。
+
+        Args:
+            embedder (MemoryEmbedder): 已加载模型与索引的向量化器
+            batch_size (int): 每批编码的记忆数
+
+        Returns:
+            dict: 写入与跳过的记忆数、索引总数与耗时
+        """
+        start = time.monotonic()
+        seen = set(embedder.texts)
+        stats = {"added": 0, "duplicates": 0}
+        first_batch = max(batch_size, embedder.training_size())
+        batch = []
+        for record in self._read_checkpoint():
+            for memory in record.get("memories", []):
+                if memory["content"] in seen:
+                    stats["duplicates"] += 1
+                    continue
+                seen.add(memory["content"])
+                batch.append(memory)
+                if len(batch) >= (batch_size if stats["added"] else first_batch):
+                    embedder.add_memories(batch, save=False)
+                    stats["added"] += len(batch)
+                    batch = []
+        if batch:
+            embedder.add_memories(batch, save=False)
+            stats["added"] += len(batch)
+        if stats["added"]:
+            embedder.save()
+        stats["total"] = embedder.index.ntotal
+        stats["seconds"] = time.monotonic() - start
+        return stats
+
+
+def build_llm_client(config, workers):
+    """
+    创建回填使用的 LLM 客户端
+
+    沿用配置中的模型路由、限流与响应缓存；记忆判断与提取的并发上限改为 workers，
+    并且不取消排队的后台请求（回填没有需要让路的前台对话）。
+    """
+    from model.llm_client import GrokClient
+    from model.response_cache import ResponseCache
+    from model.resilience import ResilientCaller
+    from model.router import ModelRouter
+    from model.scheduler import RequestScheduler
+    from observability.llm_calls import LLMCallRecorder
+    from transport.http_pool import get_shared_pool
+
+    routes = {task: dict(route) for task, route in getattr(config, 'MODEL_ROUTES', {}).items()}
+    for task in ("judge", "extract"):
+        routes.setdefault(task, {})["max_concurrency"] = workers
+
+    cache = None
+    if getattr(config, 'LLM_CACHE_ENABLED', False):
+        cache = ResponseCache(
+            ttl=config.LLM_CACHE_TTL,
+            max_entries=config.LLM_CACHE_MAX_ENTRIES,
+            sqlite_path=getattr(config, 'LLM_CACHE_SQLITE_FILE', None)
+        )
+    return GrokClient(
+        api_key=config.API_KEY,
+        base_url=config.BASE_URL,
+        default_model=config.DEFAULT_MODEL,
+        cache=cache,
+        resilience=ResilientCaller.from_config(config),
+        http_client=get_shared_pool(config).client,
+        instrumentation=LLMCallRecorder.from_config(config),
+        router=ModelRouter(routes),
+        scheduler=RequestScheduler(
+            rpm=getattr(config, 'LLM_RATE_LIMIT_RPM', None),
+            tpm=getattr(config, 'LLM_RATE_LIMIT_TPM', None),
+            expected_completion_tokens=getattr(config, 'LLM_EXPECTED_COMPLETION_TOKENS', 256),
+        ),
+    )
+
+
+def main():
+    import config
+    from vector.embedder import MemoryEmbedder
+
+    parser = argparse.ArgumentParser(description="把保存的历史对话批量转换为向量记忆")
+    parser.add_argument("paths", nargs="*", help="对话记录文件或目录（.json / .jsonl / 日志分段）")
+    parser.add_argument("--checkpoint", default=getattr(config, 'BACKFILL_CHECKPOINT_FILE',
+                                                        os.path.join(config.DATA_DIR, "backfill.jsonl")),
+                        help="检查点文件，中断后重新运行会跳过已处理的对话")
+    parser.add_argument("--workers", type=int, default=getattr(config, 'BACKFILL_WORKERS', 4),
+                        help="并发处理的对话数（同时在途的LLM请求上限）")
+    parser.add_argument("--batch-size", type=int, default=getattr(config, 'BACKFILL_ENCODE_BATCH_SIZE', 256),
+                        help="建索引时每批编码的记忆数")
+    parser.add_argument("--limit", type=int, help="本次最多处理的对话数")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--extract-only", action="store_true", help="只执行提取阶段")
+    group.add_argument("--index-only", action="store_true", help="只根据检查点文件建索引")
+    args = parser.parse_args()
+
+    if not args.index_only and not args.paths:
+        parser.error("需要指定对话记录文件或目录")
+
+    os.makedirs(config.DATA_DIR, exist_ok=True)
+    llm_client = None if args.index_only else build_llm_client(config, args.workers)
+    backfill = MemoryBackfill(llm_client, args.checkpoint, args.workers)
+
+    if not args.index_only:
+        stats = backfill.extract(args.paths, args.limit)
+        print(f"✅ 提取完成: 处理 {stats['processed']} 条对话（跳过已处理 {stats['skipped']} 条，"
+              f"失败 {stats['failed']} 条），{stats['remembered']} 条需要记忆，提取 {stats['memories']} 条记忆，"
+              f"耗时 {stats['seconds']:.1f}s")
+        if stats["failed"]:
+            print("⚠️ 失败的对话未写入检查点，重新运行即可重试")
+        llm_client.resilience.close()
+
+    if not args.extract_only:
+        embedder = MemoryEmbedder(config)
+        embedder.load_or_create_index()
+        stats = backfill.build_index(embedder, args.batch_size)
+        print(f"💾 索引已保存: 新增 {stats['added']} 条记忆（跳过重复 {stats['duplicates']} 条），"
+              f"共 {stats['total']} 条，耗时 {stats['seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -27,12 +27,13 @@ class MemoryExtractor:
         """
         self.llm_client = llm_client
         
-    def extract(self, user_input):
+    def extract(self, user_input, raise_errors=False):
         """
         从用户输入中提取结构化记忆
         
         Args:
             user_input (str): 用户输入内容
+            raise_errors (bool): 请求或解析失败时是否抛出异常（默认返回空列表）
             
         Returns:
             list: 提取的记忆项列表
@@ -42,19 +43,50 @@ class MemoryExtractor:
             extraction = self.llm_client.ask_json(
                 prompt=user_input,
                 system_message=MEMORY_EXTRACTION_PROMPT,
-                response_model=MemoryExtraction
+                response_model=MemoryExtraction,
+                use_cache=True,
+                call_site="extract"
             )
             
-            # 添加时间戳和来源
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            for memory in extraction.memories:
-                if not memory.timestamp:
-                    memory.timestamp = current_time
-                if not memory.source:
-                    memory.source = user_input[:100] + ("..." if len(user_input) > 100 else "")
-                    
-            return extraction.memories
+            return self._finalize(extraction, user_input)
             
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"记忆提取失败: {e}")
-            return []
\ No newline at end of file
+            return []
+    
+    async def extract_async(self, user_input):
+        """
+        从用户输入中提取结构化记忆（llm_client 为 AsyncGrokClient 时使用）
+        
+        Args:
+            user_input (str): 用户输入内容
+            
+        Returns:
+            list: 提取的记忆项列表
+        """
+        try:
+            extraction = await self.llm_client.ask_json(
+                prompt=user_input,
+                system_message=MEMORY_EXTRACTION_PROMPT,
+                response_model=MemoryExtraction,
+                use_cache=True,
+                call_site="extract"
+            )
+            return self._finalize(extraction, user_input)
+            
+        except Exception as e:
+            print(f"记忆提取失败: {e}")
+            return []
+    
+    def _finalize(self, extraction, user_input):
+        """为提取结果补充时间戳和来源"""
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for memory in extraction.memories:
+            if not memory.timestamp:
+                memory.timestamp = current_time
+            if not memory.source:
+                memory.source = user_input[:100] + ("..." if len(user_input) > 100 else "")
+                
+        return extraction.memories
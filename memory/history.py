@@ -1,20 +1,24 @@
 """
 对话历史管理模块
 """
+import os
 import json
 from datetime import datetime
+from .journal import HistoryJournal
 
 class ConversationHistory:
-    def __init__(self, max_turns=10):
+    def __init__(self, max_turns=10, journal=None):
         """
         初始化对话历史管理器
         
         Args:
             max_turns (int): 最大保存的对话轮数
+            journal (HistoryJournal, optional): 追加写入的对话日志
         """
         self.max_turns = max_turns
         self.history = []  # 存储完整对话历史
         self.turn_count = 0  # 当前对话轮数
+        self.journal = journal
     
     def add_exchange(self, user_message, assistant_message):
         """
@@ -28,15 +32,20 @@ class ConversationHistory:
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
         # 添加新的对话轮
-        self.history.append({
+        exchange = {
             "turn": self.turn_count + 1,
             "timestamp": timestamp,
             "user": user_message,
             "assistant": assistant_message
-        })
+        }
+        self.history.append(exchange)
         
         self.turn_count += 1
         
+        # 追加到日志
+        if self.journal:
+            self.journal.append(exchange)
+        
         # 如果超过最大轮数，移除最早的对话
         if len(self.history) > self.max_turns:
             self.history.pop(0)
@@ -77,24 +86,51 @@ class ConversationHistory:
         """
         self.history = []
         self.turn_count = 0
+        if self.journal:
+            self.journal.mark_clear()
+    
+    def restore_from_journal(self):
+        """
+        从对话日志末尾恢复最近的对话历史
+        """
+        if not self.journal:
+            return
+        self._restore(self.journal)
+    
+    def _restore(self, journal):
+        """从日志末尾读取最近 max_turns 轮作为当前历史"""
+        self.history = journal.tail(self.max_turns)
+        if self.history:
+            self.turn_count = max(exchange.get("turn", 0) for exchange in self.history)
     
     def save_to_file(self, filename):
         """
-        将对话历史保存到文件
+        将对话历史保存到文件，.jsonl 后缀按行写入
         
         Args:
             filename (str): 文件名
         """
+        if filename.endswith('.jsonl'):
+            with open(filename, 'w', encoding='utf-8') as f:
+                for exchange in self.history:
+                    f.write(json.dumps(exchange, ensure_ascii=False) + "\n")
+            return
         with open(filename, 'w', encoding='utf-8') as f:
             json.dump(self.history, f, ensure_ascii=False, indent=2)
     
     def load_from_file(self, filename):
         """
-        从文件加载对话历史
+        从文件加载对话历史，.jsonl 后缀只从文件末尾读取最近的对话
         
         Args:
             filename (str): 文件名
         """
+        if filename.endswith('.jsonl'):
+            if not os.path.exists(filename):
+                print(f"文件不存在: {filename}")
+                return
+            self._restore(HistoryJournal(filename))
+            return
         try:
             with open(filename, 'r', encoding='utf-8') as f:
                 self.history = json.load(f)
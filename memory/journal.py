@@ -0,0 +1,210 @@
+"""
+对话历史日志模块 - 以追加写入的JSONL格式持久化对话历史
+"""
+import os
+import gzip
+import json
+import shutil
+import threading
+
+
+class HistoryJournal:
+    """
+    追加写入的对话日志
+
+    每轮对话写入一行JSON，写入成本与历史总长度无关；加载时从文件末尾
+    反向读取最近的N行，加载成本与文件总大小无关。活动文件超过
+    max_bytes 后轮转为分段文件（可选gzip压缩）。
+    """
+
+    CLEAR_EVENT = "clear"
+
+    def __init__(self, filename, max_bytes=8 * 1024 * 1024, compress_rotated=True, block_size=64 * 1024):
+        """
+        初始化对话日志
+
+        Args:
+            filename (str): 日志文件路径
+            max_bytes (int): 活动文件轮转阈值（字节），0 表示不轮转
+            compress_rotated (bool): 是否用gzip压缩轮转后的分段
+            block_size (int): 反向读取时每次读取的块大小
+        """
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.compress_rotated = compress_rotated
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._file = None
+
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _open(self):
+        """以追加模式打开活动文件"""
+        if self._file is None:
+            self._file = open(self.filename, 'ab')
+        return self._file
+
+    def append(self, exchange):
+        """
+        追加一轮对话
+
+        Args:
+            exchange (dict): 对话记录
+        """
+        line = (json.dumps(exchange, ensure_ascii=False) + "\n").encode('utf-8')
+        with self._lock:
+            f = self._open()
+            f.write(line)
+            f.flush()
+            if self.max_bytes and f.tell() >= self.max_bytes:
+                self._rotate()
+
+    def mark_clear(self):
+        """写入清空标记，加载时不会越过该标记恢复更早的对话"""
+        self.append({"event": self.CLEAR_EVENT})
+
+    def close(self):
+        """关闭活动文件"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _segments(self):
+        """
+        列出已轮转的分段文件
+
+        Returns:
+            list: (序号, 路径) 列表，按序号升序排列（序号越大越新）
+        """
+        directory = os.path.dirname(self.filename) or "."
+        base = os.path.basename(self.filename) + "."
+        segments = []
+        for name in os.listdir(directory):
+            if not name.startswith(base):
+                continue
+            suffix = name[len(base):]
+            if suffix.endswith(".gz"):
+                suffix = suffix[:-3]
+            if suffix.isdigit():
+                segments.append((int(suffix), os.path.join(directory, name)))
+        segments.sort()
+        return segments
+
+    def _rotate(self):
+        """将活动文件轮转为新的分段（调用方需持有锁）"""
+        self._file.close()
+        self._file = None
+
+        segments = self._segments()
+        next_index = segments[-1][0] + 1 if segments else 1
+        target = f"{self.filename}.{next_index}"
+        os.replace(self.filename, target)
+
+        if self.compress_rotated:
+            with open(target, 'rb') as src, gzip.open(target + ".gz", 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(target)
+
+    def _reversed_lines(self, path):
+        """
+        从文件末尾开始按行反向读取
+
+        Args:
+            path (str): 文件路径
+
+        Yields:
+            bytes: 非空行内容
+        """
+        if path.endswith(".gz"):
+            # 分段大小受 max_bytes 限制，整体解压的成本是有界的
+            with gzip.open(path, 'rb') as f:
+                lines = f.read().split(b"\n")
+            for line in reversed(lines):
+                if line.strip():
+                    yield line
+            return
+
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            remainder = b""
+            while position > 0:
+                read_size = min(self.block_size, position)
+                position -= read_size
+                f.seek(position)
+                lines = (f.read(read_size) + remainder).split(b"\n")
+                remainder = lines.pop(0)
+                for line in reversed(lines):
+                    if line.strip():
+                        yield line
+            if remainder.strip():
+                yield remainder
+
+    def _reversed_entries(self):
+        """从最新到最旧遍历全部日志记录"""
+        paths = []
+        if os.path.exists(self.filename):
+            paths.append(self.filename)
+        paths.extend(path for _, path in reversed(self._segments()))
+
+        for path in paths:
+            for line in self._reversed_lines(path):
+                try:
+                    yield json.loads(line.decode('utf-8'))
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    # 跳过写入中断造成的残缺行
+                    continue
+
+    def tail(self, n):
+        """
+        读取最近的N轮对话
+
+        Args:
+            n (int): 读取的轮数
+
+        Returns:
+            list: 对话记录列表，按时间先后排列
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+        entries = []
+        if n <= 0:
+            return entries
+        for entry in self._reversed_entries():
+            if entry.get("event") == self.CLEAR_EVENT:
+                break
+            entries.append(entry)
+            if len(entries) >= n:
+                break
+        entries.reverse()
+        return entries
+
+    def iter_entries(self):
+        """
+        按时间先后流式遍历全部对话记录（包括已轮转的分段）
+
+        Yields:
+            dict: 对话记录
+        """
+        paths = [path for _, path in self._segments()]
+        if os.path.exists(self.filename):
+            paths.append(self.filename)
+
+        for path in paths:
+            opener = gzip.open if path.endswith(".gz") else open
+            with opener(path, 'rb') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        entry = json.loads(line.decode('utf-8'))
+                    except (UnicodeDecodeError, json.JSONDecodeError):
+                        continue
+                    if entry.get("event") == self.CLEAR_EVENT:
+                        continue
+                    yield entry
@@ -2,6 +2,7 @@
 记忆判断模块 - 判断用户输入是否包含需要记忆的信息
 """
 from model.prompts import MEMORY_JUDGE_PROMPT
+from model.errors import LLMError
 
 class MemoryJudge:
     def __init__(self, llm_client):
@@ -23,11 +24,17 @@ class MemoryJudge:
         Returns:
             bool: 是否应该记忆
         """
-        # 使用 LLM 进行判断
-        response = self.llm_client.ask(
-            prompt=user_input,
-            system_message=MEMORY_JUDGE_PROMPT
-        )
+        # 使用 LLM 进行判断，请求失败视为无需记忆
+        try:
+            response = self.llm_client.ask(
+                prompt=user_input,
+                system_message=MEMORY_JUDGE_PROMPT,
+                use_cache=True,
+                call_site="judge"
+            )
+        except LLMError as e:
+            print(f"记忆判断请求失败: {e}")
+            return False
         
         # 处理回复
         return response.lower().strip() in ["是", "yes", "true", "1"]
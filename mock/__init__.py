@@ -0,0 +1,7 @@
+"""
+离线测试与压测用的模拟服务
+"""
+from .llm_server import MockLLMServer, ScriptedResponses, LatencyDistribution
+from .amap_server import MockAmapServer
+
+__all__ = ['MockLLMServer', 'ScriptedResponses', 'LatencyDistribution', 'MockAmapServer']
@@ -0,0 +1,169 @@
+"""
+本地高德天气接口替身 - 返回确定的天气数据并统计请求次数，用于离线验证天气缓存
+
+用法:
+    python -m mock.amap_server --port 8766
+
+然后将 config.AMAP_BASE_URL 设为 http://127.0.0.1:8766 即可。
+"""
+import json
+import time
+import argparse
+import threading
+from datetime import datetime, timezone, timedelta
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from functions.city_codes import CITY_ADCODES
+
+_CHINA_TZ = timezone(timedelta(hours=8))
+
+
+class MockAmapServer:
+    """
+    高德天气接口替身
+
+        with MockAmapServer(latency=0.1) as server:
+            get_weather("北京", base_url=server.base_url)
+            assert server.requests == 1
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, reporttime=None):
+        """
+        Args:
+            host (str): 监听地址
+            port (int): 监听端口，0 表示自动分配
+            latency (float): 每个请求的固定延迟（秒）
+            reporttime (str, optional): 返回数据的发布时间，默认为当前整点（北京时间）
+        """
+        self.latency = latency
+        self.reporttime = reporttime
+        self.requests = 0
+        self.requested_cities = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._names = {code: name for name, code in CITY_ADCODES.items()}
+
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self):
+        """传给 get_weather 的 base_url"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """在后台线程中启动服务"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务"""
+        if self._thread is not None:
+            self.httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _current_reporttime(self):
+        if self.reporttime:
+            return self.reporttime
+        return datetime.now(_CHINA_TZ).strftime("%Y-%m-%d %H:00:00")
+
+    def build_payload(self, city, extensions):
+        """
+        生成与高德接口格式一致的响应
+
+        Args:
+            city (str): 请求中的 city 参数（adcode 或城市名）
+            extensions (str): base 或 all
+
+        Returns:
+            dict: 响应体
+        """
+        adcode = city if city.isdigit() else CITY_ADCODES.get(city.rstrip("市"))
+        name = self._names.get(adcode)
+        if name is None:
+            return {"status": "0", "info": "INVALID_PARAMS", "infocode": "20000"}
+
+        reporttime = self._current_reporttime()
+        display = name if adcode in ("110000", "120000", "310000", "500000") else name + "市"
+        if extensions == "all":
+            today = datetime.now(_CHINA_TZ).date()
+            casts = [
+                {
+                    "date": str(today + timedelta(days=offset)),
+                    "week": str((today + timedelta(days=offset)).isoweekday()),
+                    "dayweather": "晴", "nightweather": "多云",
+                    "daytemp": str(25 + offset), "nighttemp": str(15 + offset),
+                    "daywind": "南", "nightwind": "南",
+                    "daypower": "1-3", "nightpower": "1-3",
+                }
+                for offset in range(4)
+            ]
+            return {"status": "1", "count": "1", "info": "OK", "infocode": "10000",
+                    "forecasts": [{"city": display, "adcode": adcode, "province": name,
+                                   "reporttime": reporttime, "casts": casts}]}
+        return {"status": "1", "count": "1", "info": "OK", "infocode": "10000",
+                "lives": [{"province": name, "city": display, "adcode": adcode, "weather": "晴",
+                           "temperature": "22", "winddirection": "南", "windpower": "≤3",
+                           "humidity": "40", "reporttime": reporttime}]}
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+                if parsed.path.rstrip("/") != "/v3/weather/weatherInfo":
+                    body = {"status": "0", "info": "INVALID_USER_SCODE"}
+                else:
+                    with server._lock:
+                        server.requests += 1
+                        server.requested_cities.append(query.get("city", ""))
+                    time.sleep(server.latency)
+                    body = server.build_payload(query.get("city", ""), query.get("extensions", "base"))
+
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json;charset=UTF-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地高德天气接口替身")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8766, help="监听端口")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的固定延迟（秒）")
+    args = parser.parse_args()
+
+    server = MockAmapServer(host=args.host, port=args.port, latency=args.latency)
+    print(f"🧪 高德天气接口替身已启动: {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("再见！")
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,472 @@
+"""
+本地模拟 LLM 服务 - 兼容 GrokClient 使用的 OpenAI 接口子集，用于离线压测
+
+支持 /v1/chat/completions 的普通回复、JSON 模式（json_object）、结构化解析
+（json_schema，即 beta.chat.completions.parse）、工具调用与 SSE 流式输出。
+首字延迟按可配置的分布随机生成，生成阶段按 tokens/秒 的速率输出，回复内容
+可以通过脚本规则指定。
+
+用法:
+    python -m mock.llm_server --port 8765 --latency lognormal:0.4,0.5 --tokens-per-second 60 --script rules.json
+
+然后将 config.BASE_URL 设为 http://127.0.0.1:8765/v1 即可。
+"""
+import re
+import json
+import math
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+# 中文按字、英文按词、标点单独计为一个token，前导空白并入后一个token
+_TOKEN_PATTERN = re.compile(r"\s*(?:[\u4e00-\u9fff]|[A-Za-z0-9_]+|[^\sA-Za-z0-9_\u4e00-\u9fff])|\s+$")
+
+
+def split_tokens(text):
+    """
+    将文本切分为近似的token序列，拼接后与原文一致（尾部空白除外）
+
+    Args:
+        text (str): 文本
+
+    Returns:
+        list: token 字符串列表
+    """
+    return _TOKEN_PATTERN.findall(text or "")
+
+
+def count_message_tokens(messages):
+    """估算消息列表的输入token数"""
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        total += len(split_tokens(content or "")) + 4
+        for call in message.get("tool_calls") or []:
+            total += len(split_tokens(call.get("function", {}).get("arguments", "")))
+    return total
+
+
+class LatencyDistribution:
+    """
+    首字延迟分布
+
+    规格字符串格式:
+        fixed:0.2             固定 0.2 秒
+        uniform:0.1,0.5       均匀分布
+        normal:0.3,0.1        正态分布（均值, 标准差），截断到 0 以上
+        lognormal:0.3,0.6     对数正态分布（中位数, sigma），长尾更接近真实上游
+        exp:0.3               指数分布（均值）
+    """
+
+    def __init__(self, spec="fixed:0", rng=None):
+        self.spec = spec
+        self.rng = rng or random.Random()
+        kind, _, params = spec.partition(":")
+        self.kind = kind.strip().lower()
+        self.params = [float(value) for value in params.split(",") if value.strip()]
+        if self.kind not in ("fixed", "uniform", "normal", "lognormal", "exp"):
+            raise ValueError(f"不支持的延迟分布: {spec}")
+
+    def sample(self):
+        """抽取一个延迟秒数"""
+        p = self.params
+        if self.kind == "fixed":
+            value = p[0] if p else 0.0
+        elif self.kind == "uniform":
+            value = self.rng.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            value = self.rng.gauss(p[0], p[1])
+        elif self.kind == "lognormal":
+            value = self.rng.lognormvariate(math.log(p[0]), p[1])
+        else:
+            value = self.rng.expovariate(1.0 / p[0]) if p[0] > 0 else 0.0
+        return max(0.0, value)
+
+
+def example_from_schema(schema, root=None):
+    """
+    根据 JSON Schema 生成一个合法的示例值，用于没有脚本规则时的结构化输出
+
+    Args:
+        schema (dict): JSON Schema
+        root (dict, optional): 根 schema，用于解析 $ref
+
+    Returns:
+        any: 示例值
+    """
+    root = root or schema
+    if "$ref" in schema:
+        target = root
+        for part in schema["$ref"].lstrip("#/").split("/"):
+            target = target[part]
+        return example_from_schema(target, root)
+    for key in ("anyOf", "oneOf", "allOf"):
+        if schema.get(key):
+            return example_from_schema(schema[key][0], root)
+    if "default" in schema:
+        return schema["default"]
+    if schema.get("enum"):
+        return schema["enum"][0]
+    if "const" in schema:
+        return schema["const"]
+
+    kind = schema.get("type", "object")
+    if isinstance(kind, list):
+        kind = next((item for item in kind if item != "null"), "null")
+    if kind == "object":
+        return {
+            name: example_from_schema(prop, root)
+            for name, prop in (schema.get("properties") or {}).items()
+        }
+    if kind == "array":
+        return [example_from_schema(schema.get("items") or {"type": "string"}, root)]
+    if kind == "string":
+        return "示例"
+    if kind == "integer":
+        return max(1, int(schema.get("minimum", 1)))
+    if kind == "number":
+        low, high = schema.get("minimum", 0.0), schema.get("maximum", 1.0)
+        return (low + high) / 2
+    if kind == "boolean":
+        return True
+    return None
+
+
+class ScriptedResponses:
+    """
+    脚本化回复规则
+
+    规则文件为 JSON 列表，按顺序匹配，第一条命中的规则生效。每条规则可包含:
+        match      正则，匹配最后一条 user 消息（省略时匹配任意内容）
+        system     正则，匹配 system 消息
+        content    回复文本
+        json       JSON 模式或结构化解析时返回的对象
+        tool_calls [{"name": 函数名, "arguments": 参数对象}]，仅在请求提供了 tools
+                   且最后一条消息来自用户时生效（工具结果回传后改为普通回复）
+    """
+
+    def __init__(self, rules=None):
+        self.rules = []
+        for rule in rules or []:
+            compiled = dict(rule)
+            compiled["_match"] = re.compile(rule["match"], re.S) if rule.get("match") else None
+            compiled["_system"] = re.compile(rule["system"], re.S) if rule.get("system") else None
+            self.rules.append(compiled)
+
+    @classmethod
+    def load(cls, filename):
+        """从 JSON 文件加载规则"""
+        with open(filename, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def find(self, messages, can_call_tools):
+        """
+        查找匹配的规则
+
+        Args:
+            messages (list): 请求消息列表
+            can_call_tools (bool): 本次请求是否允许返回工具调用
+
+        Returns:
+            dict or None: 命中的规则
+        """
+        user_text = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        system_text = "\n".join(m.get("content") or "" for m in messages if m.get("role") == "system")
+        for rule in self.rules:
+            if rule.get("tool_calls") and not can_call_tools:
+                continue
+            if rule["_match"] and not rule["_match"].search(user_text):
+                continue
+            if rule["_system"] and not rule["_system"].search(system_text):
+                continue
+            return rule
+        return None
+
+
+class MockLLMServer:
+    """
+    模拟 LLM 服务
+
+    可在代码中启动（压测、离线调试），也可通过命令行独立运行:
+
+        with MockLLMServer(latency="lognormal:0.3,0.5", tokens_per_second=80) as server:
+            client = GrokClient(api_key="mock", base_url=server.base_url)
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency="fixed:0", tokens_per_second=0,
+                 script=None, error_rate=0.0, seed=None):
+        """
+        Args:
+            host (str): 监听地址
+            port (int): 监听端口，0 表示自动分配
+            latency (str or LatencyDistribution): 首字延迟分布
+            tokens_per_second (float): 生成速度，0 表示不限速
+            script (ScriptedResponses or list, optional): 回复规则
+            error_rate (float): 随机返回 503 错误的比例，用于验证重试与熔断
+            seed (int, optional): 随机数种子，便于复现
+        """
+        self.rng = random.Random(seed)
+        self.latency = latency if isinstance(latency, LatencyDistribution) else LatencyDistribution(latency, self.rng)
+        self.tokens_per_second = tokens_per_second
+        self.script = script if isinstance(script, ScriptedResponses) else ScriptedResponses(script)
+        self.error_rate = error_rate
+
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self):
+        """传给 GrokClient 的 base_url"""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """在后台线程中启动服务"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务"""
+        if self._thread is not None:
+            self.httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self):
+        """获取请求计数"""
+        with self._lock:
+            return {"requests": self.requests, "errors": self.errors}
+
+    def _should_fail(self):
+        with self._lock:
+            self.requests += 1
+            if self.error_rate and self.rng.random() < self.error_rate:
+                self.errors += 1
+                return True
+        return False
+
+    def _token_delay(self):
+        return 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def build_reply(self, request):
+        """
+        根据请求生成回复
+
+        Args:
+            request (dict): chat completions 请求体
+
+        Returns:
+            tuple: (回复文本或None, 工具调用列表或None)，工具调用为 {"id", "name", "arguments"(JSON字符串)}
+        """
+        messages = request.get("messages") or []
+        tools = request.get("tools") or []
+        can_call_tools = bool(tools) and request.get("tool_choice") != "none" \
+            and bool(messages) and messages[-1].get("role") == "user"
+        rule = self.script.find(messages, can_call_tools) or {}
+
+        if rule.get("tool_calls"):
+            return None, [
+                {
+                    "id": f"call_{uuid.uuid4().hex[:12]}",
+                    "name": call["name"],
+                    "arguments": json.dumps(call.get("arguments", {}), ensure_ascii=False),
+                }
+                for call in rule["tool_calls"]
+            ]
+
+        response_format = request.get("response_format") or {}
+        format_type = response_format.get("type")
+        if format_type == "json_schema":
+            schema = response_format.get("json_schema", {}).get("schema", {})
+            value = rule["json"] if "json" in rule else example_from_schema(schema)
+            return json.dumps(value, ensure_ascii=False), None
+        if format_type == "json_object":
+            value = rule.get("json", {"result": rule.get("content", "示例")})
+            return json.dumps(value, ensure_ascii=False), None
+
+        if "content" in rule:
+            return rule["content"], None
+        user_text = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        if messages and messages[-1].get("role") == "tool":
+            return "根据工具返回的结果，" + (messages[-1].get("content") or "")[:80], None
+        return f"模拟回复: {user_text[:50]}", None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, body):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+                else:
+                    self._send_json(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError:
+                    self._send_json(400, {"error": {"message": "invalid JSON body"}})
+                    return
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "not found"}})
+                    return
+
+                time.sleep(server.latency.sample())
+                if server._should_fail():
+                    self._send_json(503, {"error": {"message": "mock upstream unavailable", "type": "server_error"}})
+                    return
+
+                content, tool_calls = server.build_reply(request)
+                if request.get("stream"):
+                    self._stream(request, content, tool_calls)
+                else:
+                    self._complete(request, content, tool_calls)
+
+            def _usage(self, request, content, tool_calls):
+                completion_tokens = len(split_tokens(content or ""))
+                for call in tool_calls or []:
+                    completion_tokens += len(split_tokens(call["arguments"])) + 1
+                prompt_tokens = count_message_tokens(request.get("messages") or [])
+                return {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                }
+
+            def _complete(self, request, content, tool_calls):
+                usage = self._usage(request, content, tool_calls)
+                time.sleep(server._token_delay() * usage["completion_tokens"])
+                message = {"role": "assistant", "content": content}
+                if tool_calls:
+                    message["tool_calls"] = [
+                        {"id": call["id"], "type": "function",
+                         "function": {"name": call["name"], "arguments": call["arguments"]}}
+                        for call in tool_calls
+                    ]
+                self._send_json(200, {
+                    "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "mock"),
+                    "choices": [{
+                        "index": 0,
+                        "message": message,
+                        "finish_reason": "tool_calls" if tool_calls else "stop",
+                    }],
+                    "usage": usage,
+                })
+
+            def _write_event(self, body):
+                data = ("data: " + json.dumps(body, ensure_ascii=False) + "\n\n").encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _stream(self, request, content, tool_calls):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                base = {
+                    "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": request.get("model", "mock"),
+                }
+
+                def chunk(delta, finish_reason=None):
+                    return {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+                delay = server._token_delay()
+                try:
+                    self._write_event(chunk({"role": "assistant", "content": ""}))
+                    for token in split_tokens(content or ""):
+                        time.sleep(delay)
+                        self._write_event(chunk({"content": token}))
+                    for index, call in enumerate(tool_calls or []):
+                        self._write_event(chunk({"tool_calls": [{
+                            "index": index, "id": call["id"], "type": "function",
+                            "function": {"name": call["name"], "arguments": ""},
+                        }]}))
+                        for token in split_tokens(call["arguments"]):
+                            time.sleep(delay)
+                            self._write_event(chunk({"tool_calls": [{"index": index, "function": {"arguments": token}}]}))
+                    self._write_event(chunk({}, "tool_calls" if tool_calls else "stop"))
+                    if (request.get("stream_options") or {}).get("include_usage"):
+                        self._write_event({**base, "choices": [], "usage": self._usage(request, content, tool_calls)})
+                    done = b"data: [DONE]\n\n"
+                    self.wfile.write(f"{len(done):x}\r\n".encode("ascii") + done + b"\r\n0\r\n\r\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端提前断开
+                    pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟 LLM 服务（OpenAI 兼容接口）")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口")
+    parser.add_argument("--latency", default="fixed:0", help="首字延迟分布，例如 lognormal:0.4,0.5")
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="生成速度，0 表示不限速")
+    parser.add_argument("--script", help="回复规则 JSON 文件")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机返回 503 的比例")
+    parser.add_argument("--seed", type=int, help="随机数种子")
+    args = parser.parse_args()
+
+    server = MockLLMServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        script=ScriptedResponses.load(args.script) if args.script else None,
+        error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    print(f"🧪 模拟LLM服务已启动: {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("再见！")
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
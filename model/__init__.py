@@ -1,6 +1,28 @@
 """
 语言模型客户端包
+
+导出项按需导入；openai SDK 在创建客户端时才导入，只用到提示词或异常类型时不会加载
 """
-from .llm_client import GrokClient
+import importlib
+
+# 导出名 -> 所在子模块，首次访问时才导入（PEP 562）
+_EXPORTS = {
+    'GrokClient': '.llm_client',
+    'AsyncGrokClient': '.async_llm_client',
+    'LLMError': '.errors',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
 
-__all__ = ['GrokClient']
\ No newline at end of file
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
\ No newline at end of file
@@ -0,0 +1,315 @@
+"""
+异步语言模型客户端 - 基于 AsyncOpenAI，供单进程内的大量并发会话使用
+"""
+from collections import deque
+from contextlib import aclosing
+from typing import Type, TypeVar, Optional
+import asyncio
+import json
+
+from .client_base import ClientBase
+from .llm_client import build_messages
+from .streaming import StreamStats
+from .tool_calls import ToolCallAccumulator, parse_function_response
+from .resilience import ResilientCaller
+from .router import ModelRouter
+from .errors import LLMError, classify_exception
+from observability.llm_calls import LLMCallRecorder, usage_tokens
+
+# 泛型类型变量，用于类型提示
+T = TypeVar('T')
+
+
+class AsyncGrokClient(ClientBase):
+    def __init__(self, api_key, base_url, default_model="grok-2", cache=None, resilience=None, http_client=None,
+                 instrumentation=None, router=None, scheduler=None):
+        """
+        初始化异步 Grok API 客户端
+
+        Args:
+            api_key (str): API 密钥
+            base_url (str): API 基础 URL
+            default_model (str): 默认使用的模型
+            cache (ResponseCache, optional): 响应缓存，调用时通过 use_cache=True 按需启用
+            resilience (ResilientCaller, optional): 超时、重试、对冲与熔断策略
+            http_client (httpx.AsyncClient, optional): 共享连接池的异步客户端，见 transport.HttpPool
+            instrumentation (LLMCallRecorder, optional): 调用记录器，默认写入进程内共享的指标注册表
+            router (ModelRouter, optional): 按调用点选择模型并限制并发，见 config.MODEL_ROUTES
+            scheduler (RequestScheduler, optional): 限流与前后台优先级调度，可与其他客户端共享
+        """
+        self.default_model = default_model
+        self.cache = cache
+        self.resilience = resilience or ResilientCaller()
+        self.instrumentation = instrumentation or LLMCallRecorder()
+        self.router = router or ModelRouter()
+        self.scheduler = scheduler
+        # 重试由 resilience 统一控制，关闭 SDK 自带的重试
+        from openai import AsyncOpenAI
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0,
+            http_client=http_client,
+        )
+        # 最近的流式请求统计（首字延迟、生成速度）
+        self.stream_stats = deque(maxlen=100)
+
+    async def _acached(self, cache_key, call_site, model):
+        """读取缓存；启用SQLite层时在执行器中读取（磁盘I/O，且与写入共用一把锁），不阻塞事件循环"""
+        if cache_key is None or not self.cache.persistent:
+            return self._cached(cache_key, call_site, model)
+        return await asyncio.get_running_loop().run_in_executor(None, self._cached, cache_key, call_site, model)
+
+    async def _acache_set(self, cache_key, value):
+        """写入缓存，SQLite层的写入同样在执行器中进行"""
+        if not self.cache.persistent:
+            self.cache.set(cache_key, value)
+            return
+        await asyncio.get_running_loop().run_in_executor(None, self.cache.set, cache_key, value)
+
+    def _admitter(self, call_site, messages, tickets):
+        """GrokClient._admitter 的异步版本，返回协程函数"""
+        if self.scheduler is None:
+            return None
+        priority = self.router.priority(call_site)
+
+        async def admit():
+            tickets.append(await self.scheduler.acquire_async(priority, messages))
+        return admit
+
+    async def _complete(self, call_site, model, messages, timeout=None, parse=False, **kwargs):
+        """发送非流式请求，经过弹性策略并记录调用信息，参数同 GrokClient._complete"""
+        self._log_request(call_site, model, messages)
+        create = self.client.beta.chat.completions.parse if parse else self.client.chat.completions.create
+        async with self.router.aslot(call_site) as queue_time:
+            tickets = []
+            call = self.instrumentation.start(call_site, model)
+            completion = None
+            error = None
+            try:
+                completion = await self.resilience.acall(
+                    call.wrap(lambda timeout: create(
+                        model=model,
+                        messages=messages,
+                        timeout=timeout,
+                        **kwargs
+                    )),
+                    timeout=timeout,
+                    admit=self._admitter(call_site, messages, tickets)
+                )
+            except BaseException as e:
+                # 除 LLMError 外还有取消与中断，调用记录和追踪 span 都需要结束
+                error = e
+                raise
+            finally:
+                call.finish(usage=getattr(completion, 'usage', None), error=error, queue_time=queue_time)
+            self._settle(tickets, *usage_tokens(getattr(completion, 'usage', None)))
+        return completion
+
+    async def ask(self, prompt, model=None, system_message=None, history_messages=None, stream=False, use_cache=False, timeout=None,
+                  call_site="chat"):
+        """
+        向 Grok API 发送请求获取回复
+
+        Args:
+            prompt (str): 用户的提问或提示
+            model (str, optional): 使用的模型名称，如不指定则使用默认模型
+            system_message (str, optional): 系统消息，设置AI角色
+            history_messages (list, optional): 历史对话消息列表
+            stream (bool): 是否以流式方式返回
+            use_cache (bool): 是否使用响应缓存，仅适用于确定性的非流式调用
+            timeout (float, optional): 本次请求的超时秒数
+            call_site (str): 调用点标签，用于区分对话、记忆判断等调用的指标
+
+        Returns:
+            str: Grok 的回复内容；stream=True 时返回逐段产出文本的异步生成器
+
+        Raises:
+            LLMError: 请求失败（重试耗尽、不可重试错误或熔断中）
+        """
+        model = self.router.resolve(call_site, model, self.default_model)
+
+        messages = build_messages(prompt, system_message, history_messages)
+
+        if stream:
+            return self._stream_text(model, messages, timeout, call_site)
+
+        cache_key = self._cache_key(use_cache, model, messages)
+        cached = await self._acached(cache_key, call_site, model)
+        if cached is not None:
+            return cached
+
+        completion = await self._complete(call_site, model, messages, timeout)
+        content = completion.choices[0].message.content
+        if cache_key is not None and content is not None:
+            await self._acache_set(cache_key, content)
+        return content
+
+    async def ask_json(self, prompt, system_message=None, model=None, history_messages=None, response_model: Optional[Type[T]] = None, use_cache=False, timeout=None,
+                       call_site="json"):
+        """
+        请求并返回结构化JSON响应
+
+        Args:
+            prompt (str): 用户的提问或提示
+            system_message (str, optional): 系统消息
+            model (str, optional): 使用的模型名称
+            history_messages (list, optional): 历史对话消息
+            response_model (Type, optional): Pydantic模型类，用于验证和解析响应
+            use_cache (bool): 是否使用响应缓存
+            timeout (float, optional): 本次请求的超时秒数
+            call_site (str): 调用点标签
+
+        Returns:
+            T or dict: 结构化的响应对象，如果指定了response_model则返回该类型的实例
+
+        Raises:
+            LLMError: 请求失败或响应无法解析
+        """
+        model = self.router.resolve(call_site, model, self.default_model)
+
+        messages = build_messages(prompt, system_message, history_messages)
+
+        cache_key = self._cache_key(use_cache, model, messages, response_model or {"type": "json_object"})
+        cached = await self._acached(cache_key, call_site, model)
+        if cached is not None:
+            return response_model.model_validate(cached) if response_model else cached
+
+        if response_model:
+            # 使用parse API进行结构化解析
+            completion = await self._complete(call_site, model, messages, timeout, parse=True,
+                                              response_format=response_model)
+            parsed = completion.choices[0].message.parsed
+            if cache_key is not None and parsed is not None:
+                await self._acache_set(cache_key, parsed.model_dump())
+            return parsed
+
+        # 直接获取JSON响应
+        completion = await self._complete(call_site, model, messages, timeout,
+                                          response_format={"type": "json_object"})
+        try:
+            result = json.loads(completion.choices[0].message.content)
+        except (TypeError, ValueError) as e:
+            raise classify_exception(e) from e
+        if cache_key is not None:
+            await self._acache_set(cache_key, result)
+        return result
+
+    async def ask_with_functions(self, prompt, functions, model=None, system_message=None, history_messages=None, stream=False, timeout=None,
+                                 call_site="chat"):
+        """
+        使用函数调用能力向API发送请求，返回格式与 GrokClient.ask_with_functions 相同
+
+        stream=True 时返回异步事件生成器，事件格式与同步客户端相同。
+
+        Raises:
+            LLMError: 请求失败
+        """
+        messages = build_messages(prompt, system_message, history_messages)
+        return await self.chat(messages, model=model, tools=functions, stream=stream, timeout=timeout, call_site=call_site)
+
+    async def chat(self, messages, model=None, tools=None, tool_choice="auto", stream=False, timeout=None, call_site="chat"):
+        """
+        使用完整的消息列表发送请求，参数与返回格式同 GrokClient.chat
+
+        Raises:
+            LLMError: 请求失败
+        """
+        model = self.router.resolve(call_site, model, self.default_model)
+
+        tool_kwargs = {"tools": tools, "tool_choice": tool_choice} if tools else {}
+
+        if stream:
+            return self._stream_chat(model, messages, timeout, call_site, **tool_kwargs)
+
+        completion = await self._complete(call_site, model, messages, timeout, **tool_kwargs)
+        return parse_function_response(completion.choices[0].message, messages)
+
+    async def _open_stream(self, call, model, messages, timeout=None, admit=None, **kwargs):
+        """创建流式请求（只重试建立连接阶段，每次重试都经过 admit 准入，不做对冲）"""
+        return await self.resilience.acall(
+            call.wrap(lambda timeout: self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=timeout,
+                **kwargs
+            )),
+            timeout=timeout,
+            hedge=False,
+            admit=admit
+        )
+
+    async def _stream_text(self, model, messages, timeout=None, call_site="chat"):
+        """
+        流式请求，逐段产出回复文本
+
+        Yields:
+            str: 增量文本
+
+        Raises:
+            LLMError: 请求失败或流在中途断开
+        """
+        async with aclosing(self._stream_chat(model, messages, timeout, call_site)) as events:
+            async for event in events:
+                if event["type"] == "content":
+                    yield event["content"]
+
+    async def _stream_chat(self, model, messages, timeout=None, call_site="chat", **tool_kwargs):
+        """
+        流式请求，工具调用以增量形式到达时在结束后拼接
+
+        Yields:
+            dict: content 事件与最终的 result 事件
+
+        Raises:
+            LLMError: 请求失败或流在中途断开
+        """
+        async with self.router.aslot(call_site) as queue_time:
+            tickets = []
+            self._log_request(call_site, model, messages)
+            call = self.instrumentation.start(call_site, model, stream=True)
+            stats = StreamStats(model)
+            tool_calls = ToolCallAccumulator()
+            content = []
+            error = None
+            stream = None
+            try:
+                stream = await self._open_stream(call, model, messages, timeout,
+                                                 self._admitter(call_site, messages, tickets), **tool_kwargs)
+                async for chunk in stream:
+                    stats.on_usage(getattr(chunk, 'usage', None))
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.tool_calls:
+                        stats.mark_first_token()
+                        tool_calls.add(delta.tool_calls)
+                    if delta.content:
+                        stats.on_delta(delta.content)
+                        content.append(delta.content)
+                        yield {"type": "content", "content": delta.content}
+                result = tool_calls.to_result("".join(content), messages)
+            except LLMError as e:
+                error = e
+                raise
+            except Exception as e:
+                error = classify_exception(e)
+                raise error from e
+            except BaseException as e:
+                # 调用方提前关闭生成器或任务被取消，不能记为成功
+                error = e
+                raise
+            finally:
+                if stream is not None:
+                    # 调用方提前结束（break、客户端断开）时立即归还HTTP连接，而不是等到垃圾回收
+                    await stream.close()
+                stats.finish()
+                self.stream_stats.append(stats)
+                call.finish(error=error, prompt_tokens=stats.prompt_tokens,
+                            completion_tokens=stats.completion_tokens, ttft=stats.ttft,
+                            queue_time=queue_time)
+                self._settle(tickets, stats.prompt_tokens, stats.completion_tokens)
+
+        yield result
@@ -0,0 +1,48 @@
+"""
+客户端公共部分 - GrokClient 与 AsyncGrokClient 共用的、不涉及I/O的辅助方法
+"""
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ClientBase:
+    """
+    同步与异步客户端的基类
+
+    子类需要设置 cache、instrumentation 与 scheduler 属性；发请求、排队准入与
+    缓存读写的 I/O 部分由子类各自以同步或异步方式实现。
+    """
+
+    @property
+    def last_stream_stats(self):
+        """最近一次流式请求的统计，没有时为 None"""
+        return self.stream_stats[-1] if self.stream_stats else None
+
+    def _cache_key(self, use_cache, model, messages, response_format=None):
+        """调用方启用缓存且已配置缓存时返回缓存键，否则返回 None"""
+        if not use_cache or self.cache is None:
+            return None
+        return self.cache.make_key(model, messages, response_format)
+
+    def _cached(self, cache_key, call_site, model):
+        """读取缓存，命中时同时记录一次缓存调用"""
+        if cache_key is None:
+            return None
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            self.instrumentation.record_cache_hit(call_site, model)
+        return cached
+
+    @staticmethod
+    def _log_request(call_site, model, messages):
+        """DEBUG 级别下输出完整的请求消息"""
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[%s] %s 请求消息: %s", call_site, model,
+                         json.dumps(messages, ensure_ascii=False, default=str))
+
+    def _settle(self, tickets, prompt_tokens, completion_tokens):
+        """按实际用量修正调度器预占的token（同一请求各次尝试的预占相同，修正最后一次即可）"""
+        if tickets and (prompt_tokens is not None or completion_tokens is not None):
+            self.scheduler.settle(tickets[-1], (prompt_tokens or 0) + (completion_tokens or 0))
@@ -0,0 +1,102 @@
+"""
+LLM 调用异常类型 - 取代以字符串形式返回的错误信息
+"""
+import sys
+
+
+class LLMError(Exception):
+    """LLM 调用失败的基类"""
+
+    # 是否可以通过重试恢复
+    retryable = False
+
+    def __init__(self, message, cause=None):
+        super().__init__(message)
+        self.cause = cause
+        # 最终失败前的尝试次数，由重试层填写
+        self.attempts = 1
+
+
+class LLMTimeoutError(LLMError):
+    """请求超时"""
+    retryable = True
+
+
+class LLMConnectionError(LLMError):
+    """网络连接失败"""
+    retryable = True
+
+
+class LLMRateLimitError(LLMError):
+    """触发上游限流"""
+    retryable = True
+
+    def __init__(self, message, cause=None, retry_after=None):
+        super().__init__(message, cause)
+        self.retry_after = retry_after
+
+
+class LLMServerError(LLMError):
+    """上游服务端错误（5xx）"""
+    retryable = True
+
+
+class LLMRequestError(LLMError):
+    """请求本身有误（认证失败、参数错误等4xx），重试无效"""
+
+
+class LLMResponseError(LLMError):
+    """响应内容无法解析"""
+
+
+class CircuitOpenError(LLMError):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+
+class RequestCancelledError(LLMError):
+    """请求在调度队列中排队过久或被主动取消，未发出"""
+
+
+def _retry_after(exc):
+    """从限流响应头中读取建议的等待秒数"""
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_exception(exc):
+    """
+    将底层异常转换为对应的 LLMError 子类
+
+    Args:
+        exc (Exception): 原始异常
+
+    Returns:
+        LLMError: 分类后的异常
+    """
+    if isinstance(exc, LLMError):
+        return exc
+    message = str(exc)
+    # 异常来自 openai SDK 时 SDK 必然已导入；未导入时跳过这些判断，避免为分类异常加载 SDK
+    openai = sys.modules.get("openai")
+    if openai is not None:
+        if isinstance(exc, openai.APITimeoutError):
+            return LLMTimeoutError(message, exc)
+        if isinstance(exc, openai.APIConnectionError):
+            return LLMConnectionError(message, exc)
+        if isinstance(exc, openai.RateLimitError):
+            return LLMRateLimitError(message, exc, _retry_after(exc))
+        if isinstance(exc, openai.APIStatusError):
+            if exc.status_code >= 500 or exc.status_code == 408:
+                return LLMServerError(message, exc)
+            return LLMRequestError(message, exc)
+    if isinstance(exc, TimeoutError):
+        return LLMTimeoutError(message or "请求超时", exc)
+    if isinstance(exc, (ValueError, KeyError, IndexError)):
+        return LLMResponseError(message, exc)
+    return LLMError(message, exc)
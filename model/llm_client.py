@@ -1,13 +1,49 @@
-from openai import OpenAI
+from .client_base import ClientBase
 from .prompt_manager import PromptManager
+from .streaming import StreamStats
+from .tool_calls import ToolCallAccumulator, parse_function_response
+from .resilience import ResilientCaller
+from .router import ModelRouter
+from .errors import LLMError, classify_exception
+from observability.llm_calls import LLMCallRecorder, usage_tokens
 from typing import Type, TypeVar, Any, Optional
+from collections import deque
 import json
 
 # 泛型类型变量，用于类型提示
 T = TypeVar('T')
 
-class GrokClient:
-    def __init__(self, api_key, base_url, default_model="grok-2"):
+
+def build_messages(prompt, system_message=None, history_messages=None):
+    """
+    构建API请求的消息列表
+    
+    Args:
+        prompt (str): 用户的提问或提示
+        system_message (str, optional): 系统消息
+        history_messages (list, optional): 历史对话消息列表
+        
+    Returns:
+        list: 消息列表
+    """
+    messages = []
+    
+    # 如果提供了系统消息，添加到消息列表
+    if system_message:
+        messages.append({"role": "system", "content": system_message})
+    
+    # 如果提供了历史消息，添加到消息列表
+    if history_messages:
+        messages.extend(history_messages)
+    
+    # 添加当前用户消息
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+
+class GrokClient(ClientBase):
+    def __init__(self, api_key, base_url, default_model="grok-2", cache=None, resilience=None, http_client=None,
+                 instrumentation=None, router=None, scheduler=None):
         """
         初始化 Grok API 客户端
         
@@ -15,14 +51,95 @@ class GrokClient:
             api_key (str): API 密钥
             base_url (str): API 基础 URL
             default_model (str): 默认使用的模型
+            cache (ResponseCache, optional): 响应缓存，调用时通过 use_cache=True 按需启用
+            resilience (ResilientCaller, optional): 超时、重试、对冲与熔断策略
+            http_client (httpx.Client, optional): 共享连接池的同步客户端，见 transport.HttpPool
+            instrumentation (LLMCallRecorder, optional): 调用记录器，默认写入进程内共享的指标注册表
+            router (ModelRouter, optional): 按调用点选择模型并限制并发，见 config.MODEL_ROUTES
+            scheduler (RequestScheduler, optional): 限流与前后台优先级调度，可与其他客户端共享
         """
         self.default_model = default_model
+        self.cache = cache
+        self.resilience = resilience or ResilientCaller()
+        self.instrumentation = instrumentation or LLMCallRecorder()
+        self.router = router or ModelRouter()
+        self.scheduler = scheduler
+        # openai SDK 导入较慢，创建客户端时才导入；重试由 resilience 统一控制，关闭 SDK 自带的重试
+        from openai import OpenAI
         self.client = OpenAI(
             api_key=api_key,
             base_url=base_url,
+            max_retries=0,
+            http_client=http_client,
         )
+        # 最近的流式请求统计（首字延迟、生成速度）
+        self.stream_stats = deque(maxlen=100)
+    
+    def _admitter(self, call_site, messages, tickets):
+        """
+        创建传给 ResilientCaller 的准入函数：每次尝试（包括重试与对冲请求）都经过调度器排队
+        
+        Args:
+            tickets (list): 准入凭据依次追加到其中，请求完成后传给 _settle
+            
+        Returns:
+            callable or None: 未配置调度器时为 None
+        """
+        if self.scheduler is None:
+            return None
+        priority = self.router.priority(call_site)
+        
+        def admit():
+            tickets.append(self.scheduler.acquire(priority, messages))
+        return admit
+    
+    def _complete(self, call_site, model, messages, timeout=None, parse=False, **kwargs):
+        """
+        发送非流式请求，经过弹性策略并记录调用信息
+        
+        Args:
+            call_site (str): 调用点标签
+            model (str): 模型名称
+            messages (list): 消息列表
+            timeout (float, optional): 本次请求的超时秒数
+            parse (bool): 是否使用结构化解析接口
+            **kwargs: 传给 completions 接口的其他参数
+            
+        Returns:
+            completion 对象
+            
+        Raises:
+            LLMError: 请求失败
+        """
+        self._log_request(call_site, model, messages)
+        create = self.client.beta.chat.completions.parse if parse else self.client.chat.completions.create
+        with self.router.slot(call_site) as queue_time:
+            tickets = []
+            call = self.instrumentation.start(call_site, model)
+            completion = None
+            error = None
+            try:
+                completion = self.resilience.call(
+                    call.wrap(lambda timeout: create(
+                        model=model,
+                        messages=messages,
+                        timeout=timeout,
+                        **kwargs
+                    )),
+                    timeout=timeout,
+                    admit=self._admitter(call_site, messages, tickets)
+                )
+            except BaseException as e:
+                # 除 LLMError 外还有取消与中断，调用记录和追踪 span 都需要结束
+                error = e
+                raise
+            finally:
+                call.finish(usage=getattr(completion, 'usage', None), error=error, queue_time=queue_time)
+            self._settle(tickets, *usage_tokens(getattr(completion, 'usage', None)))
+        return completion
     
-    def ask(self, prompt, model=None, system_message=None, history_messages=None):
+    def ask(self, prompt, model=None, system_message=None, history_messages=None, stream=False, use_cache=False, timeout=None,
+            call_site="chat"):
         """
         向 Grok API 发送请求获取回复
         
@@ -31,35 +148,34 @@ class GrokClient:
             model (str, optional): 使用的模型名称，如不指定则使用默认模型
             system_message (str, optional): 系统消息，设置AI角色
             history_messages (list, optional): 历史对话消息列表
+            stream (bool): 是否以流式方式返回
+            use_cache (bool): 是否使用响应缓存，仅适用于确定性的非流式调用
+            timeout (float, optional): 本次请求的超时秒数
+            call_site (str): 调用点标签，用于区分对话、记忆判断等调用的指标
             
         Returns:
-            str: Grok 的回复内容
+            str: Grok 的回复内容；stream=True 时返回逐段产出文本的生成器
+            
+        Raises:
+            LLMError: 请求失败（重试耗尽、不可重试错误或熔断中）
         """
-        if model is None:
-            model = self.default_model
+        model = self.router.resolve(call_site, model, self.default_model)
             
-        messages = []
+        messages = build_messages(prompt, system_message, history_messages)
         
-        # 如果提供了系统消息，添加到消息列表
-        if system_message:
-            messages.append({"role": "system", "content": system_message})
+        if stream:
+            return self._stream_text(model, messages, timeout, call_site)
         
-        # 如果提供了历史消息，添加到消息列表
-        if history_messages:
-            messages.extend(history_messages)
+        cache_key = self._cache_key(use_cache, model, messages)
+        cached = self._cached(cache_key, call_site, model)
+        if cached is not None:
+            return cached
         
-        # 添加当前用户消息
-        messages.append({"role": "user", "content": prompt})
-        
-        try:
-            completion = self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-            )
-            print(messages)
-            return completion.choices[0].message.content
-        except Exception as e:
-            return f"请求出错: {str(e)}"
+        completion = self._complete(call_site, model, messages, timeout)
+        content = completion.choices[0].message.content
+        if cache_key is not None and content is not None:
+            self.cache.set(cache_key, content)
+        return content
     
     def ask_with_template(self, prompt, template_name, model=None, history_messages=None, **template_vars):
         """使用模板发送请求"""
@@ -72,7 +188,8 @@ class GrokClient:
                 
         return self.ask(prompt, model, system_message, history_messages)
     
-    def ask_json(self, prompt, system_message=None, model=None, history_messages=None, response_model: Optional[Type[T]] = None):
+    def ask_json(self, prompt, system_message=None, model=None, history_messages=None, response_model: Optional[Type[T]] = None, use_cache=False, timeout=None,
+                 call_site="json"):
         """
         请求并返回结构化JSON响应
         
@@ -82,111 +199,183 @@ class GrokClient:
             model (str, optional): 使用的模型名称
             history_messages (list, optional): 历史对话消息
             response_model (Type, optional): Pydantic模型类，用于验证和解析响应
+            use_cache (bool): 是否使用响应缓存
+            timeout (float, optional): 本次请求的超时秒数
+            call_site (str): 调用点标签
             
         Returns:
             T or dict: 结构化的响应对象，如果指定了response_model则返回该类型的实例
+            
+        Raises:
+            LLMError: 请求失败或响应无法解析
         """
-        if model is None:
-            model = self.default_model
+        model = self.router.resolve(call_site, model, self.default_model)
             
-        messages = []
-        
-        # 如果提供了系统消息，添加到消息列表
-        if system_message:
-            messages.append({"role": "system", "content": system_message})
+        messages = build_messages(prompt, system_message, history_messages)
         
-        # 如果提供了历史消息，添加到消息列表
-        if history_messages:
-            messages.extend(history_messages)
+        cache_key = self._cache_key(use_cache, model, messages, response_model or {"type": "json_object"})
+        cached = self._cached(cache_key, call_site, model)
+        if cached is not None:
+            return response_model.model_validate(cached) if response_model else cached
         
-        # 添加当前用户消息
-        messages.append({"role": "user", "content": prompt})
+        if response_model:
+            # 使用parse API进行结构化解析
+            completion = self._complete(call_site, model, messages, timeout, parse=True,
+                                        response_format=response_model)
+            parsed = completion.choices[0].message.parsed
+            if cache_key is not None and parsed is not None:
+                self.cache.set(cache_key, parsed.model_dump())
+            return parsed
         
+        # 直接获取JSON响应
+        completion = self._complete(call_site, model, messages, timeout,
+                                    response_format={"type": "json_object"})
         try:
-            if response_model:
-                # 使用parse API进行结构化解析
-                completion = self.client.beta.chat.completions.parse(
-                    model=model,
-                    messages=messages,
-                    response_format=response_model,
-                )
-                return completion.choices[0].message.parsed
-            else:
-                # 直接获取JSON响应
-                completion = self.client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    response_format={"type": "json_object"},
-                )
-                json_str = completion.choices[0].message.content
-                return json.loads(json_str)
-                
-        except Exception as e:
-            print(f"JSON请求出错: {str(e)}")
-            if response_model:
-                # 返回空模型实例
-                return response_model()
-            return {"error": str(e)}
+            result = json.loads(completion.choices[0].message.content)
+        except (TypeError, ValueError) as e:
+            raise classify_exception(e) from e
+        if cache_key is not None:
+            self.cache.set(cache_key, result)
+        return result
     
-    # 在GrokClient类中添加支持函数调用的方法
-
-    def ask_with_functions(self, prompt, functions, model=None, system_message=None, history_messages=None):
+    def ask_with_functions(self, prompt, functions, model=None, system_message=None, history_messages=None, stream=False, timeout=None,
+                           call_site="chat"):
         """
-        使用函数调用能力向API发送请求，采用单次调用模式
+        使用函数调用能力向API发送请求
+        
+        模型可能一次返回多个工具调用，结果中的 tool_calls 包含全部调用；
+        执行后将 message 与各工具结果追加到 messages 并调用 chat() 即可一次性回传。
+        
+        stream=True 时返回事件生成器：先逐段产出 {"type": "content", "content": 文本}，
+        结束时产出一个与非流式返回格式相同的 {"type": "result", ...} 事件。
+        
+        Returns:
+            dict: 格式见 model.tool_calls.build_function_result
+            
+        Raises:
+            LLMError: 请求失败
         """
-        if model is None:
-            model = self.default_model
+        messages = build_messages(prompt, system_message, history_messages)
+        return self.chat(messages, model=model, tools=functions, stream=stream, timeout=timeout, call_site=call_site)
+    
+    def chat(self, messages, model=None, tools=None, tool_choice="auto", stream=False, timeout=None, call_site="chat"):
+        """
+        使用完整的消息列表发送请求（可包含 assistant 工具调用与 tool 结果消息）
+        
+        Args:
+            messages (list): 消息列表
+            model (str, optional): 使用的模型名称
+            tools (list, optional): 工具定义，不提供时模型只能直接回答
+            tool_choice (str): 工具选择策略，仅在提供 tools 时生效
+            stream (bool): 是否以流式方式返回事件
+            timeout (float, optional): 本次请求的超时秒数
+            call_site (str): 调用点标签，工具结果回传后的请求使用 tool-followup
             
-        messages = []
+        Returns:
+            dict: 格式见 model.tool_calls.build_function_result；stream=True 时返回事件生成器
+            
+        Raises:
+            LLMError: 请求失败
+        """
+        model = self.router.resolve(call_site, model, self.default_model)
         
-        # 如果提供了系统消息，添加到消息列表
-        if system_message:
-            messages.append({"role": "system", "content": system_message})
+        tool_kwargs = {"tools": tools, "tool_choice": tool_choice} if tools else {}
         
-        # 如果提供了历史消息，添加到消息列表
-        if history_messages:
-            messages.extend(history_messages)
+        if stream:
+            return self._stream_chat(model, messages, timeout, call_site, **tool_kwargs)
         
-        # 添加当前用户消息
-        messages.append({"role": "user", "content": prompt})
+        completion = self._complete(call_site, model, messages, timeout, **tool_kwargs)
+        return parse_function_response(completion.choices[0].message, messages)
+    
+    def _open_stream(self, call, model, messages, timeout=None, admit=None, **kwargs):
+        """
+        创建流式请求，并要求服务端在最后一个分块中返回用量
         
-        try:
-            # 发送带函数定义的请求
-            completion = self.client.chat.completions.create(
+        只有建立连接阶段会重试（每次重试都经过 admit 准入）；流式请求不做对冲，避免重复输出。
+        """
+        return self.resilience.call(
+            call.wrap(lambda timeout: self.client.chat.completions.create(
                 model=model,
                 messages=messages,
-                tools=functions,
-                tool_choice="auto",
-                timeout=60
-            )
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=timeout,
+                **kwargs
+            )),
+            timeout=timeout,
+            hedge=False,
+            admit=admit
+        )
+    
+    def _stream_text(self, model, messages, timeout=None, call_site="chat"):
+        """
+        流式请求，逐段产出回复文本
+        
+        Yields:
+            str: 增量文本
             
-            response_message = completion.choices[0].message
+        Raises:
+            LLMError: 请求失败或流在中途断开
+        """
+        for event in self._stream_chat(model, messages, timeout, call_site):
+            if event["type"] == "content":
+                yield event["content"]
+    
+    def _stream_chat(self, model, messages, timeout=None, call_site="chat", **tool_kwargs):
+        """
+        流式请求，工具调用以增量形式到达时在结束后拼接
+        
+        Yields:
+            dict: content 事件与最终的 result 事件
             
-            # 检查是否有工具调用
-            if hasattr(response_message, 'tool_calls') and response_message.tool_calls:
-                # 提取工具调用信息
-                tool_call = response_message.tool_calls[0]
-                function_call = {
-                    "name": tool_call.function.name,
-                    "arguments": json.loads(tool_call.function.arguments)
-                }
-                
-                return {
-                    "content": response_message.content or "",
-                    "function_call": function_call,
-                    "has_function_call": True
-                }
-            else:
-                # 没有工具调用，只返回内容
-                return {
-                    "content": response_message.content,
-                    "has_function_call": False
-                }
-                
-        except Exception as e:
-            print(f"⚠️ 函数调用请求出错: {str(e)}")
-            return {
-                "content": f"请求出错: {str(e)}",
-                "error": str(e),
-                "has_function_call": False
-            }
\ No newline at end of file
+        Raises:
+            LLMError: 请求失败或流在中途断开
+        """
+        with self.router.slot(call_site) as queue_time:
+            tickets = []
+            self._log_request(call_site, model, messages)
+            call = self.instrumentation.start(call_site, model, stream=True)
+            stats = StreamStats(model)
+            tool_calls = ToolCallAccumulator()
+            content = []
+            error = None
+            stream = None
+            try:
+                stream = self._open_stream(call, model, messages, timeout,
+                                           self._admitter(call_site, messages, tickets), **tool_kwargs)
+                for chunk in stream:
+                    stats.on_usage(getattr(chunk, 'usage', None))
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.tool_calls:
+                        # 首个工具调用增量同样计入首字延迟
+                        stats.mark_first_token()
+                        tool_calls.add(delta.tool_calls)
+                    if delta.content:
+                        stats.on_delta(delta.content)
+                        content.append(delta.content)
+                        yield {"type": "content", "content": delta.content}
+                result = tool_calls.to_result("".join(content), messages)
+            except LLMError as e:
+                error = e
+                raise
+            except Exception as e:
+                error = classify_exception(e)
+                raise error from e
+            except BaseException as e:
+                # 调用方提前关闭生成器或任务被取消，不能记为成功
+                error = e
+                raise
+            finally:
+                if stream is not None:
+                    # 调用方提前结束（break、客户端断开）时立即归还HTTP连接，而不是等到垃圾回收
+                    stream.close()
+                stats.finish()
+                self.stream_stats.append(stats)
+                call.finish(error=error, prompt_tokens=stats.prompt_tokens,
+                            completion_tokens=stats.completion_tokens, ttft=stats.ttft,
+                            queue_time=queue_time)
+                self._settle(tickets, stats.prompt_tokens, stats.completion_tokens)
+        
+        yield result
@@ -0,0 +1,395 @@
+"""
+LLM 调用弹性模块 - 超时、指数退避重试、对冲请求与熔断
+"""
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .errors import classify_exception, CircuitOpenError, LLMRateLimitError, RequestCancelledError
+
+
+class RetryPolicy:
+    """指数退避重试策略（全抖动）"""
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=8.0, jitter=True):
+        """
+        Args:
+            max_attempts (int): 最多尝试次数（包括第一次）
+            base_delay (float): 首次重试的基础等待秒数
+            max_delay (float): 单次等待的上限秒数
+            jitter (bool): 是否在 [0, 退避时间] 内随机取值，避免重试同步
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def delay(self, attempt, error=None):
+        """
+        计算第 attempt 次失败后的等待时间
+
+        Args:
+            attempt (int): 已失败的次数，从1开始
+            error (LLMError, optional): 本次失败的异常，限流时优先使用服务端建议的等待时间
+
+        Returns:
+            float: 等待秒数
+        """
+        if isinstance(error, LLMRateLimitError) and error.retry_after:
+            return min(error.retry_after, self.max_delay)
+        backoff = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return random.uniform(0, backoff) if self.jitter else backoff
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    连续失败达到阈值后进入打开状态，期间请求直接抛出 CircuitOpenError；
+    经过恢复时间后进入半开状态，放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, recovery_timeout=30.0):
+        """
+        Args:
+            failure_threshold (int): 触发熔断的连续失败次数
+            recovery_timeout (float): 打开状态持续的秒数
+        """
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """请求前检查，熔断中时抛出 CircuitOpenError"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN:
+                remaining = self.opened_at + self.recovery_timeout - time.monotonic()
+                if remaining > 0:
+                    raise CircuitOpenError(f"上游服务暂不可用，熔断中（{remaining:.0f}秒后重试）")
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                raise CircuitOpenError("上游服务暂不可用，正在探测恢复情况")
+            self._probe_in_flight = True
+
+    def release_probe(self):
+        """请求被取消或中断、没有结果时释放探测名额，不计为成功或失败"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        """记录一次成功请求"""
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        """记录一次上游故障"""
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """滑动窗口内的请求耗时统计，用于确定对冲请求的发出时机"""
+
+    def __init__(self, window=200, min_samples=20):
+        self.samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, q):
+        """
+        获取耗时分位数
+
+        Args:
+            q (float): 分位，例如 0.95
+
+        Returns:
+            float or None: 样本不足时返回 None
+        """
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ResilientCaller:
+    """
+    为 LLM 请求提供超时、重试、对冲和熔断
+
+    被调用的函数需要接受 timeout 关键字参数并将其传给底层请求。
+    """
+
+    def __init__(self, timeout=60.0, retry_policy=None, circuit_breaker=None,
+                 hedge=False, hedge_percentile=0.95, hedge_min_delay=0.5, max_hedge_workers=8):
+        """
+        Args:
+            timeout (float): 默认的单次请求超时秒数
+            retry_policy (RetryPolicy, optional): 重试策略
+            circuit_breaker (CircuitBreaker, optional): 熔断器，为 None 时不熔断
+            hedge (bool): 是否启用对冲请求
+            hedge_percentile (float): 请求耗时超过该分位时发出第二个相同请求
+            hedge_min_delay (float): 对冲等待时间的下限秒数
+            max_hedge_workers (int): 对冲线程池大小
+        """
+        self.timeout = timeout
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_delay = hedge_min_delay
+        self.latency = LatencyTracker()
+        self._max_hedge_workers = max_hedge_workers
+        self._hedge_pool = None
+
+    @classmethod
+    def from_config(cls, config):
+        """根据配置对象创建"""
+        breaker = None
+        if getattr(config, 'LLM_CIRCUIT_FAILURE_THRESHOLD', 0):
+            breaker = CircuitBreaker(
+                failure_threshold=config.LLM_CIRCUIT_FAILURE_THRESHOLD,
+                recovery_timeout=getattr(config, 'LLM_CIRCUIT_RECOVERY_TIMEOUT', 30.0)
+            )
+        return cls(
+            timeout=getattr(config, 'LLM_TIMEOUT', 60.0),
+            retry_policy=RetryPolicy(
+                max_attempts=getattr(config, 'LLM_MAX_ATTEMPTS', 3),
+                base_delay=getattr(config, 'LLM_RETRY_BASE_DELAY', 0.5),
+                max_delay=getattr(config, 'LLM_RETRY_MAX_DELAY', 8.0)
+            ),
+            circuit_breaker=breaker,
+            hedge=getattr(config, 'LLM_HEDGE_ENABLED', False),
+            hedge_percentile=getattr(config, 'LLM_HEDGE_PERCENTILE', 0.95)
+        )
+
+    def close(self):
+        """关闭对冲线程池，不等待仍在进行的落后请求"""
+        pool, self._hedge_pool = self._hedge_pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def _hedge_delay(self):
+        """对冲请求的等待时间，样本不足时返回 None（不对冲）"""
+        delay = self.latency.percentile(self.hedge_percentile)
+        if delay is None:
+            return None
+        return max(delay, self.hedge_min_delay)
+
+    def _before_attempt(self):
+        if self.circuit_breaker:
+            self.circuit_breaker.before_call()
+
+    def _after_failure(self, error):
+        # 只有上游故障（可重试错误）计入熔断，请求参数错误说明上游是健康的
+        if self.circuit_breaker:
+            if error.retryable:
+                self.circuit_breaker.record_failure()
+            else:
+                self.circuit_breaker.record_success()
+
+    def _after_abort(self):
+        # 取消（客户端断开、会话回收、阶段截止）不说明上游的健康状况，只归还半开状态的探测名额
+        if self.circuit_breaker:
+            self.circuit_breaker.release_probe()
+
+    def _admit(self, admit):
+        """尝试发出前排队准入；准入失败（排队被取消）时请求并未发出，不计入熔断"""
+        if admit is None:
+            return
+        try:
+            admit()
+        except BaseException:
+            self._after_abort()
+            raise
+
+    async def _aadmit(self, admit):
+        if admit is None:
+            return
+        try:
+            await admit()
+        except BaseException:
+            self._after_abort()
+            raise
+
+    def _after_success(self, elapsed):
+        self.latency.record(elapsed)
+        if self.circuit_breaker:
+            self.circuit_breaker.record_success()
+
+    def call(self, func, timeout=None, hedge=True, admit=None):
+        """
+        同步调用
+
+        Args:
+            func: 接受 timeout 关键字参数的可调用对象
+            timeout (float, optional): 本次调用的超时秒数，默认使用实例配置
+            hedge (bool): 本次调用是否允许对冲（仅幂等请求应允许）
+            admit (callable, optional): 每次尝试（包括重试与对冲请求）发出前调用的准入函数，
+                如 RequestScheduler 排队；排队时间不计入超时
+
+        Returns:
+            any: func 的返回值
+
+        Raises:
+            LLMError: 重试耗尽或遇到不可重试错误时抛出
+        """
+        timeout = timeout or self.timeout
+        attempt = 0
+        while True:
+            attempt += 1
+            self._before_attempt()
+            self._admit(admit)
+            start = time.perf_counter()
+            try:
+                if hedge and self.hedge:
+                    result = self._call_hedged(func, timeout, admit)
+                else:
+                    result = func(timeout=timeout)
+            except Exception as e:
+                error = classify_exception(e)
+                self._after_failure(error)
+                if not error.retryable or attempt >= self.retry_policy.max_attempts:
+                    error.attempts = attempt
+                    raise error from e
+                time.sleep(self.retry_policy.delay(attempt, error))
+                continue
+            except BaseException:
+                self._after_abort()
+                raise
+            self._after_success(time.perf_counter() - start)
+            return result
+
+    @staticmethod
+    def _hedge_attempt(func, admit, timeout, settled):
+        """对冲请求同样需要准入，在对冲线程中排队，不阻塞对首个请求的等待"""
+        if admit is not None:
+            admit()
+            if settled.is_set():
+                # 排队期间首个请求已有结果，不再发出
+                raise RequestCancelledError("对冲请求已无必要")
+        return func(timeout=timeout)
+
+    def _call_hedged(self, func, timeout, admit=None):
+        """发出请求，若超过对冲等待时间仍未返回则再发一个相同请求，取先成功者"""
+        delay = self._hedge_delay()
+        if delay is None or delay >= timeout:
+            return func(timeout=timeout)
+
+        if self._hedge_pool is None:
+            self._hedge_pool = ThreadPoolExecutor(max_workers=self._max_hedge_workers,
+                                                  thread_name_prefix="llm-hedge")
+        pool = self._hedge_pool
+        # 线程池不继承上下文：复制调用方的上下文，使请求归属（request_owner）与追踪 span 在池线程中可见
+        primary = pool.submit(contextvars.copy_context().run, func, timeout=timeout)
+        pending = {primary}
+        done, _ = wait(pending, timeout=delay)
+        settled = threading.Event()
+        if not done:
+            pending.add(pool.submit(contextvars.copy_context().run,
+                                    self._hedge_attempt, func, admit, timeout, settled))
+
+        error = None
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        # 落后的请求无法中断，结果直接丢弃
+                        return future.result()
+                    # 两个都失败时以首个请求的错误为准（对冲请求可能只是排队被取消）
+                    if future is primary or error is None:
+                        error = future.exception()
+            raise error
+        finally:
+            settled.set()
+
+    async def acall(self, func, timeout=None, hedge=True, admit=None):
+        """
+        异步调用，参数与 call 相同，func 与 admit 返回可等待对象
+
+        Raises:
+            LLMError: 重试耗尽或遇到不可重试错误时抛出
+        """
+        timeout = timeout or self.timeout
+        attempt = 0
+        while True:
+            attempt += 1
+            self._before_attempt()
+            await self._aadmit(admit)
+            start = time.perf_counter()
+            try:
+                if hedge and self.hedge:
+                    result = await self._acall_hedged(func, timeout, admit)
+                else:
+                    result = await asyncio.wait_for(func(timeout=timeout), timeout)
+            except Exception as e:
+                error = classify_exception(e)
+                self._after_failure(error)
+                if not error.retryable or attempt >= self.retry_policy.max_attempts:
+                    error.attempts = attempt
+                    raise error from e
+                await asyncio.sleep(self.retry_policy.delay(attempt, error))
+                continue
+            except BaseException:
+                self._after_abort()
+                raise
+            self._after_success(time.perf_counter() - start)
+            return result
+
+    @staticmethod
+    async def _ahedge_attempt(func, admit, timeout):
+        if admit is not None:
+            await admit()
+        return await asyncio.wait_for(func(timeout=timeout), timeout)
+
+    async def _acall_hedged(self, func, timeout, admit=None):
+        """异步对冲请求，先成功者返回后取消另一个"""
+        delay = self._hedge_delay()
+        if delay is None or delay >= timeout:
+            return await asyncio.wait_for(func(timeout=timeout), timeout)
+
+        primary = asyncio.ensure_future(asyncio.wait_for(func(timeout=timeout), timeout))
+        pending = {primary}
+        error = None
+        try:
+            # 等待对冲时机期间被取消也要取消首个请求
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                pending.add(asyncio.ensure_future(self._ahedge_attempt(func, admit, timeout)))
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    if task is primary or error is None:
+                        error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
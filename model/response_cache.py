@@ -0,0 +1,174 @@
+"""
+响应缓存模块 - 缓存确定性LLM调用（记忆判断、记忆提取）的结果
+"""
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    带TTL和容量上限的LLM响应缓存
+
+    内存层为LRU字典；可选的SQLite层用于跨进程重启保留结果，内存未命中时查询
+    并回填。缓存值统一以JSON字符串保存，取出时重新解码，调用方修改返回值不会
+    影响缓存内容。
+    """
+
+    def __init__(self, ttl=24 * 3600, max_entries=2048, sqlite_path=None, sqlite_max_entries=100000):
+        """
+        初始化响应缓存
+
+        Args:
+            ttl (float): 缓存有效期（秒）
+            max_entries (int): 内存层最大条目数，超出时淘汰最久未使用的条目
+            sqlite_path (str, optional): SQLite缓存文件路径，不提供则只使用内存层
+            sqlite_max_entries (int): SQLite层最大条目数
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.sqlite_max_entries = sqlite_max_entries
+        self._entries = OrderedDict()  # key -> (过期时间, JSON字符串)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.sqlite_hits = 0
+        self.misses = 0
+
+        self._db = None
+        self._sqlite_writes = 0
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @property
+    def persistent(self):
+        """是否启用了SQLite层（读写涉及磁盘I/O）"""
+        return self._db is not None
+
+    @staticmethod
+    def make_key(model, messages, response_format=None):
+        """
+        生成缓存键
+
+        Args:
+            model (str): 模型名称
+            messages (list): 完整消息列表（包含系统提示词）
+            response_format: 响应格式，可以是字典或Pydantic模型类
+
+        Returns:
+            str: 缓存键
+        """
+        if isinstance(response_format, type) and hasattr(response_format, 'model_json_schema'):
+            response_format = response_format.model_json_schema()
+        payload = json.dumps(
+            {"model": model, "messages": messages, "response_format": response_format},
+            ensure_ascii=False, sort_keys=True
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        读取缓存
+
+        Args:
+            key (str): 缓存键
+
+        Returns:
+            any: 缓存的值，未命中或已过期时返回 None
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(value)
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    self._store(key, row[0], row[1])
+                    self.sqlite_hits += 1
+                    return json.loads(row[0])
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        """
+        写入缓存
+
+        Args:
+            key (str): 缓存键
+            value: 可JSON序列化的值
+        """
+        serialized = json.dumps(value, ensure_ascii=False)
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, serialized, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, serialized, expires_at)
+                )
+                self._sqlite_writes += 1
+                if self._sqlite_writes % 100 == 0:
+                    self._prune_sqlite()
+                self._db.commit()
+
+    def _store(self, key, serialized, expires_at):
+        """写入内存层并按容量淘汰（调用方需持有锁）"""
+        self._entries[key] = (expires_at, serialized)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _prune_sqlite(self):
+        """删除SQLite层中过期及超出容量的条目（调用方需持有锁）"""
+        self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+        count = self._db.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        if count > self.sqlite_max_entries:
+            self._db.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY expires_at LIMIT ?)",
+                (count - self.sqlite_max_entries,)
+            )
+
+    def clear(self):
+        """清空缓存及统计"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.sqlite_hits = self.misses = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_cache")
+                self._db.commit()
+
+    def stats(self):
+        """
+        获取缓存统计
+
+        Returns:
+            dict: 命中次数、未命中次数、命中率和当前条目数
+        """
+        with self._lock:
+            total = self.hits + self.sqlite_hits + self.misses
+            return {
+                "hits": self.hits,
+                "sqlite_hits": self.sqlite_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.sqlite_hits) / total if total else 0.0,
+                "entries": len(self._entries),
+            }
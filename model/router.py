@@ -0,0 +1,110 @@
+"""
+按任务路由模型 - 记忆判断、提取等后台任务使用小模型，并限制各任务的并发数
+"""
+import time
+import asyncio
+import threading
+from contextlib import contextmanager, asynccontextmanager
+
+
+class ModelRouter:
+    """
+    任务 → 模型与并发上限的路由表
+
+    任务名即调用点标签（chat / judge / extract / tool-followup / summarize 等）。
+    路由中指定了模型时优先于调用方传入的模型；未指定时使用调用方传入的模型，
+    再退回客户端的默认模型。max_concurrency 为该任务同时在途的请求上限，
+    后台任务排队等待而不会挤占前台对话的连接与上游配额。
+    """
+
+    def __init__(self, routes=None):
+        """
+        Args:
+            routes (dict, optional): {任务名: {"model": 模型名或None, "max_concurrency": 上限或None,
+                "priority": "foreground" 或 "background"}}
+        """
+        self.routes = {task: dict(route or {}) for task, route in (routes or {}).items()}
+        self._semaphores = {}
+        self._async_semaphores = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """根据配置对象创建，读取 MODEL_ROUTES"""
+        return cls(getattr(config, 'MODEL_ROUTES', None))
+
+    def resolve(self, task, model=None, default_model=None):
+        """
+        确定任务使用的模型
+
+        Args:
+            task (str): 任务名
+            model (str, optional): 调用方传入的模型
+            default_model (str, optional): 客户端的默认模型
+
+        Returns:
+            str: 模型名称
+        """
+        routed = self.routes.get(task, {}).get("model")
+        return routed or model or default_model
+
+    def priority(self, task):
+        """
+        任务的调度优先级
+
+        Returns:
+            str: 路由中的 priority，未配置时为 foreground
+        """
+        return self.routes.get(task, {}).get("priority") or "foreground"
+
+    def _limit(self, task):
+        return self.routes.get(task, {}).get("max_concurrency")
+
+    def _semaphore(self, task):
+        limit = self._limit(task)
+        if not limit:
+            return None
+        with self._lock:
+            semaphore = self._semaphores.get(task)
+            if semaphore is None:
+                semaphore = self._semaphores[task] = threading.BoundedSemaphore(limit)
+        return semaphore
+
+    def _async_semaphore(self, task):
+        limit = self._limit(task)
+        if not limit:
+            return None
+        semaphore = self._async_semaphores.get(task)
+        if semaphore is None:
+            semaphore = self._async_semaphores[task] = asyncio.Semaphore(limit)
+        return semaphore
+
+    @contextmanager
+    def slot(self, task):
+        """
+        占用任务的一个并发名额，没有上限时立即进入
+
+        Yields:
+            float: 排队等待的秒数
+        """
+        semaphore = self._semaphore(task)
+        if semaphore is None:
+            yield 0.0
+            return
+        start = time.perf_counter()
+        semaphore.acquire()
+        try:
+            yield time.perf_counter() - start
+        finally:
+            semaphore.release()
+
+    @asynccontextmanager
+    async def aslot(self, task):
+        """slot 的 asyncio 版本"""
+        semaphore = self._async_semaphore(task)
+        if semaphore is None:
+            yield 0.0
+            return
+        start = time.perf_counter()
+        async with semaphore:
+            yield time.perf_counter() - start
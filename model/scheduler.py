@@ -0,0 +1,348 @@
+"""
+LLM 请求调度模块 - 令牌桶限流（请求数/分钟、token数/分钟）与前后台优先级
+"""
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from observability.metrics import get_registry
+from .errors import RequestCancelledError
+
+
+FOREGROUND = "foreground"
+BACKGROUND = "background"
+_PRIORITY_ORDER = {FOREGROUND: 0, BACKGROUND: 1}
+
+# 发起请求的所有者（通常是会话），排队凭据记录它，以便只取消某个会话自己的请求
+_owner = contextvars.ContextVar("mem4_scheduler_owner", default=None)
+
+
+@contextmanager
+def request_owner(owner):
+    """
+    在当前线程/协程上下文中把之后排队的请求归属于 owner，见 RequestScheduler.cancel
+
+    Args:
+        owner: 任意可比较身份的对象，例如会话实例
+    """
+    token = _owner.set(owner)
+    try:
+        yield
+    finally:
+        _owner.reset(token)
+
+
+def estimate_tokens(messages, expected_completion=0):
+    """
+    粗略估算一次请求消耗的token数，用于请求前的限流预占
+
+    中文约一字一token、英文约四字符一token，这里统一按两字符一token估算，
+    请求完成后由 RequestScheduler.settle() 按实际用量修正。
+
+    Args:
+        messages (list): 消息列表
+        expected_completion (int): 预计的输出token数
+
+    Returns:
+        int: 估算的token数
+    """
+    chars = 0
+    for message in messages:
+        chars += len(message.get("content") or "")
+        for call in message.get("tool_calls") or []:
+            chars += len(call.get("function", {}).get("arguments", ""))
+    return chars // 2 + 4 * len(messages) + expected_completion
+
+
+class TokenBucket:
+    """按分钟速率补充的令牌桶，rate 为 None 或 0 时不限流"""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        """
+        Args:
+            rate_per_minute (float): 每分钟补充的令牌数
+            capacity (float, optional): 桶容量，默认等于每分钟速率（允许一分钟内的突发）
+        """
+        self.rate = (rate_per_minute or 0) / 60.0
+        self.capacity = capacity or rate_per_minute or 0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """
+        获取 amount 个令牌还需等待的秒数，0 表示现在即可获取
+
+        超过桶容量的请求在桶满时放行，避免永远等待。
+        """
+        if not self.rate:
+            return 0.0
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount):
+        """扣除令牌，允许为负（按实际用量修正时）"""
+        if self.rate:
+            self._refill()
+            self.level -= amount
+
+    def refund(self, amount):
+        """归还令牌"""
+        if self.rate:
+            self.level = min(self.capacity, self.level + amount)
+
+
+class _Ticket:
+    """一个等待准入的请求"""
+
+    def __init__(self, priority, seq, tokens, deadline, loop=None, owner=None):
+        self.priority = priority
+        self.owner = owner
+        self.order = _PRIORITY_ORDER.get(priority, len(_PRIORITY_ORDER))
+        self.seq = seq
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.deadline = deadline
+        self.cancelled = False
+        self.admitted = False
+        self.queue_time = 0.0
+        self.loop = loop
+        self.event = asyncio.Event() if loop is not None else None
+
+    def __lt__(self, other):
+        return (self.order, self.seq) < (other.order, other.seq)
+
+
+class RequestScheduler:
+    """
+    位于 GrokClient 之前的请求调度器
+
+    所有请求按优先级排队：只有队首请求可以从令牌桶中取令牌，前台请求总是排在
+    后台请求之前，因此一批记忆提取请求不会把用户对话挤进上游限流。后台请求
+    排队超过 background_max_wait 秒即被取消；cancel() 可主动取消某一类（或某个
+    所有者，见 request_owner）的排队请求。
+    同一个调度器可以同时服务线程（acquire）和协程（acquire_async）。
+    """
+
+    def __init__(self, rpm=None, tpm=None, background_max_wait=None, expected_completion_tokens=256,
+                 registry=None):
+        """
+        Args:
+            rpm (int, optional): 每分钟请求数上限，None 表示不限
+            tpm (int, optional): 每分钟token数上限，None 表示不限
+            background_max_wait (float, optional): 后台请求的最长排队秒数，None 表示不取消
+            expected_completion_tokens (int): 预占令牌时估计的输出token数
+            registry (MetricsRegistry, optional): 指标注册表，默认使用进程内共享注册表
+        """
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.background_max_wait = background_max_wait
+        self.expected_completion_tokens = expected_completion_tokens
+        self.registry = registry or get_registry()
+
+        self._heap = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+
+    @classmethod
+    def from_config(cls, config, registry=None):
+        """根据配置对象创建"""
+        return cls(
+            rpm=getattr(config, 'LLM_RATE_LIMIT_RPM', None),
+            tpm=getattr(config, 'LLM_RATE_LIMIT_TPM', None),
+            background_max_wait=getattr(config, 'LLM_BACKGROUND_MAX_WAIT', None),
+            expected_completion_tokens=getattr(config, 'LLM_EXPECTED_COMPLETION_TOKENS', 256),
+            registry=registry,
+        )
+
+    def _new_ticket(self, priority, messages, loop=None):
+        deadline = None
+        if priority == BACKGROUND and self.background_max_wait:
+            deadline = time.monotonic() + self.background_max_wait
+        tokens = estimate_tokens(messages, self.expected_completion_tokens)
+        return _Ticket(priority, next(self._seq), tokens, deadline, loop, _owner.get())
+
+    def _wake_all(self):
+        """唤醒所有等待者重新检查（需持有锁）"""
+        self._cond.notify_all()
+        for ticket in self._heap:
+            if ticket.loop is not None:
+                ticket.loop.call_soon_threadsafe(ticket.event.set)
+
+    def _try_admit(self, ticket):
+        """
+        尝试让请求通过（需持有锁）
+
+        Returns:
+            float or None: 0 表示已通过；正数为令牌不足时需等待的秒数；None 表示不在队首
+        """
+        while self._heap and self._heap[0].cancelled:
+            heapq.heappop(self._heap)
+        if not self._heap or self._heap[0] is not ticket:
+            return None
+        wait = max(self.requests.wait_time(1), self.tokens.wait_time(ticket.tokens))
+        if wait > 0:
+            return wait
+        self.requests.take(1)
+        self.tokens.take(ticket.tokens)
+        heapq.heappop(self._heap)
+        ticket.admitted = True
+        ticket.queue_time = time.monotonic() - ticket.enqueued
+        self._wake_all()
+        return 0.0
+
+    def _check_stale(self, ticket):
+        """排队超时的后台请求标记为取消（需持有锁）"""
+        if ticket.deadline is not None and time.monotonic() >= ticket.deadline:
+            ticket.cancelled = True
+        return ticket.cancelled
+
+    def _wait_timeout(self, ticket, wait):
+        """计算本次等待的超时：令牌补充时间与取消期限中较早者"""
+        timeouts = [value for value in (
+            wait,
+            ticket.deadline - time.monotonic() if ticket.deadline is not None else None
+        ) if value is not None]
+        return max(0.0, min(timeouts)) if timeouts else None
+
+    def _cancelled(self, ticket):
+        """记录一次取消并生成异常（需持有锁）"""
+        self._wake_all()
+        waited = time.monotonic() - ticket.enqueued
+        self.registry.inc("llm_scheduler_cancelled_total", priority=ticket.priority)
+        return RequestCancelledError(f"{ticket.priority} 请求排队 {waited:.1f} 秒后被取消")
+
+    def _admitted(self, ticket):
+        self.registry.observe("llm_scheduler_queue_seconds", ticket.queue_time, priority=ticket.priority)
+        return ticket
+
+    def acquire(self, priority, messages):
+        """
+        等待请求准入（线程中使用）
+
+        Args:
+            priority (str): foreground 或 background
+            messages (list): 请求消息，用于估算token数
+
+        Returns:
+            _Ticket: 准入凭据，请求完成后传给 settle()
+
+        Raises:
+            RequestCancelledError: 后台请求排队超时或被主动取消
+        """
+        with self._cond:
+            ticket = self._new_ticket(priority, messages)
+            heapq.heappush(self._heap, ticket)
+            try:
+                while True:
+                    if self._check_stale(ticket):
+                        raise self._cancelled(ticket)
+                    wait = self._try_admit(ticket)
+                    if wait == 0.0:
+                        return self._admitted(ticket)
+                    self._cond.wait(self._wait_timeout(ticket, wait))
+            except BaseException:
+                # 被中断的请求不能继续占据队首
+                if not ticket.admitted:
+                    ticket.cancelled = True
+                    self._wake_all()
+                raise
+
+    async def acquire_async(self, priority, messages):
+        """acquire 的 asyncio 版本，等待期间不占用线程"""
+        ticket = self._new_ticket(priority, messages, asyncio.get_running_loop())
+        with self._lock:
+            heapq.heappush(self._heap, ticket)
+        try:
+            while True:
+                with self._lock:
+                    if self._check_stale(ticket):
+                        raise self._cancelled(ticket)
+                    wait = self._try_admit(ticket)
+                    if wait == 0.0:
+                        return self._admitted(ticket)
+                    ticket.event.clear()
+                    timeout = self._wait_timeout(ticket, wait)
+                try:
+                    await asyncio.wait_for(ticket.event.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            with self._lock:
+                if not ticket.admitted:
+                    ticket.cancelled = True
+                    self._wake_all()
+            raise
+
+    def settle(self, ticket, actual_tokens):
+        """
+        按实际token用量修正预占的令牌
+
+        Args:
+            ticket (_Ticket): acquire() 返回的凭据
+            actual_tokens (int or None): 实际消耗的token数，未知时不修正
+        """
+        if ticket is None or actual_tokens is None:
+            return
+        with self._cond:
+            difference = actual_tokens - ticket.tokens
+            if difference > 0:
+                self.tokens.take(difference)
+            else:
+                self.tokens.refund(-difference)
+                self._wake_all()
+
+    def cancel(self, priority=BACKGROUND, owner=None):
+        """
+        取消某一类中正在排队的请求
+
+        Args:
+            priority (str): 要取消的优先级类别
+            owner (optional): 只取消归属于该所有者的请求（见 request_owner），None 表示全部
+
+        Returns:
+            int: 被取消的请求数
+        """
+        with self._cond:
+            tickets = [ticket for ticket in self._heap
+                       if ticket.priority == priority and not ticket.cancelled
+                       and (owner is None or ticket.owner is owner)]
+            for ticket in tickets:
+                ticket.cancelled = True
+            self._wake_all()
+        return len(tickets)
+
+    def stats(self):
+        """
+        获取各优先级的排队情况
+
+        Returns:
+            dict: {优先级: {"waiting", "admitted", "cancelled", "avg_queue_time", "p95_queue_time"}}
+        """
+        with self._lock:
+            waiting = {}
+            for ticket in self._heap:
+                if not ticket.cancelled:
+                    waiting[ticket.priority] = waiting.get(ticket.priority, 0) + 1
+        stats = {}
+        for priority in _PRIORITY_ORDER:
+            summary = self.registry.summary("llm_scheduler_queue_seconds", priority=priority) or {}
+            stats[priority] = {
+                "waiting": waiting.get(priority, 0),
+                "admitted": summary.get("count", 0),
+                "cancelled": self.registry.counter("llm_scheduler_cancelled_total", priority=priority),
+                "avg_queue_time": summary.get("avg"),
+                "p95_queue_time": summary.get("p95"),
+            }
+        return stats
@@ -0,0 +1,91 @@
+"""
+流式响应辅助模块 - 统计首字延迟与生成速度
+"""
+import time
+
+
+class StreamStats:
+    """单次流式请求的性能统计"""
+
+    def __init__(self, model):
+        """
+        初始化统计对象
+
+        Args:
+            model (str): 请求使用的模型
+        """
+        self.model = model
+        self.start_time = time.perf_counter()
+        self.first_token_time = None
+        self.end_time = None
+        self.chunks = 0
+        self.prompt_tokens = None
+        self.completion_tokens = None
+
+    def on_delta(self, text):
+        """
+        记录收到的一段增量内容
+
+        Args:
+            text (str): 增量文本
+        """
+        if not text:
+            return
+        self.mark_first_token()
+        self.chunks += 1
+
+    def mark_first_token(self):
+        """记录首个有效增量（文本或工具调用）到达的时间"""
+        if self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+
+    def on_usage(self, usage):
+        """
+        记录服务端返回的用量信息
+
+        Args:
+            usage: completion.usage 对象
+        """
+        if usage is None:
+            return
+        if getattr(usage, 'prompt_tokens', None) is not None:
+            self.prompt_tokens = usage.prompt_tokens
+        if getattr(usage, 'completion_tokens', None) is not None:
+            self.completion_tokens = usage.completion_tokens
+
+    def finish(self):
+        """结束计时"""
+        if self.end_time is None:
+            self.end_time = time.perf_counter()
+
+    @property
+    def ttft(self):
+        """首字延迟（秒），未收到内容时为 None"""
+        if self.first_token_time is None:
+            return None
+        return self.first_token_time - self.start_time
+
+    @property
+    def tokens(self):
+        """生成的token数，服务端未返回用量时以增量块数近似"""
+        return self.completion_tokens if self.completion_tokens is not None else self.chunks
+
+    @property
+    def tokens_per_second(self):
+        """首字之后的生成速度（tokens/秒）"""
+        if self.first_token_time is None or self.end_time is None:
+            return None
+        elapsed = self.end_time - self.first_token_time
+        if elapsed <= 0:
+            return None
+        return self.tokens / elapsed
+
+    def to_dict(self):
+        """转换为字典，便于日志输出"""
+        return {
+            "model": self.model,
+            "ttft": self.ttft,
+            "tokens": self.tokens,
+            "tokens_per_second": self.tokens_per_second,
+            "total_time": (self.end_time or time.perf_counter()) - self.start_time,
+        }
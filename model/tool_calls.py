@@ -0,0 +1,149 @@
+"""
+工具调用辅助模块 - 统一流式与非流式工具调用结果，构建回传给模型的消息
+"""
+import json
+
+
+def build_function_result(content, raw_calls, messages=None):
+    """
+    生成统一格式的函数调用结果
+
+    Args:
+        content (str): 模型回复文本
+        raw_calls (list): {"id", "name", "arguments"} 列表，arguments 为原始JSON字符串
+        messages (list, optional): 本次请求的消息列表，便于追加工具结果后发起后续请求
+
+    Returns:
+        dict: 包含以下键的字典
+            content: 回复文本
+            has_function_call: 是否有工具调用
+            tool_calls: 工具调用列表，每项为 {"id", "name", "arguments"}，arguments 为字典；
+                参数不是合法JSON时额外带有 "error"
+            function_call: 第一个工具调用（兼容旧的单调用格式）
+            message: 可直接追加到消息列表的 assistant 消息
+            messages: 本次请求的消息列表
+    """
+    result = {"content": content, "has_function_call": False, "messages": messages}
+    if not raw_calls:
+        result["message"] = {"role": "assistant", "content": content or ""}
+        return result
+
+    tool_calls = []
+    for raw in raw_calls:
+        call = {"id": raw["id"], "name": raw["name"]}
+        try:
+            call["arguments"] = json.loads(raw["arguments"] or "{}")
+        except json.JSONDecodeError:
+            call["arguments"] = {}
+            call["error"] = f"参数不是有效的JSON: {raw['arguments']}"
+        tool_calls.append(call)
+
+    result.update({
+        "content": content or "",
+        "has_function_call": True,
+        "tool_calls": tool_calls,
+        "function_call": {"name": tool_calls[0]["name"], "arguments": tool_calls[0]["arguments"]},
+        "message": {
+            "role": "assistant",
+            "content": content or None,
+            "tool_calls": [
+                {
+                    "id": raw["id"],
+                    "type": "function",
+                    "function": {"name": raw["name"], "arguments": raw["arguments"] or "{}"},
+                }
+                for raw in raw_calls
+            ],
+        },
+    })
+    return result
+
+
+def parse_function_response(response_message, messages=None):
+    """
+    将带函数定义请求的回复消息转换为统一的结果字典
+
+    Args:
+        response_message: completion.choices[0].message
+        messages (list, optional): 本次请求的消息列表
+
+    Returns:
+        dict: 格式见 build_function_result
+    """
+    raw_calls = [
+        {"id": tool_call.id, "name": tool_call.function.name, "arguments": tool_call.function.arguments}
+        for tool_call in (getattr(response_message, 'tool_calls', None) or [])
+    ]
+    return build_function_result(response_message.content, raw_calls, messages)
+
+
+def tool_result_messages(results):
+    """
+    将工具执行结果转换为 tool 角色消息
+
+    Args:
+        results (list): FunctionRegistry.execute_tool_calls 的返回值
+
+    Returns:
+        list: tool 消息列表，顺序与工具调用一致
+    """
+    messages = []
+    for result in results:
+        if "error" in result:
+            content = json.dumps({"error": result["error"]}, ensure_ascii=False)
+        else:
+            content = json.dumps(result["result"], ensure_ascii=False, default=str)
+        messages.append({"role": "tool", "tool_call_id": result["id"], "content": content})
+    return messages
+
+
+class ToolCallAccumulator:
+    """将流式返回的工具调用增量按 index 拼接为完整调用"""
+
+    def __init__(self):
+        self._calls = {}
+
+    def add(self, tool_call_deltas):
+        """
+        合并一批工具调用增量
+
+        Args:
+            tool_call_deltas (list): delta.tool_calls 列表
+        """
+        for delta in tool_call_deltas or []:
+            call = self._calls.setdefault(delta.index, {"id": None, "name": "", "arguments": ""})
+            if delta.id:
+                call["id"] = delta.id
+            function = getattr(delta, 'function', None)
+            if function is not None:
+                if function.name:
+                    call["name"] += function.name
+                if function.arguments:
+                    call["arguments"] += function.arguments
+
+    def __bool__(self):
+        return bool(self._calls)
+
+    def calls(self):
+        """
+        获取拼接完成的工具调用
+
+        Returns:
+            list: 按 index 排序的 {"id", "name", "arguments"} 列表，arguments 为原始JSON字符串
+        """
+        return [self._calls[index] for index in sorted(self._calls)]
+
+    def to_result(self, content, messages=None):
+        """
+        生成与非流式调用格式相同的结果事件
+
+        Args:
+            content (str): 已拼接的回复文本
+            messages (list, optional): 本次请求的消息列表
+
+        Returns:
+            dict: type 为 "result" 的事件
+        """
+        result = build_function_result(content, self.calls(), messages)
+        result["type"] = "result"
+        return result
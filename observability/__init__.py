@@ -0,0 +1,11 @@
+"""
+可观测性模块包
+"""
+from .metrics import MetricsRegistry, get_registry
+from .sinks import JsonlSink
+from .llm_calls import LLMCallRecorder
+from .exporter import MetricsServer
+from .tracing import Tracer, get_tracer, configure_tracing, span, trace_iter, atrace_iter
+
+__all__ = ['MetricsRegistry', 'get_registry', 'JsonlSink', 'LLMCallRecorder', 'MetricsServer', 'Tracer', 'get_tracer', 'configure_tracing', 'span',
+           'trace_iter', 'atrace_iter']
@@ -0,0 +1,76 @@
+"""
+指标导出 - 本地 HTTP 服务，以 Prometheus 文本格式提供 /metrics
+"""
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from .metrics import get_registry
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsServer:
+    """
+    在后台线程中提供 GET /metrics，供 Prometheus 抓取或 curl 查看
+
+        server = MetricsServer(port=9464).start()
+    """
+
+    def __init__(self, registry=None, host="127.0.0.1", port=9464):
+        """
+        Args:
+            registry (MetricsRegistry, optional): 指标注册表，默认使用进程内共享注册表
+            host (str): 监听地址，默认只监听本机
+            port (int): 监听端口，0 表示自动分配
+        """
+        self.registry = registry or get_registry()
+        self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+
+    @classmethod
+    def from_config(cls, config, registry=None):
+        """根据配置对象创建，未设置 METRICS_PORT 时返回 None"""
+        port = getattr(config, 'METRICS_PORT', None)
+        if port is None:
+            return None
+        return cls(registry, getattr(config, 'METRICS_HOST', "127.0.0.1"), port)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        """在后台线程中启动服务"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-server", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务"""
+        if self._thread is not None:
+            self.httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.httpd.server_close()
+
+    def _make_handler(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
@@ -0,0 +1,213 @@
+"""
+LLM 调用埋点 - 记录每次请求的调用点、模型、token用量、耗时与重试次数
+"""
+import time
+import threading
+from collections import deque
+from .metrics import get_registry
+from .sinks import JsonlSink
+from .tracing import get_tracer
+
+
+def usage_tokens(usage):
+    """从 completion.usage 中读取 (prompt_tokens, completion_tokens)"""
+    if usage is None:
+        return None, None
+    return getattr(usage, 'prompt_tokens', None), getattr(usage, 'completion_tokens', None)
+
+
+class LLMCall:
+    """一次进行中的 LLM 调用，由 LLMCallRecorder.start() 创建"""
+
+    def __init__(self, recorder, call_site, model, stream=False):
+        self.recorder = recorder
+        self.call_site = call_site
+        self.model = model
+        self.stream = stream
+        self.attempts = 0
+        self.start_time = time.perf_counter()
+        self._finished = False
+        # 流式调用跨越生成器，不作为上下文中的当前 span
+        self.span = get_tracer().start_span("llm.call", call_site=call_site, model=model, stream=stream)
+
+    def wrap(self, func):
+        """
+        包装传给 ResilientCaller 的请求函数，统计实际发出的请求次数（含重试与对冲）
+
+        Args:
+            func: 接受 timeout 关键字参数的可调用对象
+
+        Returns:
+            callable: 包装后的函数
+        """
+        def counted(**kwargs):
+            self.attempts += 1
+            return func(**kwargs)
+        return counted
+
+    def finish(self, usage=None, error=None, prompt_tokens=None, completion_tokens=None, **extra):
+        """
+        结束调用并提交记录，重复调用时忽略
+
+        Args:
+            usage: completion.usage 对象(可选)
+            error (Exception, optional): 失败时的异常
+            prompt_tokens (int, optional): 直接提供的输入token数（流式请求）
+            completion_tokens (int, optional): 直接提供的输出token数（流式请求）
+            **extra: 附加字段，例如流式请求的首字延迟 ttft
+        """
+        if self._finished:
+            return
+        self._finished = True
+
+        usage_prompt, usage_completion = usage_tokens(usage)
+        attempts = max(self.attempts, getattr(error, 'attempts', 0) or 0, 1)
+        record = {
+            "timestamp": time.time(),
+            "call_site": self.call_site,
+            "model": self.model,
+            "stream": self.stream,
+            "cached": False,
+            "status": "error" if error is not None else "ok",
+            "latency": time.perf_counter() - self.start_time,
+            "prompt_tokens": prompt_tokens if prompt_tokens is not None else usage_prompt,
+            "completion_tokens": completion_tokens if completion_tokens is not None else usage_completion,
+            "attempts": attempts,
+            "retries": attempts - 1,
+        }
+        if error is not None:
+            record["error"] = type(error).__name__
+        record.update(extra)
+        self.span.end(error=error, prompt_tokens=record["prompt_tokens"],
+                      completion_tokens=record["completion_tokens"], attempts=attempts)
+        self.recorder.record(record)
+
+
+class LLMCallRecorder:
+    """
+    LLM 调用记录器
+
+    每条记录写入指标注册表（按 call_site 与 model 区分），保留在最近记录中，
+    并在配置了 JSONL 文件时逐行输出；subscribe() 注册的回调也会收到每条记录。
+    """
+
+    def __init__(self, registry=None, sink=None, max_recent=200):
+        """
+        Args:
+            registry (MetricsRegistry, optional): 指标注册表，默认使用进程内共享注册表
+            sink (JsonlSink, optional): 记录输出
+            max_recent (int): 保留的最近记录数
+        """
+        self.registry = registry or get_registry()
+        self.sink = sink
+        self.recent = deque(maxlen=max_recent)
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, registry=None):
+        """根据配置对象创建，LLM_METRICS_JSONL_FILE 为空时不输出文件"""
+        filename = getattr(config, 'LLM_METRICS_JSONL_FILE', None)
+        return cls(registry=registry, sink=JsonlSink(filename) if filename else None)
+
+    def subscribe(self, listener):
+        """
+        注册记录回调
+
+        Args:
+            listener: 接受一条记录字典的可调用对象
+        """
+        self._listeners.append(listener)
+
+    def start(self, call_site, model, stream=False):
+        """
+        开始一次调用
+
+        Args:
+            call_site (str): 调用点，如 chat / judge / extract / tool-followup
+            model (str): 模型名称
+            stream (bool): 是否为流式请求
+
+        Returns:
+            LLMCall: 调用结束时需调用其 finish()
+        """
+        return LLMCall(self, call_site, model, stream)
+
+    def record_cache_hit(self, call_site, model):
+        """记录一次命中响应缓存、未发出请求的调用"""
+        self.record({
+            "timestamp": time.time(),
+            "call_site": call_site,
+            "model": model,
+            "stream": False,
+            "cached": True,
+            "status": "ok",
+            "latency": 0.0,
+            "prompt_tokens": None,
+            "completion_tokens": None,
+            "attempts": 0,
+            "retries": 0,
+        })
+
+    def record(self, record):
+        """提交一条记录"""
+        labels = {"call_site": record["call_site"], "model": record["model"]}
+        registry = self.registry
+        registry.inc("llm_calls_total", status=record["status"], **labels)
+        if record["cached"]:
+            registry.inc("llm_cache_hits_total", **labels)
+        else:
+            registry.observe("llm_call_seconds", record["latency"], **labels)
+        if record.get("queue_time"):
+            registry.observe("llm_queue_seconds", record["queue_time"], **labels)
+        if record["retries"]:
+            registry.inc("llm_retries_total", record["retries"], **labels)
+        if record["prompt_tokens"]:
+            registry.inc("llm_prompt_tokens_total", record["prompt_tokens"], **labels)
+        if record["completion_tokens"]:
+            registry.inc("llm_completion_tokens_total", record["completion_tokens"], **labels)
+
+        with self._lock:
+            self.recent.append(record)
+        if self.sink is not None:
+            try:
+                self.sink.write(record)
+            except OSError as e:
+                print(f"❗ 写入LLM调用记录失败: {e}")
+        for listener in self._listeners:
+            try:
+                listener(record)
+            except Exception as e:
+                print(f"❗ LLM调用记录回调出错: {e}")
+
+    def summary(self):
+        """
+        按调用点汇总最近的记录
+
+        Returns:
+            dict: {call_site: {"calls", "errors", "cached", "retries", "prompt_tokens", "completion_tokens", "avg_latency"}}
+        """
+        with self._lock:
+            records = list(self.recent)
+        summary = {}
+        for record in records:
+            item = summary.setdefault(record["call_site"], {
+                "calls": 0, "errors": 0, "cached": 0, "retries": 0,
+                "prompt_tokens": 0, "completion_tokens": 0, "latency": 0.0,
+            })
+            item["calls"] += 1
+            item["errors"] += record["status"] != "ok"
+            item["cached"] += record["cached"]
+            item["retries"] += record["retries"]
+            item["prompt_tokens"] += record["prompt_tokens"] or 0
+            item["completion_tokens"] += record["completion_tokens"] or 0
+            item["latency"] += record["latency"]
+        for item in summary.values():
+            requested = item["calls"] - item["cached"]
+            item["avg_latency"] = item.pop("latency") / requested if requested else None
+        return summary
+
+    def close(self):
+        """关闭记录输出"""
+        if self.sink is not None:
+            self.sink.close()
@@ -0,0 +1,232 @@
+"""
+进程内指标注册表 - 计数器、仪表与耗时分布，按标签区分，可输出 Prometheus 文本格式
+"""
+import re
+import threading
+from collections import deque
+
+
+def _label_key(labels):
+    """将标签字典转换为可哈希的有序元组"""
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Histogram:
+    """数值分布：累计次数与总和，并保留最近的样本用于计算分位数"""
+
+    def __init__(self, window=1000):
+        self.count = 0
+        self.sum = 0.0
+        self.max = None
+        self.samples = deque(maxlen=window)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.max = value if self.max is None else max(self.max, value)
+        self.samples.append(value)
+
+    def percentile(self, q):
+        """最近样本的分位数，没有样本时返回 None"""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "avg": self.sum / self.count if self.count else None,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+        }
+
+
+def _metric_name(name):
+    """转换为合法的 Prometheus 指标名"""
+    name = re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+    return name if not name[:1].isdigit() else "_" + name
+
+
+def _format_labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    parts = []
+    for key, value in items:
+        value = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        parts.append(f'{_metric_name(key)}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value):
+    if value is None:
+        return "NaN"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    线程安全的指标注册表
+
+    指标以名称加标签区分，例如 inc("llm_calls_total", call_site="judge", status="ok")。
+    仪表（gauge）既可以直接设置，也可以注册为读取时才调用的函数（如队列长度、索引大小）。
+    """
+
+    def __init__(self, histogram_window=1000):
+        """
+        Args:
+            histogram_window (int): 每个分布保留的最近样本数
+        """
+        self.histogram_window = histogram_window
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        """计数器累加"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """记录一个分布样本（如耗时秒数）"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.histogram_window)
+            histogram.observe(value)
+
+    def set_gauge(self, name, value, **labels):
+        """设置仪表的当前值"""
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def gauge_function(self, name, func, **labels):
+        """
+        注册读取时才计算的仪表，同名同标签的仪表会被替换
+
+        Args:
+            name (str): 指标名
+            func: 无参可调用对象，返回当前值
+        """
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = func
+
+    def remove_gauge(self, name, **labels):
+        with self._lock:
+            self._gauges.pop((name, _label_key(labels)), None)
+
+    def gauge(self, name, **labels):
+        """读取仪表的当前值，未设置时为 None"""
+        with self._lock:
+            value = self._gauges.get((name, _label_key(labels)))
+        return self._read_gauge(value)
+
+    @staticmethod
+    def _read_gauge(value):
+        if not callable(value):
+            return value
+        try:
+            return value()
+        except Exception:
+            return None
+
+    def counter(self, name, **labels):
+        """读取计数器的当前值，未记录过时为 0"""
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def counter_sum(self, name, **labels):
+        """同名计数器中标签包含给定标签的各项之和，如 counter_sum("tool_calls_total", status="error")"""
+        wanted = set(_label_key(labels))
+        with self._lock:
+            return sum(value for (counter_name, key), value in self._counters.items()
+                       if counter_name == name and wanted.issubset(key))
+
+    def summary(self, name, **labels):
+        """读取分布的汇总统计，未记录过时为 None"""
+        with self._lock:
+            histogram = self._histograms.get((name, _label_key(labels)))
+            return histogram.summary() if histogram else None
+
+    def snapshot(self):
+        """
+        获取全部指标的快照
+
+        Returns:
+            dict: {"counters": [...], "gauges": [...], "histograms": [...]}，每项包含 name、labels 及数值
+        """
+        with self._lock:
+            gauges = sorted(self._gauges.items(), key=lambda item: item[0])
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            histograms = [
+                {"name": name, "labels": dict(labels), **histogram.summary()}
+                for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0])
+            ]
+        gauges = [
+            {"name": name, "labels": dict(labels), "value": self._read_gauge(value)}
+            for (name, labels), value in gauges
+        ]
+        return {"counters": counters, "gauges": gauges, "histograms": histograms}
+
+    def to_prometheus(self):
+        """
+        输出 Prometheus 文本格式（0.0.4）
+
+        计数器与仪表原样输出；耗时分布按 summary 类型输出最近样本的 0.5/0.95/0.99
+        分位数以及累计的 _sum 与 _count。
+
+        Returns:
+            str: 文本格式的全部指标
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for kind, items in (("counter", snapshot["counters"]), ("gauge", snapshot["gauges"])):
+            declared = set()
+            for item in items:
+                name = _metric_name(item["name"])
+                if item["value"] is None:
+                    continue
+                if name not in declared:
+                    declared.add(name)
+                    lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name}{_format_labels(item['labels'].items())} {_format_value(item['value'])}")
+        declared = set()
+        for item in snapshot["histograms"]:
+            name = _metric_name(item["name"])
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} summary")
+            labels = item["labels"].items()
+            for quantile, key in (("0.5", "p50"), ("0.95", "p95"), ("0.99", "p99")):
+                if item[key] is not None:
+                    lines.append(f"{name}{_format_labels(labels, quantile=quantile)} {_format_value(item[key])}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(item['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {item['count']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """清空全部指标"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._gauges.clear()
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry():
+    """获取进程内默认的指标注册表"""
+    return _registry
@@ -0,0 +1,43 @@
+"""
+指标输出 - 将记录逐行追加到 JSONL 文件
+"""
+import os
+import json
+import threading
+
+
+class JsonlSink:
+    """线程安全的 JSONL 追加写入器，文件在首次写入时打开"""
+
+    def __init__(self, filename):
+        """
+        Args:
+            filename (str): 输出文件路径，所在目录不存在时自动创建
+        """
+        self.filename = filename
+        self._file = None
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        """
+        写入一条记录
+
+        Args:
+            record (dict): 可JSON序列化的记录
+        """
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            if self._file is None:
+                directory = os.path.dirname(self.filename)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.filename, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self):
+        """关闭文件"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
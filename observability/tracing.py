@@ -0,0 +1,379 @@
+"""
+轻量追踪 - 为每轮对话的各阶段记录带父子关系的耗时区间（span），可导出为 Chrome trace
+
+用法:
+    with span("retrieval.search", k=3):
+        ...
+
+当前 span 保存在 contextvars 中，同一线程、同一协程内嵌套的 span 自动成为子
+span；跨线程时由调用方传入 parent（例如记忆任务在入队时记下 current_span()）。
+跨越 yield 的区间不能用 with span(...)：生成器被放弃时可能在另一个上下文中结束，
+应使用 trace_iter / atrace_iter，只在生成器每次恢复执行期间把 span 设为当前 span。
+是否记录在每条追踪的根 span 处按 sample_rate 抽样决定，整条追踪要么全部记录
+要么全部跳过；采样率为 0 时 span() 直接返回空操作对象，几乎没有开销。
+
+导出的文件可在 chrome://tracing 或 https://ui.perfetto.dev 中打开。
+"""
+import os
+import json
+import random
+import threading
+import itertools
+import contextvars
+import time
+from collections import deque
+from contextlib import contextmanager
+
+_current = contextvars.ContextVar("mem4_span", default=None)
+# 根 span 未被抽中时放入上下文，使其子 span 同样跳过
+_UNSAMPLED = object()
+
+
+class Span:
+    """一个被记录的耗时区间，作为上下文管理器使用时成为当前 span"""
+
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent_id", "attrs", "start_ns", "end_ns",
+                 "thread_id", "thread_name", "error", "_token")
+
+    def __init__(self, tracer, name, trace_id, parent_id, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = next(tracer._ids)
+        self.parent_id = parent_id
+        self.attrs = attrs
+        thread = threading.current_thread()
+        self.thread_id = thread.ident
+        self.thread_name = thread.name
+        self.error = None
+        self.end_ns = None
+        self._token = None
+        self.start_ns = time.perf_counter_ns()
+
+    def set(self, **attrs):
+        """补充属性（如结果条数、token 数）"""
+        self.attrs.update(attrs)
+
+    def end(self, error=None, **attrs):
+        """结束并提交，重复调用时忽略"""
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.perf_counter_ns()
+        if attrs:
+            self.attrs.update(attrs)
+        if error is not None:
+            self.error = type(error).__name__ if isinstance(error, BaseException) else str(error)
+        self.tracer._spans.append(self)
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        self.end(error=exc)
+        return False
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_us": (self.start_ns - self.tracer.epoch_ns) / 1000,
+            "duration_us": (self.end_ns - self.start_ns) / 1000,
+            "thread_id": self.thread_id,
+            "thread_name": self.thread_name,
+            "error": self.error,
+            "attrs": dict(self.attrs),
+        }
+
+
+class _NoopSpan:
+    """未启用或未被抽中时返回的空操作 span"""
+
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def end(self, error=None, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _UnsampledRoot:
+    """未被抽中的根 span：在上下文中标记整条追踪跳过"""
+
+    __slots__ = ("_token",)
+
+    def __enter__(self):
+        self._token = _current.set(_UNSAMPLED)
+        return NOOP_SPAN
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+        return False
+
+    def set(self, **attrs):
+        pass
+
+    def end(self, error=None, **attrs):
+        pass
+
+
+class Tracer:
+    """
+    追踪器，记录的 span 保存在内存中的环形缓冲区里
+    """
+
+    def __init__(self, sample_rate=0.0, max_spans=100000, seed=None):
+        """
+        Args:
+            sample_rate (float): 根 span 的采样率，0 表示关闭，1 表示全部记录
+            max_spans (int): 保留的最近 span 数
+            seed (int, optional): 抽样的随机数种子
+        """
+        self.sample_rate = sample_rate
+        self.epoch_ns = time.perf_counter_ns()
+        self._spans = deque(maxlen=max_spans)
+        self._ids = itertools.count(1)
+        self._rng = random.Random(seed)
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0
+
+    def configure(self, sample_rate=None, max_spans=None):
+        """调整采样率与缓冲区大小"""
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if max_spans is not None and max_spans != self._spans.maxlen:
+            self._spans = deque(self._spans, maxlen=max_spans)
+
+    @staticmethod
+    def current_span():
+        """
+        当前上下文中的 span，用于跨线程传递父 span
+
+        Returns:
+            Span or object or None: 当前 span；所在追踪未被抽中时为内部标记；不在追踪中时为 None
+        """
+        return _current.get()
+
+    def span(self, name, parent=None, **attrs):
+        """
+        创建 span，作为上下文管理器使用
+
+        Args:
+            name (str): 名称，按 "模块.阶段" 命名，如 "retrieval.search"
+            parent (optional): 父 span（current_span() 的返回值），默认为当前上下文中的 span
+            **attrs: 附加属性
+
+        Returns:
+            Span: 未启用或未被抽中时返回空操作对象
+        """
+        if self.sample_rate <= 0:
+            return NOOP_SPAN
+        if parent is None:
+            parent = _current.get()
+        if parent is _UNSAMPLED:
+            # 跨线程传入的未抽中标记需要放入本线程的上下文，使后续的子 span 同样跳过
+            return NOOP_SPAN if _current.get() is _UNSAMPLED else _UnsampledRoot()
+        if parent is None:
+            if self.sample_rate < 1 and self._rng.random() >= self.sample_rate:
+                return _UnsampledRoot()
+            return Span(self, name, next(self._ids), None, attrs)
+        if not isinstance(parent, Span):
+            return NOOP_SPAN
+        return Span(self, name, parent.trace_id, parent.span_id, attrs)
+
+    def start_span(self, name, **attrs):
+        """
+        创建不进入上下文的 span，由调用方稍后调用 end()（用于跨越生成器或回调的区间）
+
+        不在已抽中的追踪中时返回空操作对象，不会单独开启新的追踪。
+        """
+        parent = _current.get() if self.sample_rate > 0 else None
+        if not isinstance(parent, Span):
+            return NOOP_SPAN
+        return Span(self, name, parent.trace_id, parent.span_id, attrs)
+
+    def spans(self):
+        """
+        已记录的 span
+
+        Returns:
+            list: 每项为 Span.to_dict() 的结果，按开始时间排序
+        """
+        return sorted((span.to_dict() for span in list(self._spans)), key=lambda item: item["start_us"])
+
+    def clear(self):
+        self._spans.clear()
+
+    def chrome_trace(self):
+        """
+        转换为 Chrome trace 事件格式
+
+        每个 span 为一个完整事件（ph="X"）；父 span 在其他线程上时额外输出一对
+        流事件（ph="s"/"f"），在查看器中以箭头连接。
+        """
+        pid = os.getpid()
+        spans = self.spans()
+        by_id = {item["span_id"]: item for item in spans}
+        events = []
+        threads = {}
+        for item in spans:
+            threads[item["thread_id"]] = item["thread_name"]
+            args = dict(item["attrs"], trace_id=item["trace_id"], span_id=item["span_id"])
+            if item["parent_id"] is not None:
+                args["parent_id"] = item["parent_id"]
+            if item["error"]:
+                args["error"] = item["error"]
+            events.append({
+                "name": item["name"],
+                "cat": item["name"].split(".", 1)[0],
+                "ph": "X",
+                "ts": item["start_us"],
+                "dur": item["duration_us"],
+                "pid": pid,
+                "tid": item["thread_id"],
+                "args": args,
+            })
+            parent = by_id.get(item["parent_id"])
+            if parent is not None and parent["thread_id"] != item["thread_id"]:
+                # 流的起点需落在父 span 内
+                start = min(max(item["start_us"], parent["start_us"]), parent["start_us"] + parent["duration_us"])
+                events.append({"name": "parent", "cat": "link", "ph": "s", "id": item["span_id"],
+                               "ts": start, "pid": pid, "tid": parent["thread_id"]})
+                events.append({"name": "parent", "cat": "link", "ph": "f", "bp": "e", "id": item["span_id"],
+                               "ts": item["start_us"], "pid": pid, "tid": item["thread_id"]})
+        for tid, name in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome(self, filename):
+        """
+        导出 Chrome trace 文件
+
+        Returns:
+            int: 导出的 span 数
+        """
+        trace = self.chrome_trace()
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(trace, f, ensure_ascii=False)
+        return sum(1 for event in trace["traceEvents"] if event["ph"] == "X")
+
+    def export_json(self, filename):
+        """
+        导出 span 列表（JSON，每项见 Span.to_dict）
+
+        Returns:
+            int: 导出的 span 数
+        """
+        spans = self.spans()
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(spans, f, ensure_ascii=False, indent=2)
+        return len(spans)
+
+
+_tracer = Tracer()
+
+
+def get_tracer():
+    """获取进程内默认的追踪器"""
+    return _tracer
+
+
+def configure_tracing(config):
+    """按配置（TRACE_SAMPLE_RATE、TRACE_MAX_SPANS）设置默认追踪器"""
+    _tracer.configure(
+        sample_rate=getattr(config, 'TRACE_SAMPLE_RATE', 0.0),
+        max_spans=getattr(config, 'TRACE_MAX_SPANS', 100000),
+    )
+    return _tracer
+
+
+def span(name, parent=None, **attrs):
+    """在默认追踪器上创建 span，见 Tracer.span"""
+    return _tracer.span(name, parent, **attrs)
+
+
+@contextmanager
+def activate(current):
+    """
+    在区间内把一个未进入上下文的 span（span() 的返回值）设为当前 span，区间内不能 yield
+
+    Args:
+        current: Span、未抽中的根 span 或空操作对象
+    """
+    if isinstance(current, Span):
+        value = current
+    elif isinstance(current, _UnsampledRoot):
+        value = _UNSAMPLED
+    else:
+        yield
+        return
+    token = _current.set(value)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def trace_iter(current, iterator):
+    """
+    在 span 内逐项驱动生成器：每次恢复执行时 current 为当前 span，yield 期间不占用调用方的上下文
+
+    Args:
+        current: span() 的返回值（不要用 with 进入）
+        iterator: 生成器
+
+    Yields:
+        生成器产出的各项
+    """
+    error = None
+    try:
+        while True:
+            with activate(current):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        # 提前结束时关闭内层生成器，使其 finally 同样在 span 内执行
+        with activate(current):
+            iterator.close()
+        current.end(error=error)
+
+
+async def atrace_iter(current, iterator):
+    """trace_iter 的异步版本，iterator 为异步生成器"""
+    error = None
+    try:
+        while True:
+            with activate(current):
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield item
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        with activate(current):
+            await iterator.aclose()
+        current.end(error=error)
@@ -0,0 +1,7 @@
+"""
+服务端模块 - 在一个进程中托管多个会话的 HTTP 服务
+"""
+from .session_pool import SessionPool, SessionLimitError, SessionNotFoundError
+from .app import ChatServer, build_server
+
+__all__ = ['SessionPool', 'SessionLimitError', 'SessionNotFoundError', 'ChatServer', 'build_server']
\ No newline at end of file
@@ -0,0 +1,425 @@
+"""
+多会话服务端 - 基于 asyncio 的 HTTP 服务，在一个进程中托管多个会话
+
+所有会话共享同一个嵌入模型（经由编码批处理）、向量索引、工具注册中心和
+LLM 客户端，每个会话只保存自己的对话历史。
+
+用法:
+    python -m server.app --port 8080
+
+接口:
+    POST   /sessions                    创建会话，返回 {"session_id"}
+    POST   /sessions/<id>/messages      发送消息 {"message", "stream"}，会话不存在时自动创建；
+                                        stream 为 true 时以 text/event-stream 逐段返回
+    GET    /sessions/<id>/history       查看对话历史
+    DELETE /sessions/<id>               关闭会话
+    GET    /health                      存活检查
+    GET    /stats                       会话池、编码批处理与各调用点的LLM请求统计
+    GET    /trace                       已记录的追踪（Chrome trace 格式，需设置 TRACE_SAMPLE_RATE）
+    GET    /metrics                     全部指标（Prometheus 文本格式）
+"""
+import os
+import json
+import asyncio
+import argparse
+import logging
+from contextlib import aclosing
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from observability.metrics import get_registry
+from observability.exporter import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .session_pool import SessionPool, SessionLimitError, SessionNotFoundError
+
+# 请求头与请求体的大小上限
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+
+
+class HTTPError(Exception):
+    """以指定状态码返回的错误"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Request:
+    """解析后的HTTP请求"""
+
+    def __init__(self, method, path, headers, body):
+        self.method = method
+        self.path = path
+        self.headers = headers
+        self.body = body
+        # 响应后是否关闭连接（流式响应以关闭连接表示结束）
+        self.close_connection = headers.get("connection", "").lower() == "close"
+
+    def json(self):
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "请求体不是合法的JSON")
+        if not isinstance(data, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "请求体应为JSON对象")
+        return data
+
+    @property
+    def keep_alive(self):
+        return not self.close_connection
+
+
+async def read_request(reader):
+    """
+    从连接中读取一个HTTP/1.1请求
+
+    Returns:
+        Request or None: 连接已关闭时为 None
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "请求头过大")
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _ = lines[0].split(" ", 2)
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "无法解析请求行")
+    headers = {}
+    for line in lines[1:]:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+
+    length = headers.get("content-length") or "0"
+    # 只接受非负十进制整数，int() 还会接受 "-1"、"+5"、"1_0" 等写法
+    if not length.isascii() or not length.isdigit():
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Content-Length 无效")
+    length = int(length)
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "请求体过大")
+    body = await reader.readexactly(length) if length else b""
+    return Request(method.upper(), target.split("?", 1)[0], headers, body)
+
+
+class ChatServer:
+    """
+    多会话HTTP服务
+
+    每个连接一个协程，连接上的请求依次处理（支持 keep-alive）；同一会话的消息
+    由 SessionPool 串行处理，不同会话之间完全并发。
+    """
+
+    def __init__(self, pool, host="127.0.0.1", port=8080, embedder=None, llm_client=None):
+        """
+        Args:
+            pool (SessionPool): 会话池
+            host (str): 监听地址
+            port (int): 监听端口，0 表示自动分配
+            embedder: 共享的 MemoryEmbedder(可选)，用于 /stats 中的批处理统计
+            llm_client: 共享的 LLM 客户端(可选)，用于 /stats 中的调用统计
+        """
+        self.pool = pool
+        self.host = host
+        self.port = port
+        self.embedder = embedder
+        self.llm_client = llm_client
+        self._server = None
+
+        self.registry = get_registry()
+        self.registry.gauge_function("memory_queue_depth", pool.memory_backlog)
+        self.registry.gauge_function("sessions_active", pool.__len__)
+        if embedder is not None:
+            self.registry.gauge_function("vector_index_size", embedder.size)
+
+    async def start(self):
+        """开始监听"""
+        await self.pool.start()
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port,
+                                                  limit=MAX_HEADER_BYTES)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        """停止监听并关闭所有会话"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        await self.pool.stop()
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    await self._dispatch(request, writer)
+                except HTTPError as e:
+                    await self._send_json(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    break
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except Exception as e:
+                    print(f"❗ 处理请求时出错: {e}")
+                    await self._send_json(writer, HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)},
+                                          keep_alive=False)
+                    break
+                if not request.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, request, writer):
+        parts = [part for part in request.path.split("/") if part]
+        method = request.method
+
+        if method == "GET" and parts == ["health"]:
+            return await self._send_json(writer, HTTPStatus.OK, {"status": "ok", "sessions": len(self.pool)},
+                                         request.keep_alive)
+        if method == "GET" and parts == ["stats"]:
+            return await self._send_json(writer, HTTPStatus.OK, self.stats(), request.keep_alive)
+        if method == "GET" and parts == ["trace"]:
+            from observability.tracing import get_tracer
+            return await self._send_json(writer, HTTPStatus.OK, get_tracer().chrome_trace(), request.keep_alive)
+        if method == "GET" and parts == ["metrics"]:
+            return await self._send_text(writer, HTTPStatus.OK, self.registry.to_prometheus(), METRICS_CONTENT_TYPE,
+                                         request.keep_alive)
+        if method == "POST" and parts == ["sessions"]:
+            return await self._create_session(request, writer)
+        if len(parts) >= 2 and parts[0] == "sessions":
+            session_id = parts[1]
+            if method == "POST" and parts[2:] == ["messages"]:
+                return await self._post_message(session_id, request, writer)
+            if method == "GET" and parts[2:] == ["history"]:
+                try:
+                    history = self.pool.get(session_id).get_history()
+                except SessionNotFoundError:
+                    raise HTTPError(HTTPStatus.NOT_FOUND, f"会话 {session_id} 不存在")
+                return await self._send_json(writer, HTTPStatus.OK, {"session_id": session_id, "history": history},
+                                             request.keep_alive)
+            if method == "DELETE" and not parts[2:]:
+                if not await self.pool.close(session_id):
+                    raise HTTPError(HTTPStatus.NOT_FOUND, f"会话 {session_id} 不存在")
+                return await self._send_json(writer, HTTPStatus.OK, {"session_id": session_id, "closed": True},
+                                             request.keep_alive)
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"未知接口: {method} {request.path}")
+
+    async def _create_session(self, request, writer):
+        data = request.json()
+        try:
+            session_id = await self.pool.create(data.get("session_id"))
+        except SessionLimitError as e:
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, str(e))
+        session = self.pool.get(session_id)
+        if data.get("system_message"):
+            session.set_system_message(data["system_message"])
+        if data.get("model"):
+            session.set_model(data["model"])
+        await self._send_json(writer, HTTPStatus.CREATED, {"session_id": session_id}, request.keep_alive)
+
+    async def _post_message(self, session_id, request, writer):
+        data = request.json()
+        message = data.get("message")
+        if not isinstance(message, str) or not message.strip():
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "缺少 message")
+
+        try:
+            async with self.pool.use(session_id) as session:
+                if data.get("stream"):
+                    request.close_connection = True
+                    await self._stream_reply(writer, session_id, session.process_message_stream(message))
+                else:
+                    response = await session.process_message(message)
+                    await self._send_json(writer, HTTPStatus.OK, {"session_id": session_id, "response": response},
+                                          request.keep_alive)
+        except SessionLimitError as e:
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, str(e))
+
+    async def _stream_reply(self, writer, session_id, chunks):
+        """以 server-sent events 逐段返回回复，结束后关闭连接"""
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream; charset=utf-8\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        # 客户端断开时 drain 抛错，立即关闭回复生成器以释放上游的模型连接
+        async with aclosing(chunks):
+            async for text in chunks:
+                event = json.dumps({"session_id": session_id, "content": text}, ensure_ascii=False)
+                writer.write(f"data: {event}\n\n".encode("utf-8"))
+                await writer.drain()
+        writer.write(b"data: [DONE]\n\n")
+        await writer.drain()
+
+    async def _send_json(self, writer, status, body, keep_alive=True):
+        data = json.dumps(body, ensure_ascii=False)
+        await self._send_text(writer, status, data, "application/json; charset=utf-8", keep_alive)
+
+    async def _send_text(self, writer, status, text, content_type, keep_alive=True):
+        data = text.encode("utf-8")
+        status = HTTPStatus(status)
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data
+        )
+        await writer.drain()
+
+    def stats(self):
+        """
+        获取服务统计
+
+        Returns:
+            dict: 会话池、编码批处理与各调用点的LLM请求统计
+        """
+        stats = {"sessions": self.pool.stats()}
+        batcher = getattr(self.embedder, "batcher", None)
+        if batcher is not None:
+            stats["embedding_batcher"] = batcher.stats()
+        if self.llm_client is not None:
+            stats["llm_calls"] = self.llm_client.instrumentation.summary()
+        return stats
+
+
+def build_server(config, host="127.0.0.1", port=8080):
+    """
+    根据配置创建共享组件与服务
+
+    嵌入模型、向量索引、工具注册中心、工具选择器与 LLM 客户端在进程内只创建一份，
+    由会话工厂注入每个会话。
+
+    Args:
+        config: 配置对象
+        host (str): 监听地址
+        port (int): 监听端口
+
+    Returns:
+        ChatServer: 尚未启动的服务
+    """
+    from model.async_llm_client import AsyncGrokClient
+    from model.response_cache import ResponseCache
+    from model.resilience import ResilientCaller
+    from model.router import ModelRouter
+    from model.scheduler import RequestScheduler
+    from observability.llm_calls import LLMCallRecorder
+    from observability.tracing import configure_tracing
+    from transport.http_pool import get_shared_pool
+    from core.async_session import AsyncSession
+    from functions.function_registry import FunctionRegistry
+    from functions.tool_selector import ToolSelector
+    from functions.weather import weather_tool, WeatherRequest
+
+    os.makedirs(getattr(config, 'DATA_DIR', 'data'), exist_ok=True)
+    configure_tracing(config)
+
+    cache = None
+    if getattr(config, 'LLM_CACHE_ENABLED', False):
+        cache = ResponseCache(
+            ttl=config.LLM_CACHE_TTL,
+            max_entries=config.LLM_CACHE_MAX_ENTRIES,
+            sqlite_path=getattr(config, 'LLM_CACHE_SQLITE_FILE', None)
+        )
+    llm_client = AsyncGrokClient(
+        api_key=config.API_KEY,
+        base_url=config.BASE_URL,
+        default_model=config.DEFAULT_MODEL,
+        cache=cache,
+        resilience=ResilientCaller.from_config(config),
+        http_client=get_shared_pool(config).async_client,
+        instrumentation=LLMCallRecorder.from_config(config),
+        router=ModelRouter.from_config(config),
+        scheduler=RequestScheduler.from_config(config)
+    )
+
+    # 向量编码、检索与同步工具函数共用一个执行器
+    executor = ThreadPoolExecutor(max_workers=getattr(config, 'SERVER_EXECUTOR_WORKERS', 16),
+                                  thread_name_prefix="server")
+
+    embedder = None
+    retriever = None
+    if getattr(config, 'VECTOR_SEARCH_ENABLED', False):
+        from vector.embedder import MemoryEmbedder
+        from vector.retriever import MemoryRetriever
+        try:
+            embedder = MemoryEmbedder(config)
+            embedder.load_or_create_index()
+            embedder.enable_batching(
+                max_batch_size=getattr(config, 'EMBEDDING_BATCH_SIZE', 32),
+                max_wait=getattr(config, 'EMBEDDING_BATCH_WAIT', 0.005)
+            )
+            retriever = MemoryRetriever(embedder)
+        except Exception as e:
+            print(f"向量检索功能初始化失败: {e}")
+            embedder = None
+
+    function_registry = FunctionRegistry(
+        max_workers=getattr(config, 'TOOL_MAX_WORKERS', 8),
+        process_workers=getattr(config, 'TOOL_PROCESS_WORKERS', 2),
+        executor=executor
+    )
+    function_registry.register(
+        weather_tool,
+        name="get_weather",
+        description="查询指定城市的天气信息。仅当用户明确询问天气时才调用此函数。",
+        parameters=WeatherRequest.model_json_schema(),
+        timeout=15,
+        max_concurrency=4
+    )
+    tool_selector = ToolSelector.from_config(function_registry, config, encoder=embedder)
+
+    def session_factory(session_id):
+        # 所有会话共享一个索引，记忆按会话ID隔离
+        return AsyncSession(llm_client, config, embedder=embedder, retriever=retriever, executor=executor,
+                            function_registry=function_registry, tool_selector=tool_selector,
+                            memory_namespace=session_id)
+
+    pool = SessionPool.from_config(session_factory, config)
+    return ChatServer(pool, host, port, embedder=embedder, llm_client=llm_client)
+
+
+async def serve(config, host, port):
+    server = await build_server(config, host, port).start()
+    print(f"🌐 多会话服务已启动: {server.base_url}（最多 {server.pool.max_sessions} 个会话）")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.stop()
+
+
+def main():
+    import config
+
+    parser = argparse.ArgumentParser(description="多会话HTTP服务")
+    parser.add_argument("--host", default=getattr(config, 'SERVER_HOST', "127.0.0.1"), help="监听地址")
+    parser.add_argument("--port", type=int, default=getattr(config, 'SERVER_PORT', 8080), help="监听端口")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=getattr(config, 'LOG_LEVEL', 'WARNING'),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+    try:
+        asyncio.run(serve(config, args.host, args.port))
+    except KeyboardInterrupt:
+        print("再见！")
+
+
+if __name__ == "__main__":
+    main()
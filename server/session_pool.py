@@ -0,0 +1,235 @@
+"""
+会话池 - 在一个进程中托管多个 AsyncSession，限制会话总数并回收空闲会话
+"""
+import time
+import uuid
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class SessionLimitError(Exception):
+    """会话数已达上限且没有可回收的空闲会话"""
+
+
+class SessionNotFoundError(KeyError):
+    """会话不存在（未创建或已被回收）"""
+
+
+class _Entry:
+    """一个托管中的会话"""
+
+    def __init__(self, session):
+        self.session = session
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.active = 0
+        # 同一会话的消息按顺序处理，保证对话历史一致
+        self.lock = asyncio.Lock()
+
+
+class SessionPool:
+    """
+    会话池
+
+    会话由 factory 创建，共享的嵌入模型、索引、工具与 LLM 客户端都由 factory
+    注入，每个会话只保存自己的对话历史与状态。空闲超过 idle_timeout 秒的会话
+    由后台任务回收；会话数达到 max_sessions 时新建会话会先回收最久未使用的
+    空闲会话，没有可回收的会话则拒绝。后台记忆队列中还有任务的会话不算空闲。
+    """
+
+    def __init__(self, factory, max_sessions=100, idle_timeout=1800, sweep_interval=60):
+        """
+        Args:
+            factory: 接受会话ID、返回新 AsyncSession 的可调用对象
+            max_sessions (int): 同时托管的最大会话数
+            idle_timeout (float): 会话空闲多少秒后回收，None 表示不回收
+            sweep_interval (float): 检查空闲会话的间隔（秒）
+        """
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+
+        self._entries = {}
+        self._lock = asyncio.Lock()
+        self._sweeper = None
+
+        self.created = 0
+        self.evicted = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_config(cls, factory, config):
+        """根据配置对象创建"""
+        return cls(
+            factory,
+            max_sessions=getattr(config, 'SERVER_MAX_SESSIONS', 100),
+            idle_timeout=getattr(config, 'SERVER_SESSION_IDLE_TIMEOUT', 1800),
+            sweep_interval=getattr(config, 'SERVER_SESSION_SWEEP_INTERVAL', 60),
+        )
+
+    async def start(self):
+        """启动空闲会话回收任务"""
+        if self._sweeper is None and self.idle_timeout:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        """停止回收任务并关闭所有会话"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+        async with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            await entry.session.stop()
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            evicted = await self.evict_idle()
+            if evicted:
+                print(f"🧹 已回收 {evicted} 个空闲会话")
+
+    @staticmethod
+    def _idle(entry):
+        # 记忆任务还在排队或处理中时回收会丢失这些记忆
+        return entry.active == 0 and not entry.lock.locked() and not entry.session.memory_busy
+
+    async def _remove(self, session_ids):
+        """从池中移除并停止会话（需持有 _lock）"""
+        for session_id in session_ids:
+            entry = self._entries.pop(session_id)
+            await entry.session.stop()
+
+    async def evict_idle(self):
+        """
+        回收空闲超时的会话
+
+        Returns:
+            int: 回收的会话数
+        """
+        if not self.idle_timeout:
+            return 0
+        cutoff = time.monotonic() - self.idle_timeout
+        async with self._lock:
+            expired = [session_id for session_id, entry in self._entries.items()
+                       if self._idle(entry) and entry.last_used < cutoff]
+            await self._remove(expired)
+            self.evicted += len(expired)
+        return len(expired)
+
+    async def create(self, session_id=None):
+        """
+        创建会话
+
+        Args:
+            session_id (str, optional): 指定会话ID，默认随机生成
+
+        Returns:
+            str: 会话ID
+
+        Raises:
+            SessionLimitError: 会话数已达上限且没有空闲会话可回收
+        """
+        async with self._lock:
+            session_id = session_id or uuid.uuid4().hex
+            if session_id in self._entries:
+                return session_id
+            if len(self._entries) >= self.max_sessions:
+                idle = [(entry.last_used, sid) for sid, entry in self._entries.items() if self._idle(entry)]
+                if not idle:
+                    self.rejected += 1
+                    raise SessionLimitError(f"会话数已达上限 {self.max_sessions}")
+                await self._remove([min(idle)[1]])
+                self.evicted += 1
+
+            session = self.factory(session_id)
+            await session.start()
+            self._entries[session_id] = _Entry(session)
+            self.created += 1
+        return session_id
+
+    @asynccontextmanager
+    async def use(self, session_id, create=True):
+        """
+        独占使用一个会话处理一条消息
+
+        Args:
+            session_id (str): 会话ID
+            create (bool): 会话不存在时是否创建
+
+        Yields:
+            AsyncSession: 会话
+
+        Raises:
+            SessionNotFoundError: 会话不存在且 create 为 False
+            SessionLimitError: 需要创建会话但已达上限
+        """
+        entry = self._entries.get(session_id)
+        if entry is None:
+            if not create:
+                raise SessionNotFoundError(session_id)
+            await self.create(session_id)
+            entry = self._entries[session_id]
+
+        entry.active += 1
+        try:
+            async with entry.lock:
+                yield entry.session
+        finally:
+            entry.active -= 1
+            entry.last_used = time.monotonic()
+
+    def get(self, session_id):
+        """
+        获取会话（不占用）
+
+        Raises:
+            SessionNotFoundError: 会话不存在
+        """
+        entry = self._entries.get(session_id)
+        if entry is None:
+            raise SessionNotFoundError(session_id)
+        return entry.session
+
+    async def close(self, session_id):
+        """
+        关闭并移除会话
+
+        Returns:
+            bool: 会话是否存在
+        """
+        async with self._lock:
+            if session_id not in self._entries:
+                return False
+            await self._remove([session_id])
+        return True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def memory_backlog(self):
+        """所有会话后台记忆队列中等待处理的任务数之和"""
+        return sum(entry.session.memory_queue.qsize() for entry in list(self._entries.values()))
+
+    def stats(self):
+        """
+        获取会话池统计
+
+        Returns:
+            dict: 当前会话数、忙碌会话数、上限与累计创建/回收/拒绝次数
+        """
+        return {
+            "sessions": len(self._entries),
+            "busy": sum(1 for entry in self._entries.values() if not self._idle(entry)),
+            "max_sessions": self.max_sessions,
+            "idle_timeout": self.idle_timeout,
+            "created": self.created,
+            "evicted": self.evicted,
+            "rejected": self.rejected,
+        }
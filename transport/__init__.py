@@ -0,0 +1,6 @@
+"""
+HTTP 传输层包 - 在 LLM 客户端和工具函数之间共享连接池
+"""
+from .http_pool import HttpPool, get_shared_pool
+
+__all__ = ['HttpPool', 'get_shared_pool']
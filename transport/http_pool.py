@@ -0,0 +1,164 @@
+"""
+共享HTTP连接池 - 复用TLS连接与keep-alive，避免每个客户端、每次工具调用重新握手
+"""
+import threading
+import importlib.util
+
+import httpx
+
+
+class HttpPool:
+    """
+    可注入的共享连接池
+
+    同一个 HttpPool 提供一个同步 httpx.Client 和一个异步 httpx.AsyncClient，
+    GrokClient（通过 OpenAI 的 http_client 参数）和工具函数使用同一组连接。
+    安装了 h2 时启用 HTTP/2，同一主机上的并发请求可以复用单个连接。
+    """
+
+    def __init__(self, max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0,
+                 timeout=60.0, http2=True):
+        """
+        初始化连接池
+
+        Args:
+            max_connections (int): 最大连接数
+            max_keepalive_connections (int): 最大空闲保持连接数
+            keepalive_expiry (float): 空闲连接保留秒数
+            timeout (float): 默认请求超时秒数
+            http2 (bool): 是否尝试启用 HTTP/2（需要安装 h2）
+        """
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = timeout
+        self.http2 = bool(http2) and importlib.util.find_spec("h2") is not None
+
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.errors = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """根据配置对象创建"""
+        return cls(
+            max_connections=getattr(config, 'HTTP_MAX_CONNECTIONS', 100),
+            max_keepalive_connections=getattr(config, 'HTTP_MAX_KEEPALIVE_CONNECTIONS', 20),
+            keepalive_expiry=getattr(config, 'HTTP_KEEPALIVE_EXPIRY', 30.0),
+            timeout=getattr(config, 'LLM_TIMEOUT', 60.0),
+            http2=getattr(config, 'HTTP_HTTP2', True),
+        )
+
+    def _on_request(self, request):
+        with self._lock:
+            self.requests += 1
+
+    def _on_response(self, response):
+        if response.status_code >= 500:
+            with self._lock:
+                self.errors += 1
+
+    async def _on_request_async(self, request):
+        self._on_request(request)
+
+    async def _on_response_async(self, response):
+        self._on_response(response)
+
+    @property
+    def client(self):
+        """共享的同步客户端（首次访问时创建）"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = httpx.Client(
+                        limits=self.limits,
+                        timeout=self.timeout,
+                        http2=self.http2,
+                        event_hooks={"request": [self._on_request], "response": [self._on_response]},
+                    )
+        return self._client
+
+    @property
+    def async_client(self):
+        """共享的异步客户端（首次访问时创建）"""
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    self._async_client = httpx.AsyncClient(
+                        limits=self.limits,
+                        timeout=self.timeout,
+                        http2=self.http2,
+                        event_hooks={"request": [self._on_request_async], "response": [self._on_response_async]},
+                    )
+        return self._async_client
+
+    def get(self, url, **kwargs):
+        """通过共享同步客户端发送 GET 请求"""
+        return self.client.get(url, **kwargs)
+
+    @staticmethod
+    def _connection_stats(client):
+        """读取 httpcore 连接池中的连接状态"""
+        pool = getattr(getattr(client, '_transport', None), '_pool', None)
+        connections = list(getattr(pool, 'connections', []) or [])
+        idle = sum(1 for connection in connections if connection.is_idle())
+        return {"connections": len(connections), "active": len(connections) - idle, "idle": idle}
+
+    def stats(self):
+        """
+        获取连接池使用情况
+
+        Returns:
+            dict: 请求总数、5xx次数、同步/异步连接池中的连接数（总数/活跃/空闲）及上限
+        """
+        stats = {
+            "requests": self.requests,
+            "server_errors": self.errors,
+            "http2": self.http2,
+            "max_connections": self.limits.max_connections,
+            "max_keepalive_connections": self.limits.max_keepalive_connections,
+        }
+        if self._client is not None:
+            stats["sync"] = self._connection_stats(self._client)
+        if self._async_client is not None:
+            stats["async"] = self._connection_stats(self._async_client)
+        return stats
+
+    def close(self):
+        """关闭同步客户端"""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self):
+        """关闭异步客户端"""
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
+_shared_pool = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_pool(config=None):
+    """
+    获取进程内共享的连接池，首次调用时根据配置创建
+
+    Args:
+        config: 配置对象(可选)，不提供时使用默认参数
+
+    Returns:
+        HttpPool: 共享连接池
+    """
+    global _shared_pool
+    if _shared_pool is None:
+        with _shared_lock:
+            if _shared_pool is None:
+                _shared_pool = HttpPool.from_config(config) if config is not None else HttpPool()
+    return _shared_pool
@@ -1,7 +1,28 @@
 """
 向量化和检索功能模块
+
+导出项按需导入；faiss 与嵌入模型在首次建索引、加载模型时才导入
 """
-from .embedder import MemoryEmbedder
-from .retriever import MemoryRetriever
+import importlib
+
+# 导出名 -> 所在子模块，首次访问时才导入（PEP 562）
+_EXPORTS = {
+    'MemoryEmbedder': '.embedder',
+    'MemoryRetriever': '.retriever',
+    'EmbeddingBatcher': '.batcher',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module, __name__), name)
+    globals()[name] = value
+    return value
+
 
-__all__ = ['MemoryEmbedder', 'MemoryRetriever']
\ No newline at end of file
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
\ No newline at end of file
@@ -0,0 +1,140 @@
+"""
+向量编码批处理模块 - 合并多个会话同时发出的编码请求，一次调用嵌入模型
+"""
+import time
+import queue
+import threading
+import numpy as np
+
+
+class _Request:
+    """一次编码请求，由批处理线程填入结果"""
+
+    def __init__(self, texts, normalize):
+        self.texts = texts
+        self.normalize = normalize
+        self.done = threading.Event()
+        self.vectors = None
+        self.error = None
+
+
+class EmbeddingBatcher:
+    """
+    嵌入模型的批处理前端
+
+    encode() 与 SentenceTransformer.encode 的用法一致，可以直接替换模型使用。
+    请求进入队列后由一个后台线程收集：凑满 max_batch_size 条文本或等待超过
+    max_wait 秒就合并为一次模型调用，再把结果按请求切分返回。多个会话同时
+    检索时，模型调用次数随批次而不是随请求数增长。
+    """
+
+    def __init__(self, model, max_batch_size=32, max_wait=0.005):
+        """
+        Args:
+            model: 带 encode(texts, normalize_embeddings=...) 方法的嵌入模型
+            max_batch_size (int): 单次模型调用的最大文本数
+            max_wait (float): 收集一个批次的最长等待秒数
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.batches = 0
+        self.requests = 0
+        self.texts = 0
+
+    def get_sentence_embedding_dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._worker, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+
+    def encode(self, texts, normalize_embeddings=False, **kwargs):
+        """
+        编码文本，阻塞直到所在批次完成
+
+        Args:
+            texts (list or str): 文本列表
+            normalize_embeddings (bool): 是否归一化
+            **kwargs: 其他参数直接传给模型（此时不参与批处理）
+
+        Returns:
+            numpy.ndarray: 向量矩阵，单个字符串输入时为一维向量
+        """
+        if kwargs:
+            return self.model.encode(texts, normalize_embeddings=normalize_embeddings, **kwargs)
+        single = isinstance(texts, str)
+        request = _Request([texts] if single else list(texts), normalize_embeddings)
+        if not request.texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype='float32')
+
+        self._ensure_thread()
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.vectors[0] if single else request.vectors
+
+    def _collect(self, first):
+        """以 first 为首收集一个批次（归一化设置相同的请求才能合并）"""
+        batch = [first]
+        size = len(first.texts)
+        deadline = time.monotonic() + self.max_wait
+        held = []
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request.normalize != first.normalize:
+                held.append(request)
+                continue
+            batch.append(request)
+            size += len(request.texts)
+        for request in held:
+            self._queue.put(request)
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._collect(self._queue.get())
+            texts = [text for request in batch for text in request.texts]
+            try:
+                vectors = self.model.encode(texts, normalize_embeddings=batch[0].normalize)
+                offset = 0
+                for request in batch:
+                    request.vectors = vectors[offset:offset + len(request.texts)]
+                    offset += len(request.texts)
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+            self.batches += 1
+            self.requests += len(batch)
+            self.texts += len(texts)
+            for request in batch:
+                request.done.set()
+
+    def stats(self):
+        """
+        获取批处理统计
+
+        Returns:
+            dict: 批次数、请求数、文本数与平均每批请求数
+        """
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "texts": self.texts,
+            "avg_requests_per_batch": self.requests / self.batches if self.batches else 0.0,
+        }
@@ -1,11 +1,16 @@
 """
 记忆向量化模块 - 负责将记忆转换为向量并保存
+
+faiss 与 sentence_transformers 在首次创建索引、加载模型时才导入，导入本模块不会加载它们
 """
 import os
+import threading
 import numpy as np
-import faiss
 import pickle
-from sentence_transformers import SentenceTransformer
+from collections import Counter, OrderedDict
+from .batcher import EmbeddingBatcher
+from observability.metrics import get_registry
+from observability.tracing import span
 
 class MemoryEmbedder:
     def __init__(self, config):
@@ -20,48 +25,209 @@ class MemoryEmbedder:
         self.vectors_file = config.VECTORS_FILE
         self.texts_file = config.TEXTS_FILE
         self.index_file = config.INDEX_FILE
+        self.namespaces_file = getattr(config, 'NAMESPACES_FILE',
+                                       os.path.splitext(self.texts_file)[0] + "_namespaces.pkl")
         
         self.model = None
+        self.batcher = None
         self.texts = []
+        # 与 texts 一一对应的命名空间（多会话服务中为会话ID），None 表示公共记忆
+        self.namespaces = []
+        self._namespace_sizes = Counter()
         self.index = None
+        # 保护索引与文本列表，检索和写入可能来自不同线程
+        self.lock = threading.RLock()
+        
+        # 查询向量的LRU缓存（重复的问题不再编码）
+        self.query_cache_size = getattr(config, 'EMBEDDING_QUERY_CACHE_SIZE', 1024)
+        self._query_cache = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        
+        self.registry = get_registry()
         
         # 创建数据目录
         os.makedirs(os.path.dirname(self.vectors_file), exist_ok=True)
         
+    def size(self):
+        """索引中的记忆数，索引尚未加载时为 0（持有者以此注册 vector_index_size 仪表）"""
+        index = self.index
+        return index.ntotal if index is not None else 0
+    
     def load_model(self):
-        """加载嵌入模型"""
+        """加载嵌入模型，配置了编码服务时改用服务而不在本进程加载"""
         if not self.model:
+            from .embedding_service import RemoteEncoder
+            remote = RemoteEncoder.from_config(self.config)
+            if remote is not None:
+                self.model = remote
+                print(f"使用向量编码服务: {', '.join(map(str, remote.addresses))}")
+                return
+            # 导入 sentence_transformers 会连带加载 torch，推迟到真正需要模型时
+            from sentence_transformers import SentenceTransformer
             print("正在加载嵌入模型...")
             self.model = SentenceTransformer(self.model_name)
             print(f"嵌入模型 '{self.model_name}' 加载完成！")
     
+    def enable_batching(self, max_batch_size=32, max_wait=0.005):
+        """
+        开启编码批处理，多个会话共享同一个 MemoryEmbedder 时合并并发的编码请求
+        
+        Args:
+            max_batch_size (int): 单次模型调用的最大文本数
+            max_wait (float): 收集一个批次的最长等待秒数
+        """
+        self.load_model()
+        if self.batcher is None:
+            self.batcher = EmbeddingBatcher(self.model, max_batch_size, max_wait)
+        return self.batcher
+    
+    def encode(self, texts, normalize_embeddings=True):
+        """
+        编码文本（开启批处理时经由批处理线程）
+        
+        Args:
+            texts (list): 文本列表
+            normalize_embeddings (bool): 是否归一化
+            
+        Returns:
+            numpy.ndarray: float32 向量矩阵
+        """
+        encoder = self.batcher or self.model
+        # 已是 float32 时不复制（编码服务返回的是共享内存视图）
+        return np.asarray(encoder.encode(texts, normalize_embeddings=normalize_embeddings), dtype='float32')
+    
+    def encode_query(self, text):
+        """
+        编码检索查询，结果按文本缓存，命中情况计入 embedding_cache_requests_total{result}
+        
+        Args:
+            text (str): 查询文本
+            
+        Returns:
+            numpy.ndarray: 形状为 (1, 维度) 的 float32 向量
+        """
+        if not self.query_cache_size:
+            return self.encode([text])
+        with self._query_cache_lock:
+            vector = self._query_cache.get(text)
+            if vector is not None:
+                self._query_cache.move_to_end(text)
+        self.registry.inc("embedding_cache_requests_total", result="hit" if vector is not None else "miss")
+        if vector is not None:
+            return vector
+        
+        # 复制一份再缓存，编码服务返回的共享内存视图不能长期持有
+        vector = np.array(self.encode([text]))
+        with self._query_cache_lock:
+            self._query_cache[text] = vector
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+    
     def load_or_create_index(self):
         """加载或创建向量索引"""
         # 加载模型
         self.load_model()
         
         # 尝试加载现有索引和文本
+        import faiss
         try:
             self.index = faiss.read_index(self.index_file)
             with open(self.texts_file, 'rb') as f:
                 self.texts = pickle.load(f)
+            self._load_namespaces()
+            self._apply_search_params()
             print(f"已加载向量索引，包含 {self.index.ntotal} 条记忆")
             return True
         except (FileNotFoundError, Exception) as e:
             print(f"未找到现有索引或加载失败: {e}")
             # 创建新的索引
             dim = self.model.get_sentence_embedding_dimension()
-            self.index = faiss.IndexFlatIP(dim)
+            self.index = self.create_index(dim)
             self.texts = []
+            self._load_namespaces()
             print(f"已创建新的向量索引，维度: {dim}")
             return False
     
-    def add_memories(self, memories):
+    def _load_namespaces(self):
+        """读取每条记忆的命名空间，旧版本保存的索引没有该文件，已有记忆都视为公共记忆"""
+        try:
+            with open(self.namespaces_file, 'rb') as f:
+                namespaces = pickle.load(f)
+        except FileNotFoundError:
+            namespaces = []
+        self.namespaces = (namespaces + [None] * len(self.texts))[:len(self.texts)]
+        self._namespace_sizes = Counter(self.namespaces)
+    
+    def namespace_size(self, namespace):
+        """
+        命名空间中的记忆数
+        
+        Args:
+            namespace (str): 命名空间
+            
+        Returns:
+            int: 记忆数
+        """
+        return self._namespace_sizes[namespace]
+    
+    def create_index(self, dim):
+        """
+        按 VECTOR_INDEX_FACTORY 创建内积索引
+        
+        Args:
+            dim (int): 向量维度
+            
+        Returns:
+            faiss.Index: 空索引，IVF 等需要训练的类型在首次添加记忆时训练
+        """
+        import faiss
+        factory = getattr(self.config, 'VECTOR_INDEX_FACTORY', 'Flat')
+        if factory == 'Flat':
+            index = faiss.IndexFlatIP(dim)
+        else:
+            index = faiss.index_factory(dim, factory, faiss.METRIC_INNER_PRODUCT)
+        self.index = index
+        self._apply_search_params()
+        return index
+    
+    def _apply_search_params(self):
+        """应用 VECTOR_INDEX_SEARCH_PARAMS（如 "nprobe=16"、"efSearch=64"）"""
+        params = getattr(self.config, 'VECTOR_INDEX_SEARCH_PARAMS', None)
+        if params:
+            import faiss
+            faiss.ParameterSpace().set_index_parameters(self.index, params)
+    
+    def training_size(self):
+        """
+        索引尚未训练时，首批写入至少需要的向量数
+        
+        Returns:
+            int: IVF 索引为 nlist，其他需要训练的索引为 1，已训练时为 0
+        """
+        if self.index.is_trained:
+            return 0
+        import faiss
+        ivf = faiss.try_extract_index_ivf(self.index)
+        return ivf.nlist if ivf is not None else 1
+    
+    def _ensure_trained(self, vectors):
+        """需要训练的索引（IVF、PQ 等）用第一批向量训练"""
+        nlist = self.training_size()
+        if not nlist:
+            return
+        if len(vectors) < nlist:
+            raise ValueError(f"索引需要训练：至少需要 {nlist} 条记忆，本批只有 {len(vectors)} 条（可先用 Flat 索引积累记忆）")
+        self.index.train(vectors)
+    
+    def add_memories(self, memories, save=True, namespace=None):
         """
         添加新的记忆到向量存储
         
         Args:
             memories: 记忆列表，每个记忆应有 content 属性
+            save (bool): 是否立即保存索引和文本；批量导入时可设为 False，全部添加后调用 save()
+            namespace (str, optional): 记忆所属的命名空间，检索时按命名空间隔离；默认为公共记忆
         """
         if not memories:
             return
@@ -75,20 +241,35 @@ class MemoryEmbedder:
                         for memory in memories]
         
         # 向量化
-        vectors = self.model.encode(memory_texts, normalize_embeddings=True)
-        vectors = vectors.astype('float32')
-        
-        # 添加到索引
-        self.index.add(vectors)
-        self.texts.extend(memory_texts)
+        with span("embedding.encode", count=len(memory_texts)):
+            vectors = self.encode(memory_texts)
         
-        # 保存更新后的索引和文本
-        self._save_index()
+        with self.lock:
+            # 添加到索引
+            with span("embedding.insert", count=len(memory_texts)):
+                self._ensure_trained(vectors)
+                self.index.add(vectors)
+                self.texts.extend(memory_texts)
+                self.namespaces.extend([namespace] * len(memory_texts))
+                self._namespace_sizes[namespace] += len(memory_texts)
+            
+            # 保存更新后的索引和文本
+            if save:
+                self._save_index()
         
         print(f"已添加 {len(memories)} 条新记忆到向量存储，总计 {self.index.ntotal} 条")
     
+    def save(self):
+        """保存索引和文本到文件"""
+        with self.lock:
+            self._save_index()
+    
     def _save_index(self):
         """保存索引和文本到文件"""
-        faiss.write_index(self.index, self.index_file)
-        with open(self.texts_file, 'wb') as f:
-            pickle.dump(self.texts, f)
\ No newline at end of file
+        import faiss
+        with span("index.save", ntotal=self.index.ntotal):
+            faiss.write_index(self.index, self.index_file)
+            with open(self.texts_file, 'wb') as f:
+                pickle.dump(self.texts, f)
+            with open(self.namespaces_file, 'wb') as f:
+                pickle.dump(self.namespaces, f)
\ No newline at end of file
@@ -0,0 +1,435 @@
+"""
+独立的向量编码服务 - 嵌入模型只在服务进程中加载一份，其他进程经本地连接请求编码
+
+请求通过 multiprocessing.connection 发送，向量结果由服务进程直接写入客户端
+预先分配的共享内存（multiprocessing.shared_memory），客户端拿到的数组就是
+共享内存上的视图，不经过序列化和复制。
+
+用法:
+    python -m vector.embedding_service --address 127.0.0.1:6010
+
+然后将 config.EMBEDDING_SERVICE_ADDRESSES 设为 ["127.0.0.1:6010"]，MemoryEmbedder
+就会改用服务编码而不在本进程加载模型。
+
+连接上传输的是 pickle 数据，认证密钥是唯一的保护：服务与客户端必须配置同一个
+密钥（EMBEDDING_SERVICE_AUTHKEY 或环境变量 MEM4_EMBEDDING_AUTHKEY），没有密钥时
+拒绝启动。共享内存只能在本机使用，因此服务只监听回环地址或 Unix 套接字；每个连接
+由服务分配随机的共享内存名前缀，服务只写入名称带该前缀的共享内存。
+"""
+import os
+import queue
+import socket
+import weakref
+import secrets
+import argparse
+import ipaddress
+import threading
+import itertools
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Client, Listener
+
+AUTHKEY_ENV = "MEM4_EMBEDDING_AUTHKEY"
+MIN_AUTHKEY_BYTES = 16
+# 早期版本的默认密钥，已公开在源码中，不能再使用
+_PUBLIC_AUTHKEYS = {b"mem4-embedding"}
+_DTYPE = np.dtype("float32")
+_MIN_BUFFER_BYTES = 64 * 1024
+
+
+class EmbeddingServiceError(Exception):
+    """编码服务返回错误"""
+
+
+def parse_address(address):
+    """
+    解析服务地址
+
+    Args:
+        address (str or tuple): "host:port"、(host, port) 或 Unix 套接字路径
+
+    Returns:
+        tuple or str: multiprocessing.connection 可用的地址
+    """
+    if isinstance(address, (tuple, list)):
+        return tuple(address)
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit():
+        return host or "127.0.0.1", int(port)
+    return address
+
+
+def resolve_authkey(config=None):
+    """
+    读取连接认证密钥：配置项 EMBEDDING_SERVICE_AUTHKEY，其次为环境变量 MEM4_EMBEDDING_AUTHKEY
+
+    Returns:
+        bytes or None: 密钥，都未设置时为 None
+    """
+    key = getattr(config, 'EMBEDDING_SERVICE_AUTHKEY', None) or os.environ.get(AUTHKEY_ENV)
+    if isinstance(key, str):
+        key = key.encode("utf-8")
+    return key or None
+
+
+def _check_authkey(authkey):
+    """密钥缺失、过短或为已公开的旧默认值时抛出 EmbeddingServiceError"""
+    if not authkey:
+        raise EmbeddingServiceError(
+            f"未配置编码服务的认证密钥：请设置 EMBEDDING_SERVICE_AUTHKEY 或环境变量 {AUTHKEY_ENV}"
+            f"（例如 python -c \"import secrets; print(secrets.token_hex(32))\" 生成）")
+    if authkey in _PUBLIC_AUTHKEYS:
+        raise EmbeddingServiceError("编码服务的认证密钥仍是源码中公开的旧默认值，请更换为随机密钥")
+    if len(authkey) < MIN_AUTHKEY_BYTES:
+        raise EmbeddingServiceError(f"编码服务的认证密钥过短，至少需要 {MIN_AUTHKEY_BYTES} 字节")
+
+
+def _check_local(address):
+    """只允许回环地址或 Unix 套接字：共享内存无法跨机器，监听其他地址只会扩大暴露面"""
+    if not isinstance(address, tuple):
+        return
+    host = address[0]
+    try:
+        loopback = ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        try:
+            loopback = ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+        except (OSError, ValueError):
+            loopback = False
+    if not loopback:
+        raise EmbeddingServiceError(f"编码服务只能监听本机回环地址或 Unix 套接字，拒绝监听 {host}")
+
+
+def _attach(name, untrack):
+    """
+    附加到客户端创建的共享内存
+
+    共享内存由客户端创建和释放；附加时 Python 3.12 及以前会把它登记到本进程的
+    资源跟踪器，独立运行的服务退出时会误删客户端的共享内存，因此撤销登记。
+    由 start_service 启动的服务与客户端共用同一个资源跟踪器，不能撤销。
+    """
+    shm = shared_memory.SharedMemory(name=name)
+    if untrack:
+        try:
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+    return shm
+
+
+def _handle_connection(conn, encoder, dimension, untrack):
+    """服务进程中处理一个客户端连接上的所有请求"""
+    attached = {}
+    # 本连接可写入的共享内存名前缀，客户端按它命名自己创建的缓冲区
+    prefix = f"m4e_{secrets.token_hex(6)}_"
+    try:
+        conn.send(("hello", prefix))
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                break
+            try:
+                if request[0] == "dimension":
+                    conn.send(("ok", dimension))
+                elif request[0] == "encode":
+                    _, texts, normalize, shm_name = request
+                    if not isinstance(shm_name, str) or not shm_name.startswith(prefix):
+                        raise ValueError("拒绝写入不属于本连接的共享内存")
+                    vectors = np.asarray(encoder.encode(texts, normalize_embeddings=normalize), dtype=_DTYPE)
+                    shm = attached.get(shm_name)
+                    if shm is None:
+                        shm = attached[shm_name] = _attach(shm_name, untrack)
+                    if vectors.nbytes > shm.size:
+                        raise ValueError(f"共享内存不足: 需要 {vectors.nbytes} 字节，只有 {shm.size} 字节")
+                    np.ndarray(vectors.shape, dtype=_DTYPE, buffer=shm.buf)[...] = vectors
+                    conn.send(("ok", vectors.shape))
+                else:
+                    conn.send(("error", f"未知请求: {request[0]}"))
+            except Exception as e:
+                conn.send(("error", str(e)))
+    finally:
+        for shm in attached.values():
+            shm.close()
+        conn.close()
+
+
+def serve(model_name, address, authkey, max_batch_size=32, max_wait=0.005, ready=None,
+          untrack=True):
+    """
+    运行编码服务（阻塞）
+
+    每个客户端连接一个线程，所有连接的请求经 EmbeddingBatcher 合并后调用模型。
+
+    Args:
+        model_name (str): 嵌入模型名称
+        address: 监听地址，见 parse_address，只能是回环地址或 Unix 套接字
+        authkey (bytes): 连接认证密钥，至少 16 字节
+        max_batch_size (int): 单次模型调用的最大文本数
+        max_wait (float): 收集一个批次的最长等待秒数
+        ready (multiprocessing.Event, optional): 模型加载完成、开始监听后置位
+        untrack (bool): 是否把附加的共享内存从本进程的资源跟踪器中撤销登记，见 _attach
+
+    Raises:
+        EmbeddingServiceError: 密钥不合格或监听地址不是本机
+    """
+    address = parse_address(address)
+    _check_authkey(authkey)
+    _check_local(address)
+
+    from sentence_transformers import SentenceTransformer
+    from .batcher import EmbeddingBatcher
+
+    print(f"正在加载嵌入模型 '{model_name}'...")
+    model = SentenceTransformer(model_name)
+    encoder = EmbeddingBatcher(model, max_batch_size, max_wait)
+    dimension = model.get_sentence_embedding_dimension()
+
+    with Listener(address, backlog=128, authkey=authkey) as listener:
+        print(f"🧮 向量编码服务已启动: {listener.address}（pid {os.getpid()}）")
+        if ready is not None:
+            ready.set()
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                print(f"❗ 接受连接失败: {e!r}")
+                continue
+            threading.Thread(target=_handle_connection, args=(conn, encoder, dimension, untrack), daemon=True).start()
+
+
+def start_service(model_name, address, authkey=None, max_batch_size=32, max_wait=0.005, timeout=300):
+    """
+    在子进程中启动编码服务，等待模型加载完成后返回
+
+    Args:
+        authkey (bytes, optional): 连接认证密钥，默认随机生成
+
+    Returns:
+        multiprocessing.Process: 服务进程，密钥保存在其 authkey 属性上，供 RemoteEncoder 使用
+    """
+    import multiprocessing
+
+    if authkey is None:
+        authkey = secrets.token_bytes(32)
+    _check_authkey(authkey)
+    _check_local(parse_address(address))
+
+    context = multiprocessing.get_context("spawn")
+    ready = context.Event()
+    process = context.Process(
+        target=serve,
+        args=(model_name, address, authkey, max_batch_size, max_wait, ready, False),
+        name="embedding-service",
+        daemon=True,
+    )
+    process.start()
+    if not ready.wait(timeout):
+        process.terminate()
+        raise EmbeddingServiceError(f"编码服务在 {timeout} 秒内未就绪")
+    process.authkey = authkey
+    return process
+
+
+class _SharedBuffers:
+    """客户端持有的共享内存缓冲区，按2的幂分级复用，名称带服务为连接分配的前缀"""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._names = itertools.count()
+        self._free = {}
+        self._all = []
+        self._lock = threading.Lock()
+
+    def acquire(self, nbytes):
+        size = max(_MIN_BUFFER_BYTES, 1 << max(0, nbytes - 1).bit_length())
+        with self._lock:
+            free = self._free.get(size)
+            if free:
+                return free.pop()
+        shm = shared_memory.SharedMemory(name=f"{self.prefix}{next(self._names)}", create=True, size=size)
+        with self._lock:
+            self._all.append(shm)
+        return shm
+
+    def release(self, shm):
+        with self._lock:
+            self._free.setdefault(shm.size, []).append(shm)
+
+    def close(self):
+        with self._lock:
+            buffers, self._all, self._free = self._all, [], {}
+        for shm in buffers:
+            try:
+                shm.close()
+            except BufferError:
+                # 仍有数组引用该缓冲区，只删除名称，映射随进程退出释放
+                pass
+            shm.unlink()
+
+
+class _Connection:
+    """到编码服务的一个连接及其专属的共享内存缓冲区"""
+
+    def __init__(self, address, authkey):
+        self.conn = Client(address, authkey=authkey)
+        try:
+            kind, prefix = self.conn.recv()
+        except Exception:
+            self.conn.close()
+            raise
+        if kind != "hello":
+            self.conn.close()
+            raise EmbeddingServiceError(f"编码服务握手失败: {kind}")
+        self.buffers = _SharedBuffers(prefix)
+
+    def request(self, message):
+        self.conn.send(message)
+        return self.conn.recv()
+
+    def close(self):
+        self.conn.close()
+        self.buffers.close()
+
+
+class RemoteEncoder:
+    """
+    编码服务的客户端，用法与 SentenceTransformer 一致（encode、get_sentence_embedding_dimension）
+
+    encode() 返回的数组是共享内存上的视图，数组（及其切片）被回收后缓冲区才会
+    被同一连接的下一次请求复用。每个服务地址维护一组连接，可被多个线程同时使用；
+    配置多个地址时按轮询分配请求。
+    """
+
+    def __init__(self, addresses, authkey):
+        """
+        Args:
+            addresses (list): 服务地址列表，见 parse_address
+            authkey (bytes): 连接认证密钥，与服务端一致
+        """
+        if isinstance(addresses, (str, tuple)):
+            addresses = [addresses]
+        self.addresses = [parse_address(address) for address in addresses]
+        self.authkey = authkey
+        self._idle = {address: queue.LifoQueue() for address in self.addresses}
+        self._next = itertools.cycle(self.addresses)
+        self._connections = []
+        self._lock = threading.Lock()
+        self._dimension = None
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        根据配置对象创建，未配置 EMBEDDING_SERVICE_ADDRESSES 时返回 None
+
+        Raises:
+            EmbeddingServiceError: 配置了服务地址但没有认证密钥
+        """
+        addresses = getattr(config, 'EMBEDDING_SERVICE_ADDRESSES', None)
+        if not addresses:
+            return None
+        authkey = resolve_authkey(config)
+        _check_authkey(authkey)
+        return cls(addresses, authkey)
+
+    def _borrow(self):
+        address = next(self._next)
+        try:
+            return address, self._idle[address].get_nowait()
+        except queue.Empty:
+            connection = _Connection(address, self.authkey)
+            with self._lock:
+                self._connections.append(connection)
+            return address, connection
+
+    def _request(self, message, connection=None):
+        """借用一个连接发送请求，出错的连接直接丢弃"""
+        address, connection = self._borrow() if connection is None else connection
+        try:
+            reply = connection.request(message)
+        except Exception:
+            self._discard(connection)
+            raise
+        self._idle[address].put(connection)
+        if reply[0] != "ok":
+            raise EmbeddingServiceError(reply[1])
+        return reply[1]
+
+    def _discard(self, connection):
+        with self._lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+        connection.close()
+
+    def get_sentence_embedding_dimension(self):
+        if self._dimension is None:
+            self._dimension = self._request(("dimension",))
+        return self._dimension
+
+    def encode(self, texts, normalize_embeddings=False, **kwargs):
+        """
+        请求服务编码文本
+
+        Args:
+            texts (list or str): 文本列表
+            normalize_embeddings (bool): 是否归一化
+
+        Returns:
+            numpy.ndarray: float32 向量矩阵（共享内存视图），单个字符串输入时为一维向量
+        """
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        dimension = self.get_sentence_embedding_dimension()
+        if not texts:
+            return np.zeros((0, dimension), dtype=_DTYPE)
+
+        address, connection = self._borrow()
+        buffers = connection.buffers
+        shm = buffers.acquire(len(texts) * dimension * _DTYPE.itemsize)
+        try:
+            shape = self._request(("encode", texts, normalize_embeddings, shm.name), (address, connection))
+        except Exception:
+            buffers.release(shm)
+            raise
+        vectors = np.ndarray(tuple(shape), dtype=_DTYPE, buffer=shm.buf)
+        # 数组的切片以它为 base，数组被回收时所有视图都已不可用，可以复用缓冲区
+        weakref.finalize(vectors, buffers.release, shm)
+        return vectors[0] if single else vectors
+
+    def close(self):
+        """关闭连接并释放共享内存"""
+        for idle in self._idle.values():
+            while True:
+                try:
+                    idle.get_nowait()
+                except queue.Empty:
+                    break
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+
+
+def main():
+    import config
+
+    parser = argparse.ArgumentParser(description="独立的向量编码服务")
+    addresses = getattr(config, 'EMBEDDING_SERVICE_ADDRESSES', None) or ["127.0.0.1:6010"]
+    parser.add_argument("--address", default=addresses[0], help="监听地址（host:port 或 Unix 套接字路径）")
+    parser.add_argument("--model", default=config.EMBEDDING_MODEL, help="嵌入模型名称")
+    parser.add_argument("--batch-size", type=int, default=getattr(config, 'EMBEDDING_BATCH_SIZE', 32),
+                        help="单次模型调用的最大文本数")
+    parser.add_argument("--batch-wait", type=float, default=getattr(config, 'EMBEDDING_BATCH_WAIT', 0.005),
+                        help="收集一个批次的最长等待秒数")
+    args = parser.parse_args()
+
+    try:
+        serve(args.model, args.address, resolve_authkey(config), args.batch_size, args.batch_wait)
+    except EmbeddingServiceError as e:
+        print(f"❌ {e}")
+    except KeyboardInterrupt:
+        print("再见！")
+
+
+if __name__ == "__main__":
+    main()
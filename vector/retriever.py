@@ -1,8 +1,8 @@
 """
 记忆检索模块 - 负责从向量存储中检索相关记忆
 """
-import faiss
 import pickle
+from observability.tracing import span
 
 class MemoryRetriever:
     def __init__(self, embedder):
@@ -14,13 +14,15 @@ class MemoryRetriever:
         """
         self.embedder = embedder
     
-    def search(self, query, top_k=3):
+    def search(self, query, top_k=3, namespace=None):
         """
         搜索相关记忆
         
         Args:
             query (str): 查询文本
             top_k (int): 返回结果数量
+            namespace (str, optional): 只返回该命名空间的记忆（见 MemoryEmbedder.add_memories），
+                默认不过滤
             
         Returns:
             list: 检索到的记忆文本列表
@@ -29,20 +31,37 @@ class MemoryRetriever:
         # 确保模型和索引已加载
         if not self.embedder.index or self.embedder.index.ntotal == 0:
             return [], []
+        if namespace is not None and not self.embedder.namespace_size(namespace):
+            return [], []
             
         # 向量化查询
-        query_vec = self.embedder.model.encode([query], normalize_embeddings=True).astype('float32')
-        
-        # 执行检索
-        scores, indices = self.embedder.index.search(query_vec, min(top_k, self.embedder.index.ntotal))
+        with span("retrieval.encode"):
+            query_vec = self.embedder.encode_query(query)
         
-        # 获取文本结果
-        results = []
-        for idx in indices[0]:
-            if idx >= 0 and idx < len(self.embedder.texts):  # 检查索引有效性
-                results.append(self.embedder.texts[idx])
+        with self.embedder.lock, span("retrieval.search", k=top_k, ntotal=self.embedder.index.ntotal):
+            ntotal = self.embedder.index.ntotal
+            k = min(top_k, ntotal)
+            while True:
+                # 执行检索
+                scores, indices = self.embedder.index.search(query_vec, k)
+                
+                # 获取文本结果
+                results, kept = [], []
+                for idx, score in zip(indices[0], scores[0]):
+                    if idx < 0 or idx >= len(self.embedder.texts):  # 检查索引有效性
+                        continue
+                    if namespace is not None and self.embedder.namespaces[idx] != namespace:
+                        continue
+                    results.append(self.embedder.texts[idx])
+                    kept.append(float(score))
+                    if len(results) == top_k:
+                        break
+                # 按命名空间过滤后不足 top_k 条时扩大检索范围
+                if namespace is None or len(results) == top_k or k >= ntotal:
+                    break
+                k = min(k * 4, ntotal)
         
-        return results, scores[0].tolist()
+        return results, kept
     
     def format_search_results(self, query, results, scores, prefix="根据您的记忆，我知道：\n"):
         """